@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""Benchmark the HTTP/1.1 and HTTP/2 transports of shipitscript against a
+local Ship-it stand-in served by hypercorn over TLS (ALPN h2 + http/1.1)
+
+Requires shipitscript to be installed (`pip install -e .`), hypercorn and httpx[http2]
+
+    python benchmarks/http2_transport.py --requests 200 --concurrency 20 --latency 0.05
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import datetime
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import shipitapi
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+from shipitscript import http2
+from shipitscript.transport import configure_api
+
+
+RELEASE = {
+    'name': 'Firefox-99.0b1-build1',
+    'status': 'shipped',
+    'shippedAt': '2018-07-03T09:19:00+00:00',
+    'l10nChangesets': {'locale{}'.format(i): 'default' for i in range(100)},
+}
+
+
+def write_self_signed_certificate(directory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, 'localhost')])
+    now = datetime.datetime.utcnow()
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName('localhost')]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, 'cert.pem')
+    key_path = os.path.join(directory, 'key.pem')
+    with open(cert_path, 'wb') as f:
+        f.write(certificate.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+
+    return cert_path, key_path
+
+
+class ShipItStandIn(object):
+    """ASGI app answering getRelease calls after a fixed latency, counting the
+    connections it sees"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.connections = set()
+        self.http_versions = set()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return
+        self.connections.add(tuple(scope['client']))
+        self.http_versions.add(scope['http_version'])
+        await asyncio.sleep(self.latency)
+        body = json.dumps(RELEASE).encode('utf-8')
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': body})
+
+
+def start_server(app, cert_path, key_path):
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+
+    config = Config()
+    config.bind = ['127.0.0.1:{}'.format(port)]
+    config.certfile = cert_path
+    config.keyfile = key_path
+    config.accesslog = None
+    config.errorlog = None
+
+    loop = asyncio.new_event_loop()
+    shutdown = asyncio.Event()
+    thread = threading.Thread(target=loop.run_until_complete, args=(serve(app, config, shutdown_trigger=shutdown.wait),), daemon=True)
+    thread.start()
+    time.sleep(1)
+
+    return 'https://localhost:{}'.format(port), lambda: loop.call_soon_threadsafe(shutdown.set)
+
+
+def run(api_root, cert_path, use_http2, requests_count, concurrency):
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root=api_root, ca_certs=cert_path, timeout=10)
+    configure_api(release_api, {'http2': use_http2})
+
+    latencies = []
+
+    def get_release():
+        start = time.monotonic()
+        release_api.getRelease(RELEASE['name'])
+        latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(get_release) for _ in range(requests_count)]:
+            future.result()
+    elapsed = time.monotonic() - start
+    http2.close_clients()
+
+    latencies.sort()
+    return elapsed, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.05, help='server-side latency, in seconds')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        cert_path, key_path = write_self_signed_certificate(temp_dir)
+        print('{:<10} {:>10} {:>10} {:>10} {:>10} {:>12}'.format('transport', 'wall (s)', 'req/s', 'p50 (ms)', 'p99 (ms)', 'connections'))
+        for use_http2 in (False, True):
+            app = ShipItStandIn(args.latency)
+            api_root, stop_server = start_server(app, cert_path, key_path)
+            try:
+                elapsed, p50, p99 = run(api_root, cert_path, use_http2, args.requests, args.concurrency)
+            finally:
+                stop_server()
+            print('{:<10} {:>10.2f} {:>10.1f} {:>10.1f} {:>10.1f} {:>12}'.format(
+                '/'.join(sorted(app.http_versions)), elapsed, args.requests / elapsed, p50 * 1000, p99 * 1000, len(app.connections),
+            ))
+
+
+__name__ == '__main__' and main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Benchmark the JSON backends of shipitscript.jsonutils on realistic
+mark-as-started data: a task definition and the release record Ship-it
+returns, both carrying the full l10n changesets of a Firefox release
+
+Requires shipitscript to be installed (`pip install -e .`) and, to compare
+against it, orjson
+
+    python benchmarks/json_backends.py --locales 120 --iterations 2000
+"""
+import argparse
+import timeit
+
+from shipitscript import jsonutils
+
+
+def make_task(locales):
+    l10n_changesets = ''.join('locale{} {:040x}\n'.format(i, i) for i in range(locales))
+    return {
+        'provisionerId': 'scriptworker-prov-v1',
+        'workerType': 'shipit-v1',
+        'taskGroupId': 'IKw4rShNS4CUJ2X0mx2zOg',
+        'dependencies': ['LeSCxQ8ZRa2TZjJu-K7Gmw'],
+        'scopes': ['project:releng:ship-it:server:production', 'project:releng:ship-it:action:mark-as-started'],
+        'payload': {
+            'release_name': 'Firefox-99.0b1-build1',
+            'product': 'firefox',
+            'version': '99.0b1',
+            'build_number': 1,
+            'branch': 'releases/mozilla-beta',
+            'revision': 'a' * 40,
+            'l10n_changesets': l10n_changesets,
+            'partials': ','.join('98.0b{}build1'.format(i) for i in range(1, 15)),
+        },
+    }
+
+
+def make_release_info(locales):
+    return {
+        'name': 'Firefox-99.0b1-build1',
+        'product': 'firefox',
+        'version': '99.0b1',
+        'buildNumber': 1,
+        'branch': 'releases/mozilla-beta',
+        'mozillaRevision': 'a' * 40,
+        'l10nChangesets': {'locale{}'.format(i): '{:040x}'.format(i) for i in range(locales)},
+        'partials': ','.join('98.0b{}build1'.format(i) for i in range(1, 15)),
+        'submittedAt': '2018-07-02T09:18:39+00:00',
+        'shippedAt': None,
+        'status': 'Started',
+        'ready': True,
+        'complete': True,
+    }
+
+
+def bench(name, obj, iterations):
+    encoded = jsonutils.dumps(obj)
+    for operation, statement in (('dumps', lambda: jsonutils.dumps(obj)), ('loads', lambda: jsonutils.loads(encoded))):
+        seconds = min(timeit.repeat(statement, number=iterations, repeat=3)) / iterations
+        print('{:<8} {:<14} {:<6} {:>8} bytes {:>10.1f} us/op'.format(
+            jsonutils.get_backend_name(), name, operation, len(encoded), seconds * 1e6,
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--locales', type=int, default=120)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    data = {
+        'task': make_task(args.locales),
+        'release-record': make_release_info(args.locales),
+    }
+    orjson = jsonutils.orjson
+    backends = [None, orjson] if orjson is not None else [None]
+    for backend in backends:
+        jsonutils.orjson = backend
+        for name, obj in data.items():
+            bench(name, obj, args.iterations)
+
+
+__name__ == '__main__' and main()
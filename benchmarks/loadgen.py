@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""Find how many concurrent shipitscript workers a Ship-it instance handles
+
+Each step of the ramp starts as many worker processes as its concurrency
+level. Every worker runs the real `shipitscript.script.main` in a loop, a
+mark-as-started task followed by a mark-as-shipped one for a new release,
+against a local Ship-it stand-in modeling server-side contention: `capacity`
+application workers, each request holding one `service_time` seconds, and
+503s once more than `backlog` requests are waiting.
+
+Requires shipitscript to be installed (`pip install -e .`)
+
+    python benchmarks/loadgen.py --ramp 1,2,4,8,16,32 --duration 20 --capacity 4 --service-time 0.05
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import queue
+import tempfile
+import time
+
+from shipitscript import http2, jsonutils
+from shipitscript.script import main as shipitscript_main
+from shipitscript.test.fakeshipit import FakeShipIt
+from shipitscript.transport import clear_pools
+
+
+project_dir = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+data_dir = os.path.join(project_dir, 'shipitscript', 'data')
+
+SERVER_SCOPE = 'project:releng:ship-it:server:loadtest'
+
+
+def make_config(work_dir, api_root, instance_config):
+    ship_it_instance_config = {
+        'api_root': api_root,
+        'timeout_in_seconds': 30,
+        'username': 'some-username',
+        'password': 'some-password',
+    }
+    ship_it_instance_config.update(instance_config)
+    return {
+        'work_dir': work_dir,
+        'artifact_dir': os.path.join(work_dir, 'artifacts'),
+        'mark_as_shipped_schema_file': os.path.join(data_dir, 'mark_as_shipped_task_schema.json'),
+        'mark_as_started_schema_file': os.path.join(data_dir, 'mark_as_started_task_schema.json'),
+        'ship_it_instances': {SERVER_SCOPE: ship_it_instance_config},
+        'taskcluster_scope_prefix': 'project:releng:ship-it:',
+        'verbose': False,
+    }
+
+
+def make_task(action, payload):
+    return {
+        'provisionerId': 'some-provisioner-id',
+        'workerType': 'some-worker-type',
+        'taskGroupId': 'IKw4rShNS4CUJ2X0mx2zOg',
+        'dependencies': ['aRandomTaskId1'],
+        'scopes': [SERVER_SCOPE, 'project:releng:ship-it:action:{}'.format(action)],
+        'payload': payload,
+    }
+
+
+def make_tasks(version, locales):
+    release_name = 'Firefox-{}-build1'.format(version)
+    mark_as_started = make_task('mark-as-started', {
+        'release_name': release_name,
+        'product': 'firefox',
+        'version': version,
+        'build_number': 1,
+        'branch': 'releases/mozilla-beta',
+        'revision': 'a' * 40,
+        'l10n_changesets': ''.join('locale{} {:040x}\n'.format(i, i % 3) for i in range(locales)),
+        'partials': ','.join('98.0b{}build1'.format(i) for i in range(1, 15)),
+    })
+    mark_as_shipped = make_task('mark-as-shipped', {'release_name': release_name})
+    return [('mark-as-started', mark_as_started), ('mark-as-shipped', mark_as_shipped)]
+
+
+def run_task(work_dir, config, task):
+    jsonutils.dump(config, os.path.join(work_dir, 'config.json'))
+    jsonutils.dump(task, os.path.join(work_dir, 'task.json'))
+    # every task runs in a new process in production, don't reuse connections
+    clear_pools()
+    http2.close_clients()
+    try:
+        shipitscript_main(config_path=os.path.join(work_dir, 'config.json'))
+    except SystemExit as e:
+        return not e.code
+    except Exception:
+        return False
+    return True
+
+
+def worker(worker_id, step, api_root, options, ready, start, results):
+    """Entry point of a worker process. Reports `(action, seconds, ok)`
+    for every task finished in the step"""
+    logging.basicConfig(level=logging.DEBUG if options['verbose'] else logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as work_dir:
+        config = make_config(work_dir, api_root, options['instance_config'])
+        ready.put(worker_id)
+        start.wait()
+        deadline = time.monotonic() + options['duration']
+        iteration = 0
+        while time.monotonic() < deadline:
+            version = '99.0b{}.{}.{}'.format(step, worker_id, iteration)
+            for action, task in make_tasks(version, options['locales']):
+                task_start = time.monotonic()
+                ok = run_task(work_dir, config, task)
+                results.put((action, time.monotonic() - task_start, ok))
+                if not ok:
+                    # no point in shipping a release that didn't start
+                    break
+            iteration += 1
+    results.put(None)
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_step(step, concurrency, fake_shipit, options):
+    context = multiprocessing.get_context('spawn')
+    ready, start, results = context.Queue(), context.Event(), context.Queue()
+    processes = [
+        context.Process(target=worker, args=(worker_id, step, fake_shipit.api_root, options, ready, start, results))
+        for worker_id in range(concurrency)
+    ]
+    for process in processes:
+        process.start()
+    for _ in processes:
+        ready.get(timeout=60)
+
+    requests_before = len(fake_shipit.requests)
+    responses_before = fake_shipit.responses.copy()
+    fake_shipit.peak_waiting = 0
+    step_start = time.monotonic()
+    start.set()
+
+    tasks = []
+    running_workers = concurrency
+    while running_workers:
+        try:
+            result = results.get(timeout=1)
+        except queue.Empty:
+            if not any(process.is_alive() for process in processes):
+                break
+            continue
+        if result is None:
+            running_workers -= 1
+        else:
+            tasks.append(result)
+    elapsed = time.monotonic() - step_start
+    for process in processes:
+        process.join()
+
+    latencies = sorted(seconds for _, seconds, ok in tasks if ok)
+    responses = fake_shipit.responses - responses_before
+    return {
+        'concurrency': concurrency,
+        'elapsed': elapsed,
+        'tasks': len(tasks),
+        'failed_tasks': sum(1 for _, _, ok in tasks if not ok),
+        'tasks_per_second': len(latencies) / elapsed,
+        'error_rate': (len(tasks) - len(latencies)) / len(tasks) if tasks else 0,
+        'p50': percentile(latencies, 0.5),
+        'p90': percentile(latencies, 0.9),
+        'p99': percentile(latencies, 0.99),
+        'requests_per_second': (len(fake_shipit.requests) - requests_before) / elapsed,
+        'rejected_requests': responses[503],
+        'peak_waiting': fake_shipit.peak_waiting,
+        'latencies_per_action': {
+            action: sorted(seconds for task_action, seconds, ok in tasks if ok and task_action == action)
+            for action in ('mark-as-started', 'mark-as-shipped')
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ramp', default='1,2,4,8,16', help='comma-separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=20, help='duration of each step, in seconds')
+    parser.add_argument('--capacity', type=int, default=4, help='Ship-it application workers')
+    parser.add_argument('--service-time', type=float, default=0.05, help='time a request holds a Ship-it worker, in seconds')
+    parser.add_argument('--backlog', type=int, default=16, help='requests waiting for a Ship-it worker before 503s')
+    parser.add_argument('--latency', type=float, default=0, help='network latency added to every request, in seconds')
+    parser.add_argument('--locales', type=int, default=100, help='locales in the l10n changesets')
+    parser.add_argument('--instance-config', type=jsonutils.loads, default={},
+                        help='JSON object merged into the Ship-it instance config, e.g. \'{"dns_cache_ttl_in_seconds": 60}\'')
+    parser.add_argument('--output', help='path to write every step, including raw latencies, as JSON')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    options = {
+        'duration': args.duration,
+        'locales': args.locales,
+        'instance_config': args.instance_config,
+        'verbose': args.verbose,
+    }
+    fake_shipit = FakeShipIt(latency=args.latency, capacity=args.capacity, service_time=args.service_time, backlog=args.backlog)
+
+    steps = []
+    header = '{:>11} {:>8} {:>8} {:>8} {:>9} {:>9} {:>9} {:>8} {:>8} {:>8}'
+    row = '{concurrency:>11} {tasks:>8} {tasks_per_second:>8.2f} {error_rate:>8.1%} {p50:>9.2f} {p90:>9.2f} {p99:>9.2f} ' \
+          '{requests_per_second:>8.1f} {rejected_requests:>8} {peak_waiting:>8}'
+    print(header.format('concurrency', 'tasks', 'tasks/s', 'errors', 'p50 (s)', 'p90 (s)', 'p99 (s)', 'req/s', '503s', 'queued'))
+    with fake_shipit:
+        for step, concurrency in enumerate(int(level) for level in args.ramp.split(',')):
+            result = run_step(step, concurrency, fake_shipit, options)
+            steps.append(result)
+            print(row.format(**result), flush=True)
+
+    if args.output:
+        jsonutils.dump({'options': vars(args), 'steps': steps}, args.output, indent=2)
+
+
+__name__ == '__main__' and main()
@@ -25,6 +25,7 @@ setup(
     entry_points={
         'console_scripts': [
             'shipitscript = shipitscript.script:main',
+            'shipitscript-reconcile = shipitscript.reconcile:main',
         ],
     },
     license='MPL2',
@@ -0,0 +1,4 @@
+from shipitscript.profiling import start_process_profiler
+
+# before anything else gets imported, so that imports get profiled too
+start_process_profiler()
@@ -0,0 +1,147 @@
+import certifi
+import hashlib
+import logging
+import os
+import stat
+import threading
+
+import requests
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+from shipitscript import jsonutils
+from shipitscript.fileutils import locked, write_atomically
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_SESSION_CACHE_DIR = os.path.join('~', '.cache', 'shipitscript', 'sessions')
+
+
+class SessionAuth(requests.auth.AuthBase):
+    """`requests` auth logging in once at `login_url` with basic auth, then
+    sending the bearer token, or the cookies, Ship-it handed back. Sessions
+    are cached on disk in `cache_dir`, so that they are shared by every
+    worker process of the host. A 401 triggers a new login and the request
+    is sent again. Logins go through `session`, which should have the
+    ShipItAdapter mounted like the ones of shipitapi objects, and `verify`
+    must match their `ca_certs`"""
+
+    def __init__(self, username, password, api_root, login_path, cache_dir=DEFAULT_SESSION_CACHE_DIR, timeout=60,
+                 session=None, verify=certifi.where()):
+        self.username = username
+        self.password = password
+        self.login_url = api_root.rstrip('/') + login_path
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.cache_path = os.path.join(self.cache_dir, get_session_file_name(api_root, username))
+        self.timeout = timeout
+        self.session = session if session is not None else requests.Session()
+        self.verify = verify
+        self._session = None
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        session = self.get_session()
+        apply_session(request, session)
+        request.register_hook('response', self._make_401_handler(session))
+        return request
+
+    def get_session(self):
+        if self._session is None:
+            return self.refresh_session(stale_session=None)
+        return self._session
+
+    def refresh_session(self, stale_session):
+        """Function to replace `stale_session` by the one another thread or
+        process already cached, or else by a new login"""
+        with self._lock:
+            if self._session != stale_session:
+                return self._session
+
+            with locked(self.cache_path + '.lock'):
+                cached_session = read_session(self.cache_path)
+                if cached_session is not None and cached_session != stale_session:
+                    self._session = cached_session
+                else:
+                    self._session = self.login()
+                    write_session(self.cache_path, self._session)
+
+            return self._session
+
+    def login(self):
+        log.info('Logging in to {} as {}'.format(self.login_url, self.username))
+        response = self.session.post(
+            self.login_url, auth=(self.username, self.password), timeout=self.timeout, verify=self.verify,
+        )
+        if response.status_code in (401, 403):
+            # not an HTTPError, which shipitapi would retry with the same credentials
+            raise ScriptWorkerTaskException('Login to {} as {} got rejected with a {}'.format(
+                self.login_url, self.username, response.status_code,
+            ))
+        response.raise_for_status()
+
+        token = None
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            token = jsonutils.loads(response.content).get('token')
+        session = {'token': token, 'cookies': response.cookies.get_dict()}
+        if not session['token'] and not session['cookies']:
+            raise ScriptWorkerTaskException('Login to {} returned neither a token nor a cookie'.format(self.login_url))
+
+        return session
+
+    def _make_401_handler(self, session):
+        def handle_401(response, **kwargs):
+            if response.status_code != 401 or getattr(response.request, 'session_auth_retried', False):
+                return response
+
+            log.info('Ship-it session got rejected, logging in again')
+            new_session = self.refresh_session(stale_session=session)
+            # release the connection before reusing it
+            response.content
+            response.close()
+
+            request = response.request.copy()
+            request.headers.pop('Authorization', None)
+            request.headers.pop('Cookie', None)
+            apply_session(request, new_session)
+            request.session_auth_retried = True
+
+            new_response = response.connection.send(request, **kwargs)
+            new_response.history.append(response)
+            new_response.request = request
+            return new_response
+
+        return handle_401
+
+
+def get_session_file_name(api_root, username):
+    return hashlib.sha256('{}\n{}'.format(api_root.rstrip('/'), username).encode('utf-8')).hexdigest()[:32] + '.json'
+
+
+def apply_session(request, session):
+    if session['token']:
+        request.headers['Authorization'] = 'Bearer {}'.format(session['token'])
+    if session['cookies']:
+        cookies = '; '.join('{}={}'.format(name, value) for name, value in sorted(session['cookies'].items()))
+        existing_cookies = request.headers.get('Cookie')
+        request.headers['Cookie'] = '{}; {}'.format(existing_cookies, cookies) if existing_cookies else cookies
+
+
+def read_session(path):
+    """Function to read a cached session. Files other users could have read
+    or written are ignored"""
+    try:
+        with open(path, 'rb') as f:
+            file_stat = os.fstat(f.fileno())
+            if file_stat.st_uid != os.getuid() or stat.S_IMODE(file_stat.st_mode) & 0o077:
+                log.warning('Ignoring {} which is accessible to other users'.format(path))
+                return None
+            return jsonutils.loads(f.read())
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        log.warning('Ignoring corrupted session file {}'.format(path))
+        return None
+
+
+def write_session(path, session):
+    write_atomically(path, jsonutils.dumps(session))
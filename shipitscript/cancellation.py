@@ -0,0 +1,337 @@
+import contextlib
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import weakref
+
+import arrow
+from scriptworker.constants import STATUSES
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+
+log = logging.getLogger(__name__)
+
+# Seconds kept between the deadline of the task and the one of shipitscript,
+# so that it exits on its own before scriptworker kills it
+DEADLINE_MARGIN_IN_SECONDS = 5
+
+REASON_DEADLINE = 'deadline'
+
+# Signals scriptworker stops the task process with
+CANCELLATION_SIGNALS = (signal.SIGTERM,)
+
+# Stand-in for the start of the process where /proc isn't available
+_IMPORTED_AT = time.monotonic()
+
+
+class TaskCancelled(ScriptWorkerTaskException):
+    def __init__(self, msg, exit_code=STATUSES['worker-shutdown']):
+        super().__init__(msg, exit_code=exit_code)
+
+
+class DeadlineExceeded(TaskCancelled):
+    def __init__(self, msg, exit_code=STATUSES['intermittent-task']):
+        super().__init__(msg, exit_code=exit_code)
+
+
+# Every connection to Ship-it opened by the process. Cancelling shuts down
+# their sockets, which makes the calls blocked on them, in any thread,
+# return right away
+_connections = weakref.WeakSet()
+_connections_lock = threading.Lock()
+
+_cancellation = None
+# Cancellation of the calls of the current thread, overriding the one of
+# the task
+_local = threading.local()
+
+
+def current_cancellation():
+    return getattr(_local, 'cancellation', None) or _cancellation
+
+
+@contextlib.contextmanager
+def cancellation_scope(cancellation):
+    """Make `cancellation` the one of the Ship-it calls of the current
+    thread"""
+    previous_cancellation = getattr(_local, 'cancellation', None)
+    _local.cancellation = cancellation
+    try:
+        yield cancellation
+    finally:
+        _local.cancellation = previous_cancellation
+
+
+def shutdown_connection(connection):
+    sock = getattr(connection, 'sock', None)
+    if sock is None:
+        return
+    try:
+        # socket.socket.shutdown() rather than SSLSocket.shutdown(), which
+        # would tear down the TLS state under the feet of a reading thread
+        socket.socket.shutdown(sock, socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+def shutdown_connections():
+    with _connections_lock:
+        connections = list(_connections)
+    for connection in connections:
+        shutdown_connection(connection)
+
+
+def track_connection(connection):
+    with _connections_lock:
+        _connections.add(connection)
+    cancellation = current_cancellation()
+    if cancellation is not None:
+        cancellation.track(connection)
+
+
+class Cancellation(object):
+    """Cancellation state of the running task. `deadline` is a
+    `time.monotonic()` value past which the task gets cancelled"""
+
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self.reason = None
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def cancelled(self):
+        return self.reason is not None
+
+    def remaining(self):
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def cancel(self, reason):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+        log.warning('Cancelling the task ({}), aborting in-flight Ship-it calls'.format(reason))
+        self.shutdown()
+
+    def shutdown(self):
+        shutdown_connections()
+
+    def track(self, connection):
+        if self.cancelled:
+            shutdown_connection(connection)
+
+    def expired(self):
+        """Function telling whether the task got cancelled, or just reached
+        its deadline"""
+        if not self.cancelled and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(REASON_DEADLINE)
+        return self.cancelled
+
+    def get_exception(self):
+        if self.reason == REASON_DEADLINE:
+            return DeadlineExceeded('Task deadline exceeded, Ship-it calls got aborted')
+        return TaskCancelled('Task got cancelled ({}), Ship-it calls got aborted'.format(self.reason))
+
+    def check(self):
+        if self.expired():
+            raise self.get_exception()
+
+    def get_timeout(self, timeout):
+        """Function to cap a `requests` timeout, a number or a (connect,
+        read) tuple, to the time left until the deadline"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        remaining = max(remaining, 0.001)
+        if timeout is None:
+            return remaining
+        if isinstance(timeout, tuple):
+            return tuple(remaining if value is None else min(float(value), remaining) for value in timeout)
+        return min(float(timeout), remaining)
+
+    def start_timer(self):
+        remaining = self.remaining()
+        if remaining is None:
+            return
+        self._timer = threading.Timer(max(remaining, 0), self.cancel, args=(REASON_DEADLINE,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def stop_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+
+class CallCancellation(Cancellation):
+    """Cancellation of the Ship-it calls made by one thread, e.g. the hedged
+    call that lost. Only the connections used by these calls are shut down.
+    They are cancelled with `parent` too"""
+
+    def __init__(self, parent=None):
+        super().__init__(deadline=None if parent is None else parent.deadline)
+        self.parent = parent
+        self._connections = weakref.WeakSet()
+
+    @property
+    def cancelled(self):
+        return self.reason is not None or (self.parent is not None and self.parent.cancelled)
+
+    def cancel(self, reason):
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+        log.debug('Cancelling Ship-it calls ({})'.format(reason))
+        self.shutdown()
+
+    def shutdown(self):
+        with self._lock:
+            connections = list(self._connections)
+        for connection in connections:
+            shutdown_connection(connection)
+
+    def track(self, connection):
+        with self._lock:
+            self._connections.add(connection)
+        super().track(connection)
+
+    def expired(self):
+        if self.parent is not None and self.parent.expired():
+            return True
+        return super().expired()
+
+    def get_exception(self):
+        if self.reason is None and self.parent is not None:
+            return self.parent.get_exception()
+        return TaskCancelled('Ship-it calls got cancelled ({})'.format(self.reason))
+
+
+def get_process_start():
+    """Function to grab the `time.monotonic()` value the process started at.
+    scriptworker counts the run time of the task from there, not from
+    whenever `async_main` starts"""
+    try:
+        with open('/proc/self/stat') as f:
+            # the command name, in parentheses, may contain spaces
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return _IMPORTED_AT
+    return time.monotonic() - max(uptime - start_ticks / os.sysconf('SC_CLK_TCK'), 0)
+
+
+def get_deadline(task, max_timeout=None, started_at=None, now=None):
+    """Function to grab the `time.monotonic()` value shipitscript must be
+    done by. Like scriptworker, the run time of the task is the lower of
+    `max_timeout`, its `task_max_timeout`, and the `maxRunTime` of the
+    payload, counted from `started_at`, the start of the process. The
+    `deadline` of the task applies too. None if none of them is set"""
+    now = time.monotonic() if now is None else now
+    started_at = get_process_start() if started_at is None else started_at
+    run_times = [float(run_time) for run_time in (max_timeout, task.get('payload', {}).get('maxRunTime')) if run_time is not None]
+    deadlines = []
+    if run_times:
+        deadlines.append(started_at + min(run_times))
+    if task.get('deadline'):
+        deadlines.append(now + (arrow.get(task['deadline']) - arrow.utcnow()).total_seconds())
+    if not deadlines:
+        return None
+
+    deadline = min(deadlines)
+    return deadline - min(DEADLINE_MARGIN_IN_SECONDS, max(deadline - started_at, 0) / 10)
+
+
+@contextlib.contextmanager
+def _handling_signals(cancellation):
+    """Cancel on CANCELLATION_SIGNALS. Python handlers only run once the
+    main thread is done with its blocking call, which is what needs to be
+    aborted: a thread watches the wakeup fd, written to by the C-level
+    handler, instead"""
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+
+    read_socket, write_socket = socket.socketpair()
+    write_socket.setblocking(False)
+
+    def handler(signum, frame):
+        cancellation.cancel(signal.Signals(signum).name)
+
+    def watch():
+        while True:
+            data = read_socket.recv(64)
+            if not data:
+                return
+            for signum in data:
+                if signum in CANCELLATION_SIGNALS:
+                    cancellation.cancel(signal.Signals(signum).name)
+
+    previous_wakeup_fd = signal.set_wakeup_fd(write_socket.fileno())
+    previous_handlers = {signum: signal.signal(signum, handler) for signum in CANCELLATION_SIGNALS}
+    thread = threading.Thread(target=watch, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        for signum, previous_handler in previous_handlers.items():
+            signal.signal(signum, previous_handler)
+        signal.set_wakeup_fd(previous_wakeup_fd)
+        write_socket.close()
+        thread.join()
+        read_socket.close()
+
+
+@contextlib.contextmanager
+def cancellable(context):
+    """Make every Ship-it call of the task abort on cancellation or past the
+    deadline of the task, raising TaskCancelled or DeadlineExceeded, whose
+    exit statuses tell them apart from failures. A task cancelled while no
+    Ship-it call was in flight raises as well, on exit"""
+    global _cancellation
+    cancellation = Cancellation(get_deadline(context.task, context.config.get('task_max_timeout')))
+    if cancellation.deadline is not None:
+        log.debug('Ship-it calls have {:.1f}s to complete'.format(cancellation.remaining()))
+
+    _cancellation = cancellation
+    cancellation.start_timer()
+    try:
+        with _handling_signals(cancellation):
+            yield cancellation
+        cancellation.check()
+    finally:
+        cancellation.stop_timer()
+        _cancellation = None
+
+
+class _CancellableConnectionMixin(object):
+    def connect(self):
+        super().connect()
+        track_connection(self)
+
+    def request(self, *args, **kwargs):
+        # pooled connections may have been opened by another thread
+        cancellation = getattr(_local, 'cancellation', None)
+        if cancellation is not None:
+            cancellation.track(self)
+        return super().request(*args, **kwargs)
+
+
+def get_cancellable_pool_classes(pool_classes_by_scheme):
+    """Function to derive urllib3 pool classes whose connections are shut
+    down on cancellation"""
+    cancellable_pool_classes = {}
+    for scheme, pool_class in pool_classes_by_scheme.items():
+        connection_class = type(
+            'Cancellable{}'.format(pool_class.ConnectionCls.__name__),
+            (_CancellableConnectionMixin, pool_class.ConnectionCls), {},
+        )
+        cancellable_pool_classes[scheme] = type(
+            'Cancellable{}'.format(pool_class.__name__), (pool_class,), {'ConnectionCls': connection_class},
+        )
+    return cancellable_pool_classes
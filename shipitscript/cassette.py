@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""Record the Ship-it calls of a run into a cassette, and replay cassettes
+from a local server
+
+    python -m shipitscript.cassette cassette.json --time-scale 0.5 --port 8000
+"""
+import argparse
+import base64
+import contextlib
+import http.server
+import logging
+import socketserver
+import threading
+import time
+
+from shipitscript import jsonutils
+
+
+log = logging.getLogger(__name__)
+
+CASSETTE_VERSION = 1
+
+# Credentials are never written to cassettes
+SENSITIVE_HEADERS = ('authorization', 'cookie', 'set-cookie')
+# Headers the replay server computes itself. Bodies are stored decoded
+TRANSPORT_HEADERS = ('connection', 'content-encoding', 'content-length', 'keep-alive', 'transfer-encoding')
+# Headers http.server sends on its own
+REPLAY_SERVER_HEADERS = ('date', 'server')
+
+_recorder = None
+
+
+def current_recorder():
+    return _recorder
+
+
+def _encode_body(body):
+    if body is None:
+        return {'body': None, 'encoding': None}
+    if isinstance(body, str):
+        return {'body': body, 'encoding': 'utf-8'}
+    try:
+        return {'body': body.decode('utf-8'), 'encoding': 'utf-8'}
+    except UnicodeDecodeError:
+        return {'body': base64.b64encode(body).decode('ascii'), 'encoding': 'base64'}
+
+
+def decode_body(entry):
+    if entry['encoding'] is None:
+        return b''
+    if entry['encoding'] == 'base64':
+        return base64.b64decode(entry['body'])
+    return entry['body'].encode('utf-8')
+
+
+def _filter_headers(headers, excluded_headers):
+    return {key: value for key, value in headers.items() if key.lower() not in excluded_headers}
+
+
+class Recorder(object):
+    """Collects every Ship-it request and response along with when it was
+    sent and how long the whole response took to come back. Responses are
+    read in full as soon as they arrive, streamed ones included"""
+
+    def __init__(self):
+        self.interactions = []
+        self._start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, request, response, start):
+        response_body = response.content
+        end = time.monotonic()
+        interaction = {
+            'start': start - self._start,
+            'duration': end - start,
+            'request': dict(
+                method=request.method,
+                path=request.path_url,
+                headers=_filter_headers(request.headers, SENSITIVE_HEADERS),
+                **_encode_body(request.body)
+            ),
+            'response': dict(
+                status=response.status_code,
+                headers=_filter_headers(response.headers, SENSITIVE_HEADERS + TRANSPORT_HEADERS),
+                **_encode_body(response_body)
+            ),
+        }
+        with self._lock:
+            self.interactions.append(interaction)
+
+    def to_cassette(self):
+        with self._lock:
+            interactions = sorted(self.interactions, key=lambda interaction: interaction['start'])
+        return {'version': CASSETTE_VERSION, 'interactions': interactions}
+
+    def save(self, path):
+        jsonutils.dump(self.to_cassette(), path, indent=2)
+
+
+@contextlib.contextmanager
+def recording(path):
+    """Record every Ship-it call made by the process into the cassette at
+    `path`"""
+    global _recorder
+    _recorder = Recorder()
+    try:
+        yield _recorder
+    finally:
+        recorder, _recorder = _recorder, None
+        recorder.save(path)
+        log.info('Recorded {} Ship-it calls into {}'.format(len(recorder.interactions), path))
+
+
+@contextlib.contextmanager
+def maybe_record(context):
+    if not context.config.get('cassette_file'):
+        yield
+        return
+
+    with recording(context.config['cassette_file']):
+        yield
+
+
+def load_cassette(path):
+    cassette = jsonutils.load(path)
+    if cassette.get('version') != CASSETTE_VERSION:
+        raise ValueError('Unsupported cassette version {}'.format(cassette.get('version')))
+    return cassette
+
+
+class ReplayHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _handle(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        interaction = self.server.replay.next_interaction(self.command, self.path)
+        if interaction is None:
+            body = 'No recorded response to {} {}'.format(self.command, self.path).encode('utf-8')
+            status, headers = 404, {'Content-Type': 'text/plain'}
+        else:
+            time.sleep(interaction['duration'] * self.server.replay.time_scale)
+            response = interaction['response']
+            body, status, headers = decode_body(response), response['status'], response['headers']
+
+        self.send_response(status)
+        for key, value in _filter_headers(headers, REPLAY_SERVER_HEADERS).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    do_GET = do_HEAD = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class ReplayServer(object):
+    """Local server answering the requests of a cassette with the recorded
+    responses, after the recorded duration multiplied by `time_scale`. Each
+    recorded response is served once, identical requests getting them in
+    order. Every request is kept in `requests`. The ones missing from the
+    cassette, or made more times than recorded, are kept in `unmatched` too
+    and get a 404"""
+
+    def __init__(self, cassette, time_scale=1.0, port=0):
+        self.time_scale = time_scale
+        self.port = port
+        self.requests = []
+        self.unmatched = []
+        self._interactions = {}
+        for interaction in cassette['interactions']:
+            key = (interaction['request']['method'], interaction['request']['path'])
+            self._interactions.setdefault(key, []).append(interaction)
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def api_root(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    @property
+    def unconsumed(self):
+        """Recorded requests that haven't been made, in the recorded order"""
+        with self._lock:
+            return [key for _, key in sorted(
+                (interaction['start'], key) for key, interactions in self._interactions.items() for interaction in interactions
+            )]
+
+    def next_interaction(self, method, path):
+        with self._lock:
+            self.requests.append((method, path))
+            interactions = self._interactions.get((method, path))
+            if not interactions:
+                self.unmatched.append((method, path))
+                return None
+            return interactions.pop(0)
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', self.port), ReplayHandler)
+        self._server.replay = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('cassette_path')
+    parser.add_argument('--time-scale', type=float, default=1.0,
+                        help='factor applied to the recorded durations, 0 answers right away')
+    parser.add_argument('--port', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    with ReplayServer(load_cassette(args.cassette_path), time_scale=args.time_scale, port=args.port) as server:
+        print('Replaying {} on {}'.format(args.cassette_path, server.api_root), flush=True)
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+__name__ == '__main__' and main()
@@ -0,0 +1,123 @@
+import io
+import logging
+import os
+import ssl
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+try:
+    import h2  # noqa: F401 (httpx silently falls back to HTTP/1.1 without it)
+    import httpx
+except ImportError:
+    httpx = None
+
+
+log = logging.getLogger(__name__)
+
+HTTP2_AVAILABLE = httpx is not None
+
+# Connection-specific headers, which HTTP/2 forbids (RFC 7540, section 8.1.2.2)
+HOP_BY_HOP_HEADERS = frozenset(('connection', 'keep-alive', 'proxy-connection', 'transfer-encoding', 'upgrade'))
+
+# One client, and thus one multiplexed connection, per origin
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+class _RawResponse(io.BytesIO):
+    """Stand-in for the urllib3 response `requests` expects in `raw`"""
+
+    def read(self, amt=None, decode_content=None):
+        return super().read(amt)
+
+    def release_conn(self):
+        pass
+
+
+def get_client(url, verify=True):
+    """Function to grab the HTTP/2 capable client shared by every request to
+    the origin of `url`. ALPN negotiates HTTP/2 over TLS and falls back to
+    HTTP/1.1 when the server doesn't speak it"""
+    split_url = urlsplit(url)
+    key = (split_url.scheme, split_url.netloc, verify)
+    with _clients_lock:
+        if key not in _clients:
+            if isinstance(verify, str):
+                # CA bundle paths, like requests takes, are deprecated by httpx
+                verify = ssl.create_default_context(**{'capath' if os.path.isdir(verify) else 'cafile': verify})
+            _clients[key] = httpx.Client(http2=True, verify=verify, follow_redirects=False)
+        return _clients[key]
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def _to_httpx_timeout(timeout):
+    if isinstance(timeout, tuple):
+        connect, read = timeout
+        return httpx.Timeout(read, connect=connect)
+    return httpx.Timeout(timeout)
+
+
+def get_headers(request):
+    """Function to grab the headers of a `requests` prepared request, minus
+    the connection-specific ones `requests` adds for HTTP/1.1"""
+    connection_headers = {
+        header.strip().lower() for header in request.headers.get('Connection', '').split(',') if header.strip()
+    }
+    return {
+        key: value for key, value in request.headers.items()
+        if key.lower() not in HOP_BY_HOP_HEADERS and key.lower() not in connection_headers
+    }
+
+
+def send(request, timeout=None, verify=True, stream=False, **kwargs):
+    """Function to send a `requests` prepared request over the shared HTTP/2
+    client and to translate the answer back into a `requests` response, so
+    that shipitapi doesn't notice the difference. Bodies are read in full:
+    streamed requests aren't supported"""
+    if stream:
+        raise ValueError('Streamed requests are not supported over HTTP/2')
+
+    client = get_client(request.url, verify=verify)
+    try:
+        httpx_response = client.request(
+            request.method, request.url, headers=get_headers(request),
+            content=request.body, timeout=_to_httpx_timeout(timeout),
+        )
+    except httpx.ConnectTimeout as e:
+        raise requests.ConnectTimeout(e, request=request)
+    except httpx.TimeoutException as e:
+        raise requests.ReadTimeout(e, request=request)
+    except httpx.TransportError as e:
+        raise requests.ConnectionError(e, request=request)
+
+    log.debug('{} {} answered over {}'.format(request.method, request.url, httpx_response.http_version))
+    return build_response(request, httpx_response)
+
+
+def build_response(request, httpx_response):
+    response = requests.Response()
+    response.status_code = httpx_response.status_code
+    response.reason = httpx_response.reason_phrase
+    # the body has already been decompressed by httpx
+    response.headers = CaseInsensitiveDict(
+        (key, value) for key, value in httpx_response.headers.items() if key.lower() != 'content-encoding'
+    )
+    for cookie in httpx_response.cookies.jar:
+        response.cookies.set_cookie(cookie)
+    response._content = httpx_response.content
+    response.raw = _RawResponse(response._content)
+    response.encoding = get_encoding_from_headers(response.headers)
+    response.url = request.url
+    response.request = request
+
+    return response
@@ -0,0 +1,283 @@
+import codecs
+import json
+import math
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_STRUCTURAL_OR_QUOTE = re.compile(r'["\[\]{}]')
+_QUOTE_OR_BACKSLASH = re.compile(r'["\\]')
+_SCALAR = re.compile(r'[^,}\]\s]*')
+
+# raw_decode() only exists in the stdlib decoder
+_decoder = json.JSONDecoder()
+
+# KeyExtractor states
+_OBJECT_START = 'object-start'
+_KEY_OR_END = 'key-or-end'
+_KEY = 'key'
+_COLON = 'colon'
+_VALUE = 'value'
+_WANTED_VALUE = 'wanted-value'
+_SKIPPED_VALUE = 'skipped-value'
+_SKIPPED_SCALAR = 'skipped-scalar'
+_COMMA_OR_END = 'comma-or-end'
+_DONE = 'done'
+
+
+class _NeedMoreData(Exception):
+    """Raised when the buffer ends before the current token does. `consumed`
+    is how far the buffer can be dropped"""
+
+    def __init__(self, consumed=None):
+        super().__init__()
+        self.consumed = consumed
+
+
+def _decode_scalar(text, position):
+    try:
+        value, end = _decoder.raw_decode(text)
+    except json.JSONDecodeError as e:
+        raise ValueError('Invalid value at position {}: {!r}'.format(position, text)) from e
+    if end != len(text):
+        raise ValueError('Invalid value at position {}: {!r}'.format(position, text))
+    return value
+
+
+class KeyExtractor(object):
+    """Incremental parser that pulls a few top-level keys out of a JSON
+    object fed piece by piece. Values of other keys are skipped without
+    being decoded nor kept in memory, and parsing stops as soon as every
+    wanted key has been found"""
+
+    def __init__(self, keys):
+        self.keys = frozenset(keys)
+        self.found = {}
+        self._buffer = ''
+        self._state = _OBJECT_START
+        self._current_key = None
+        self._skip_depth = 0
+        self._skip_in_string = False
+
+    @property
+    def done(self):
+        return self._state == _DONE or self.keys.issubset(self.found)
+
+    def feed(self, text, eof=False):
+        self._buffer += text
+        position = 0
+        while not self.done:
+            try:
+                position = self._step(position, eof)
+            except _NeedMoreData as e:
+                if e.consumed is not None:
+                    position = e.consumed
+                break
+        self._buffer = self._buffer[position:]
+
+        if eof and not self.done:
+            raise ValueError('Truncated JSON object')
+
+    def _skip_whitespace(self, position):
+        position = _WHITESPACE.match(self._buffer, position).end()
+        if position == len(self._buffer):
+            raise _NeedMoreData()
+        return position
+
+    def _expect(self, position, characters):
+        position = self._skip_whitespace(position)
+        character = self._buffer[position]
+        if character not in characters:
+            raise ValueError('Expected one of {!r} at position {}, got {!r}'.format(characters, position, character))
+        return position, character
+
+    def _step(self, position, eof):
+        state = self._state
+        if state == _OBJECT_START:
+            position, _ = self._expect(position, '{')
+            self._state = _KEY_OR_END
+            return position + 1
+
+        if state == _KEY_OR_END:
+            position, character = self._expect(position, '"}')
+            if character == '}':
+                self._state = _DONE
+                return position + 1
+            self._state = _KEY
+            return position
+
+        if state == _KEY:
+            try:
+                self._current_key, end = json.decoder.scanstring(self._buffer, position + 1)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                raise _NeedMoreData()
+            self._state = _COLON
+            return end
+
+        if state == _COLON:
+            position, _ = self._expect(position, ':')
+            self._state = _VALUE
+            return position + 1
+
+        if state == _VALUE:
+            position = self._skip_whitespace(position)
+            if self._current_key in self.keys:
+                self._state = _WANTED_VALUE
+                return position
+            character = self._buffer[position]
+            if character in '{[':
+                self._skip_depth, self._skip_in_string = 1, False
+                self._state = _SKIPPED_VALUE
+            elif character == '"':
+                self._skip_depth, self._skip_in_string = 0, True
+                self._state = _SKIPPED_VALUE
+            else:
+                self._state = _SKIPPED_SCALAR
+            return position + 1
+
+        if state == _WANTED_VALUE:
+            if self._buffer[position] in '{["':
+                try:
+                    value, end = _decoder.raw_decode(self._buffer, position)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    raise _NeedMoreData()
+            else:
+                # numbers, like `-1.` or `-1.5e`, may go on in the next
+                # piece: scalars are only decoded once their end is known
+                end = _SCALAR.match(self._buffer, position).end()
+                if end == len(self._buffer) and not eof:
+                    raise _NeedMoreData()
+                value = _decode_scalar(self._buffer[position:end], position)
+            self.found[self._current_key] = value
+            self._state = _COMMA_OR_END
+            return end
+
+        if state == _SKIPPED_VALUE:
+            return self._skip(position)
+
+        if state == _SKIPPED_SCALAR:
+            end = _SCALAR.match(self._buffer, position).end()
+            if end == len(self._buffer) and not eof:
+                # the scalar is dropped, only its end matters
+                raise _NeedMoreData(consumed=end)
+            self._state = _COMMA_OR_END
+            return end
+
+        if state == _COMMA_OR_END:
+            position, character = self._expect(position, ',}')
+            self._state = _DONE if character == '}' else _KEY_OR_END
+            return position + 1
+
+        raise ValueError('Unexpected parser state {}'.format(state))
+
+    def _skip(self, position):
+        """Scan a skipped string, object or array, keeping track of the
+        nesting depth so that scanning can resume in the next piece"""
+        buffer = self._buffer
+        while True:
+            if self._skip_in_string:
+                match = _QUOTE_OR_BACKSLASH.search(buffer, position)
+                if match is None:
+                    raise _NeedMoreData(consumed=len(buffer))
+                if match.group() == '\\':
+                    if match.end() == len(buffer):
+                        # the escaped character is in the next piece
+                        raise _NeedMoreData(consumed=match.start())
+                    position = match.end() + 1
+                    continue
+                position = match.end()
+                self._skip_in_string = False
+                if self._skip_depth == 0:
+                    self._state = _COMMA_OR_END
+                    return position
+                continue
+
+            match = _STRUCTURAL_OR_QUOTE.search(buffer, position)
+            if match is None:
+                raise _NeedMoreData(consumed=len(buffer))
+            position = match.end()
+            character = match.group()
+            if character == '"':
+                self._skip_in_string = True
+            elif character in '{[':
+                self._skip_depth += 1
+            else:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._state = _COMMA_OR_END
+                    return position
+
+
+def extract_keys(chunks, keys):
+    """Function to grab `keys` out of the JSON object whose utf-8 encoded
+    bytes are yielded by `chunks`. It stops consuming `chunks` as soon as
+    every key has been found. Missing keys are absent from the result"""
+    extractor = KeyExtractor(keys)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    for chunk in chunks:
+        extractor.feed(decoder.decode(chunk))
+        if extractor.done:
+            return extractor.found
+
+    extractor.feed(decoder.decode(b'', final=True), eof=True)
+    return extractor.found
+
+
+def get_backend_name():
+    return 'stdlib' if orjson is None else 'orjson'
+
+
+def loads(data):
+    """Function to decode JSON from `str` or `bytes`, with orjson when it's
+    installed"""
+    if orjson is None:
+        return json.loads(data)
+    return orjson.loads(data)
+
+
+def _replace_non_finite_floats(obj):
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {key: _replace_non_finite_floats(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_replace_non_finite_floats(value) for value in obj]
+    return obj
+
+
+def dumps(obj, sort_keys=False, indent=None):
+    """Function to encode `obj` into a JSON `str`, with orjson when it's
+    installed and supports the given options. Both encode the same data:
+    non-ASCII characters aren't escaped, NaN and infinities become null,
+    like orjson does, and non-str keys are converted to str"""
+    if orjson is None or indent not in (None, 2):
+        try:
+            return json.dumps(obj, sort_keys=sort_keys, indent=indent, ensure_ascii=False, allow_nan=False)
+        except ValueError:
+            return json.dumps(_replace_non_finite_floats(obj), sort_keys=sort_keys, indent=indent, ensure_ascii=False)
+
+    option = orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    if indent:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, option=option).decode('utf-8')
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def dump(obj, path, sort_keys=False, indent=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(dumps(obj, sort_keys=sort_keys, indent=indent))
@@ -0,0 +1,74 @@
+import logging
+
+from scriptworker.artifacts import get_and_check_single_upstream_artifact_full_path
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+
+log = logging.getLogger(__name__)
+
+
+class CompactL10nChangesets(object):
+    """l10n changesets as a table of the distinct `revisions` plus the index
+    of its revision per locale. Most locales of a release share a few
+    revisions: the `locale revision` per line text is only built by
+    `expand()`"""
+
+    def __init__(self, revisions, locales):
+        self.revisions = revisions
+        self.locales = locales
+
+    @classmethod
+    def from_payload(cls, l10n_changesets):
+        revisions, locales = l10n_changesets['revisions'], l10n_changesets['locales']
+        invalid_locales = sorted(locale for locale, index in locales.items() if not 0 <= index < len(revisions))
+        if invalid_locales:
+            raise ScriptWorkerTaskException(
+                'l10n changesets of {} point to no revision out of {}'.format(', '.join(invalid_locales), len(revisions))
+            )
+        return cls(revisions, locales)
+
+    def to_payload(self):
+        return {'revisions': self.revisions, 'locales': self.locales}
+
+    def expand(self):
+        return ''.join('{} {}\n'.format(locale, self.revisions[index]) for locale, index in self.locales.items())
+
+    def __eq__(self, other):
+        return isinstance(other, CompactL10nChangesets) and self.to_payload() == other.to_payload()
+
+    def __repr__(self):
+        return '<CompactL10nChangesets: {} locales, {} revisions>'.format(len(self.locales), len(self.revisions))
+
+
+def get_l10n_changesets(context):
+    """Function to grab the l10n changesets of a mark-as-started task. They
+    are either inlined in the payload, compact or not, or referenced as an
+    upstream artifact, in which case scriptworker has already downloaded it
+    (the artifact must be listed in the `upstreamArtifacts` of the task)"""
+    l10n_changesets = context.task['payload']['l10n_changesets']
+    if isinstance(l10n_changesets, str):
+        return l10n_changesets
+    if 'revisions' in l10n_changesets:
+        return CompactL10nChangesets.from_payload(l10n_changesets)
+
+    path = get_and_check_single_upstream_artifact_full_path(
+        context, l10n_changesets['taskId'], l10n_changesets['path']
+    )
+    log.info('Reading l10n changesets from upstream artifact {}'.format(path))
+    return read_l10n_changesets(path)
+
+
+def expand_l10n_changesets(l10n_changesets):
+    """Function to grab the `locale revision` per line text Ship-it v1
+    expects, out of l10n changesets in any form `get_l10n_changesets()`
+    returns"""
+    if isinstance(l10n_changesets, CompactL10nChangesets):
+        return l10n_changesets.expand()
+    return l10n_changesets
+
+
+def read_l10n_changesets(path):
+    """Function to read l10n changesets, in the `locale revision` per line
+    format expected by Ship-it v1, from a file on disk"""
+    with open(path) as f:
+        return f.read()
@@ -0,0 +1,220 @@
+import bisect
+import logging
+import os
+import re
+import threading
+
+from shipitscript import jsonutils
+from shipitscript.fileutils import locked, write_atomically
+
+
+log = logging.getLogger(__name__)
+
+# Version 1 files held whole request durations, not the time to the response
+HISTOGRAM_FILE_VERSION = 2
+
+# Upper bounds of the histogram buckets, from 10ms to ~60s, 25% apart. The
+# last bucket has no upper bound
+BUCKET_BOUNDARIES = tuple(0.01 * 1.25 ** i for i in range(40))
+
+# Older samples are halved past this count, so that histograms follow
+# the current behavior of Ship-it
+MAX_SAMPLES = 1000
+
+DEFAULT_PERCENTILE = 99
+DEFAULT_MULTIPLIER = 2
+DEFAULT_MIN_TIMEOUT_IN_SECONDS = 5
+DEFAULT_MIN_SAMPLES = 20
+
+_RELEASE_PATH = re.compile(r'^/releases/[^/?]+$')
+
+# OPERATIONS {{{1
+OPERATIONS = {
+    ('HEAD', '/csrf_token'): 'csrf_token',
+    ('POST', '/login'): 'login',
+    ('POST', '/submit_release.html'): 'submit',
+    ('GET', '/releases'): 'listReleases',
+    ('POST', '/releases/'): 'update',
+    ('GET', '/releases/'): 'getRelease',
+}
+
+
+def get_operation(method, path):
+    """Function to name the Ship-it operation a request is for. `path` is
+    relative to `api_root`"""
+    path = path.split('?', 1)[0]
+    if _RELEASE_PATH.match(path):
+        path = '/releases/'
+    return OPERATIONS.get((method, path), 'other')
+
+
+def get_request_operation(request, api_root=None):
+    """Function to name the Ship-it operation a `requests` prepared request
+    is for. Its path is taken relative to `api_root`, when the request is
+    sent under it"""
+    if api_root and request.url.startswith(api_root):
+        return get_operation(request.method, request.url[len(api_root):])
+    return get_operation(request.method, request.path_url)
+
+
+class LatencyHistogram(object):
+    def __init__(self, counts=None):
+        self.counts = list(counts) if counts is not None else [0] * (len(BUCKET_BOUNDARIES) + 1)
+
+    @property
+    def total(self):
+        return sum(self.counts)
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKET_BOUNDARIES, seconds)] += 1
+
+    def merge(self, other):
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+
+    def decay(self):
+        while self.total > MAX_SAMPLES:
+            self.counts = [count // 2 for count in self.counts]
+
+    def percentile(self, percentile):
+        """Function to grab the upper bound of the bucket `percentile`% of
+        the samples fall under. None past the last boundary"""
+        threshold = self.total * percentile / 100
+        cumulated_count = 0
+        for boundary, count in zip(BUCKET_BOUNDARIES, self.counts):
+            cumulated_count += count
+            if cumulated_count >= threshold:
+                return boundary
+        return None
+
+
+def read_histograms(path):
+    try:
+        histogram_file = jsonutils.load(path)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        log.warning('Ignoring corrupted latency histograms {}'.format(path))
+        return {}
+    if histogram_file.get('version') != HISTOGRAM_FILE_VERSION:
+        return {}
+
+    return {
+        (api_root, operation): LatencyHistogram(counts)
+        for api_root, counts_per_operation in histogram_file['histograms'].items()
+        for operation, counts in counts_per_operation.items()
+    }
+
+
+def write_histograms(path, histograms):
+    counts_per_api_root = {}
+    for (api_root, operation), histogram in histograms.items():
+        counts_per_api_root.setdefault(api_root, {})[operation] = histogram.counts
+    write_atomically(path, jsonutils.dumps({'version': HISTOGRAM_FILE_VERSION, 'histograms': counts_per_api_root}))
+
+
+class LatencyTracker(object):
+    """Latency histograms per `api_root` and operation, persisted in `path`.
+    The file is shared by the worker processes of the host: samples are
+    added to the ones of the file at save time"""
+
+    def __init__(self, path):
+        self.path = path
+        self._histograms = read_histograms(path)
+        self._new_histograms = {}
+        self._lock = threading.Lock()
+
+    def get_histogram(self, api_root, operation):
+        with self._lock:
+            histogram = LatencyHistogram()
+            for histograms in (self._histograms, self._new_histograms):
+                if (api_root, operation) in histograms:
+                    histogram.merge(histograms[(api_root, operation)])
+            return histogram
+
+    def record(self, api_root, operation, seconds):
+        with self._lock:
+            self._new_histograms.setdefault((api_root, operation), LatencyHistogram()).record(seconds)
+
+    def save(self):
+        with self._lock:
+            if not self._new_histograms:
+                return
+            with locked(self.path + '.lock'):
+                histograms = read_histograms(self.path)
+                for key, new_histogram in self._new_histograms.items():
+                    histogram = histograms.setdefault(key, LatencyHistogram())
+                    histogram.merge(new_histogram)
+                    histogram.decay()
+                write_histograms(self.path, histograms)
+            self._histograms = histograms
+            self._new_histograms = {}
+
+
+# One tracker per histogram file, shared by every Ship-it client of the process
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def get_tracker(path):
+    path = os.path.expanduser(path)
+    with _trackers_lock:
+        if path not in _trackers:
+            _trackers[path] = LatencyTracker(path)
+        return _trackers[path]
+
+
+def save_trackers():
+    with _trackers_lock:
+        trackers = list(_trackers.values())
+    for tracker in trackers:
+        try:
+            tracker.save()
+        except OSError as e:
+            log.warning('Could not save latency histograms to {}: {}'.format(tracker.path, e))
+
+
+def clear_trackers():
+    with _trackers_lock:
+        _trackers.clear()
+
+
+class AdaptiveTimeouts(object):
+    """Read timeouts derived from the `percentile` of the latencies observed
+    for each operation, multiplied by `multiplier` and kept between
+    `min_timeout` and `max_timeout`. Latencies are the time Ship-it takes to
+    send the response headers, which is what the read timeout of `requests`
+    bounds. Connecting keeps the static timeout, and so do operations with
+    fewer than `min_samples` samples"""
+
+    def __init__(self, tracker, api_root, percentile=DEFAULT_PERCENTILE, multiplier=DEFAULT_MULTIPLIER,
+                 min_timeout=DEFAULT_MIN_TIMEOUT_IN_SECONDS, max_timeout=None, min_samples=DEFAULT_MIN_SAMPLES):
+        self.tracker = tracker
+        self.api_root = api_root.rstrip('/')
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.min_samples = min_samples
+
+    def get_timeout(self, operation, static_timeout):
+        """Function to grab the `requests` timeout of `operation`, a (connect,
+        read) tuple once there are enough samples, `static_timeout` until
+        then. The static read timeout is the ceiling of the derived one"""
+        histogram = self.tracker.get_histogram(self.api_root, operation)
+        if histogram.total < self.min_samples:
+            return static_timeout
+
+        connect_timeout, read_timeout = static_timeout if isinstance(static_timeout, tuple) else (static_timeout, static_timeout)
+        max_timeout = self.max_timeout
+        if isinstance(read_timeout, (int, float)):
+            max_timeout = read_timeout if max_timeout is None else min(max_timeout, read_timeout)
+
+        latency = histogram.percentile(self.percentile)
+        if latency is None:
+            return (connect_timeout, max_timeout if max_timeout is not None else read_timeout)
+
+        timeout = max(latency * self.multiplier, self.min_timeout)
+        return (connect_timeout, timeout if max_timeout is None else min(timeout, max_timeout))
+
+    def record(self, operation, seconds):
+        self.tracker.record(self.api_root, operation, seconds)
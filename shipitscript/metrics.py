@@ -0,0 +1,97 @@
+import collections
+import contextlib
+import logging
+import os
+import threading
+
+from shipitscript import jsonutils
+
+
+log = logging.getLogger(__name__)
+
+REQUEST_METRICS_ARTIFACT = os.path.join('public', 'logs', 'shipit_requests.json')
+
+_metrics = None
+
+
+def current_request_metrics():
+    return _metrics
+
+
+class RequestMetrics(object):
+    """Count of the Ship-it requests made by a task, and of the body bytes
+    they sent and received, per operation"""
+
+    def __init__(self):
+        self.requests = collections.Counter()
+        self.request_bytes = collections.Counter()
+        self.response_bytes = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, operation, request_bytes, response_bytes):
+        with self._lock:
+            self.requests[operation] += 1
+            self.request_bytes[operation] += request_bytes
+            self.response_bytes[operation] += response_bytes
+
+    def to_json(self):
+        with self._lock:
+            return {
+                'requests': sum(self.requests.values()),
+                'request_bytes': sum(self.request_bytes.values()),
+                'response_bytes': sum(self.response_bytes.values()),
+                'operations': {
+                    operation: {
+                        'requests': self.requests[operation],
+                        'request_bytes': self.request_bytes[operation],
+                        'response_bytes': self.response_bytes[operation],
+                    }
+                    for operation in sorted(self.requests)
+                },
+            }
+
+    def summary(self):
+        metrics = self.to_json()
+        return 'Made {} Ship-it requests, sent {} and received {} body bytes ({})'.format(
+            metrics['requests'], metrics['request_bytes'], metrics['response_bytes'],
+            ', '.join('{}: {}'.format(operation, values['requests']) for operation, values in metrics['operations'].items()),
+        )
+
+
+def get_request_body_size(request):
+    body = request.body
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    if isinstance(body, bytes):
+        return len(body)
+    return 0
+
+
+def get_response_body_size(response, stream=False):
+    """Function to grab the size of the body as sent on the wire, i.e.
+    before decompression. Unknown for streamed bodies sent without a
+    Content-Length"""
+    if response.request is not None and response.request.method == 'HEAD':
+        return 0
+    if 'Content-Length' in response.headers:
+        return int(response.headers['Content-Length'])
+    if not stream:
+        return len(response.content)
+    return 0
+
+
+@contextlib.contextmanager
+def counting_requests(context):
+    """Count the Ship-it requests of the task. The counts are logged, and
+    written to the REQUEST_METRICS_ARTIFACT"""
+    global _metrics
+    _metrics = RequestMetrics()
+    try:
+        yield _metrics
+    finally:
+        metrics, _metrics = _metrics, None
+        log.info(metrics.summary())
+        if context.config.get('artifact_dir'):
+            path = os.path.join(context.config['artifact_dir'], REQUEST_METRICS_ARTIFACT)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            jsonutils.dump(metrics.to_json(), path, indent=2)
@@ -0,0 +1,149 @@
+import cProfile
+import collections
+import contextlib
+import logging
+import os
+import sys
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+SAMPLING_INTERVAL_IN_SECONDS = 0.001
+
+# Profiler to run from the very start of the process, imports and config
+# loading included
+PROFILE_ENVIRONMENT_VARIABLE = 'SHIPITSCRIPT_PROFILE'
+
+_process_profiler = None
+_process_profiler_start = None
+
+
+class StackSampler(object):
+    """Sampling profiler that periodically records the stack of a given
+    thread. Samples are aggregated as collapsed stacks, i.e. the format
+    consumed by flamegraph.pl or speedscope"""
+
+    def __init__(self, thread_id=None, interval=SAMPLING_INTERVAL_IN_SECONDS):
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='shipitscript-stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+
+    def write(self, path):
+        """Function to write the samples as collapsed stacks"""
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write('{} {}\n'.format(stack, count))
+
+
+class DeterministicProfiler(object):
+    """cProfile, with the interface of StackSampler"""
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+
+    def start(self):
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def write(self, path):
+        """Function to write the stats in the pstats format"""
+        self.profile.dump_stats(path)
+
+
+def collapse_stack(frame):
+    """Function to turn a frame into a `root;...;leaf` collapsed stack"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
+
+
+# PROFILERS {{{1
+# Profiler class and artifact name per `profile` value. Only one runs at a
+# time: the sampler would show up in the deterministic stats, and the
+# deterministic profiler would slow down what gets sampled
+PROFILERS = {
+    'cprofile': (DeterministicProfiler, 'profile.pstats'),
+    'sampling': (StackSampler, 'profile.collapsed'),
+}
+
+
+def get_profiler_name(profile):
+    """Function to grab the PROFILERS key a `profile` value stands for. True
+    means `cprofile`"""
+    name = 'cprofile' if profile is True else profile
+    if name not in PROFILERS:
+        raise ValueError('Unsupported profile "{}". Valid ones: {}'.format(profile, sorted(PROFILERS)))
+    return name
+
+
+def start_process_profiler():
+    """Function to start the profiler named by the PROFILE_ENVIRONMENT_VARIABLE,
+    if any. It is called when the shipitscript package gets imported, and
+    stopped by `maybe_profile()`"""
+    global _process_profiler, _process_profiler_start
+    profile = os.environ.get(PROFILE_ENVIRONMENT_VARIABLE)
+    if not profile or _process_profiler is not None:
+        return
+    try:
+        name = get_profiler_name(profile)
+    except ValueError as e:
+        log.warning('Not profiling: {}'.format(e))
+        return
+
+    _process_profiler = (name, PROFILERS[name][0]())
+    _process_profiler_start = time.monotonic()
+    _process_profiler[1].start()
+
+
+@contextlib.contextmanager
+def maybe_profile(context):
+    """Context manager that profiles its body with the profiler the `profile`
+    config key names, `cprofile` (or true) for a deterministic
+    `profile.pstats`, `sampling` for a `profile.collapsed` flamegraph input.
+    A profiler started along with the process is stopped on exit instead.
+    The profile ends up in the task's logs artifacts"""
+    global _process_profiler
+    if _process_profiler is not None:
+        (name, profiler), _process_profiler = _process_profiler, None
+        start = _process_profiler_start
+    elif context.config.get('profile'):
+        name = get_profiler_name(context.config['profile'])
+        profiler = PROFILERS[name][0]()
+        start = time.monotonic()
+        profiler.start()
+    else:
+        yield
+        return
+
+    try:
+        yield
+    finally:
+        profiler.stop()
+        logs_dir = os.path.join(context.config['artifact_dir'], 'public', 'logs')
+        os.makedirs(logs_dir, exist_ok=True)
+        path = os.path.join(logs_dir, PROFILERS[name][1])
+        profiler.write(path)
+        log.info('Profiled {:.3f}s of execution into {}'.format(time.monotonic() - start, path))
@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+"""Check that Ship-it reflects the expected state of many releases at once,
+and optionally fix the ones that don't
+
+    shipitscript-reconcile config.json expectations.json [--fix]
+
+`config.json` is the shipitscript config, only its `ship_it_instances` are
+used. `expectations.json` maps server scopes to the values expected for each
+release, e.g.
+
+    {
+        "project:releng:ship-it:server:production": {
+            "Firefox-61.0-build3": {"status": "shipped", "shippedAt": "2018-06-26 14:00:00"},
+            "Devedition-62.0b3-build1": {"ready": true, "complete": true, "status": "Started"}
+        }
+    }
+"""
+import argparse
+import concurrent.futures
+import logging
+import sys
+import threading
+import time
+
+import shipitapi
+from scriptworker.utils import load_json_or_yaml
+
+from shipitscript import jsonutils
+from shipitscript.latency import save_trackers
+from shipitscript.release_cache import get_release_cache
+from shipitscript.transport import configure_api
+from shipitscript.utils import (
+    RELEASE_LIST_PAGE_SIZE, clone_api, get_auth_primitives, get_existing_release, get_mismatches, list_releases,
+)
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 8
+
+STATUS_OK = 'ok'
+STATUS_MISMATCH = 'mismatch'
+STATUS_MISSING = 'missing'
+STATUS_FIXED = 'fixed'
+STATUS_FIX_FAILED = 'fix-failed'
+
+# Statuses of the releases whose state is as expected
+CONSISTENT_STATUSES = (STATUS_OK, STATUS_FIXED)
+
+
+def per_thread_api(release_api, ship_it_instance_config):
+    """Function to create a function grabbing the shipitapi object of the
+    calling thread, a clone of `release_api`. shipitapi objects, their
+    session and the CSRF token they lazily fetch, aren't thread safe"""
+    local = threading.local()
+
+    def get_api():
+        if getattr(local, 'api', None) is None:
+            local.api = clone_api(release_api, ship_it_instance_config)
+        return local.api
+
+    return get_api
+
+
+def fetch_releases(get_api, release_names, concurrency=DEFAULT_CONCURRENCY, page_size=RELEASE_LIST_PAGE_SIZE):
+    """Function to grab the records of `release_names` with a single list
+    call, or with one getRelease per release on instances without a usable
+    one. `get_api` grabs the shipitapi object of the calling thread"""
+    release_api = get_api()
+    releases = list_releases(release_api, release_names, page_size)
+    if releases is not None:
+        return releases
+
+    log.warning('{} has no usable release list call, falling back to one getRelease per release'.format(release_api.api_root))
+
+    def _get_release(release_name):
+        return release_name, get_existing_release(get_api(), release_name)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return {
+            release_name: release_info
+            for release_name, release_info in executor.map(_get_release, release_names)
+            if release_info is not None
+        }
+
+
+def update_releases(get_api, values_per_release, concurrency=DEFAULT_CONCURRENCY):
+    """Function to concurrently update releases. `get_api` grabs the
+    shipitapi object of the calling thread. Returns the names of the
+    releases that couldn't be updated"""
+    def _update(release_name):
+        get_api().update(release_name, **values_per_release[release_name])
+
+    failed_release_names = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(_update, release_name): release_name for release_name in values_per_release}
+        for future in concurrent.futures.as_completed(futures):
+            if future.exception() is not None:
+                log.error('Could not update {}: {}'.format(futures[future], future.exception()))
+                failed_release_names.append(futures[future])
+
+    return failed_release_names
+
+
+def reconcile_instance(ship_it_instance_config, expected_values_per_release, fix=False,
+                       concurrency=DEFAULT_CONCURRENCY, page_size=RELEASE_LIST_PAGE_SIZE):
+    """Function to compare the releases of a Ship-it instance with their
+    expected values, the same way actions check their updates. With `fix`,
+    mismatching values are updated and checked again. Returns the status and
+    mismatches per release name"""
+    auth, api_root, timeout_in_seconds = get_auth_primitives(ship_it_instance_config)
+    release_api = shipitapi.Release(auth, api_root=api_root, timeout=timeout_in_seconds)
+    configure_api(release_api, ship_it_instance_config)
+    get_api = per_thread_api(release_api, ship_it_instance_config)
+
+    release_cache = get_release_cache(ship_it_instance_config)
+    release_names = sorted(expected_values_per_release)
+    fetched_at = time.time()
+    releases = fetch_releases(get_api, release_names, concurrency, page_size)
+    if release_cache is not None:
+        # reconciliation always checks Ship-it itself, other readers benefit from what it fetched
+        for release_name, release_info in releases.items():
+            release_cache.put(release_name, release_info, fetched_at)
+
+    results = {}
+    for release_name in release_names:
+        if release_name not in releases:
+            results[release_name] = {'status': STATUS_MISSING, 'mismatches': {}}
+            continue
+        mismatches = get_mismatches(releases[release_name], expected_values_per_release[release_name])
+        results[release_name] = {'status': STATUS_MISMATCH if mismatches else STATUS_OK, 'mismatches': mismatches}
+
+    values_to_fix = {
+        release_name: {key: mismatch['expected'] for key, mismatch in result['mismatches'].items()}
+        for release_name, result in results.items()
+        if result['status'] == STATUS_MISMATCH
+    }
+    if not fix or not values_to_fix:
+        return results
+
+    log.info('Fixing {} releases on {} ...'.format(len(values_to_fix), api_root))
+    failed_release_names = update_releases(get_api, values_to_fix, concurrency)
+    if release_cache is not None:
+        for release_name in values_to_fix:
+            release_cache.invalidate(release_name)
+    for release_name in failed_release_names:
+        results[release_name]['status'] = STATUS_FIX_FAILED
+
+    updated_release_names = sorted(set(values_to_fix) - set(failed_release_names))
+    if updated_release_names:
+        # make sure Ship-it reflects the updates, like actions do
+        releases = fetch_releases(get_api, updated_release_names, concurrency, page_size)
+        for release_name in updated_release_names:
+            mismatches = get_mismatches(releases.get(release_name, {}), expected_values_per_release[release_name])
+            results[release_name] = {'status': STATUS_FIX_FAILED if mismatches else STATUS_FIXED, 'mismatches': mismatches}
+
+    return results
+
+
+def log_results(scope, results):
+    for release_name, result in sorted(results.items()):
+        mismatches = ', '.join(
+            '`{}` is `{}` instead of `{}`'.format(key, mismatch['actual'], mismatch['expected'])
+            for key, mismatch in sorted(result['mismatches'].items())
+        )
+        log_function = log.info if result['status'] in CONSISTENT_STATUSES else log.error
+        log_function('{} {}: {}{}'.format(scope, release_name, result['status'], ' ({})'.format(mismatches) if mismatches else ''))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('config_path')
+    parser.add_argument('expectations_path')
+    parser.add_argument('--fix', action='store_true', help='update the mismatching values')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help='concurrent Ship-it calls per instance')
+    parser.add_argument('--page-size', type=int, default=RELEASE_LIST_PAGE_SIZE, help='releases per page of the list call')
+    parser.add_argument('--report', help='path to write the status of every release to, as JSON')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+                        level=logging.DEBUG if args.verbose else logging.INFO)
+    configured_instances = load_json_or_yaml(args.config_path, is_path=True)['ship_it_instances']
+    expectations = jsonutils.load(args.expectations_path)
+    unknown_scopes = sorted(set(expectations) - set(configured_instances))
+    if unknown_scopes:
+        parser.error('No Ship-it instance configured for {}'.format(', '.join(unknown_scopes)))
+
+    report = {}
+    try:
+        for scope, expected_values_per_release in sorted(expectations.items()):
+            report[scope] = reconcile_instance(
+                configured_instances[scope], expected_values_per_release, fix=args.fix,
+                concurrency=args.concurrency, page_size=args.page_size,
+            )
+            log_results(scope, report[scope])
+    finally:
+        # the latencies observed feed the adaptive timeouts of the tasks too
+        save_trackers()
+
+    if args.report:
+        jsonutils.dump(report, args.report, indent=2)
+
+    consistent = all(
+        result['status'] in CONSISTENT_STATUSES
+        for results in report.values()
+        for result in results.values()
+    )
+    sys.exit(0 if consistent else 1)
+
+
+__name__ == '__main__' and main()
@@ -0,0 +1,166 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from shipitscript import jsonutils
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_RELEASE_CACHE_PATH = os.path.join('~', '.cache', 'shipitscript', 'releases.sqlite')
+DEFAULT_RELEASE_CACHE_TTL_IN_SECONDS = 30
+
+# Seconds a process waits for another one to release the database
+BUSY_TIMEOUT_IN_SECONDS = 5
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS releases (
+    api_root TEXT NOT NULL,
+    name TEXT NOT NULL,
+    record TEXT,
+    complete INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (api_root, name)
+)
+'''
+
+
+class ReleaseStore(object):
+    """SQLite database of release records, in WAL mode so that the worker
+    processes of a host can read it while one of them writes. Invalidated
+    records are kept as tombstones: a record fetched before the
+    invalidation can't override it"""
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+        os.makedirs(os.path.dirname(self.path), mode=0o700, exist_ok=True)
+        self._connection = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT_IN_SECONDS, isolation_level=None, check_same_thread=False,
+        )
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            self._connection.execute('PRAGMA synchronous=NORMAL')
+            self._connection.execute(_SCHEMA)
+
+    def get(self, api_root, name, ttl, keys=None):
+        """Function to grab a record fetched less than `ttl` seconds ago.
+        Records holding only some keys are returned if they hold `keys`"""
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT record, complete FROM releases WHERE api_root = ? AND name = ? AND updated_at > ?',
+                (api_root, name, time.time() - ttl),
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+
+        record, complete = jsonutils.loads(row[0]), row[1]
+        if keys is None and not complete:
+            return None
+        if keys is not None and not set(keys).issubset(record):
+            return None
+        return record
+
+    def put(self, api_root, name, record, fetched_at, complete=True):
+        """Function to store `record`, unless the stored one, or its
+        invalidation, is more recent than `fetched_at`"""
+        with self._lock:
+            self._connection.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._connection.execute(
+                    'SELECT updated_at FROM releases WHERE api_root = ? AND name = ?', (api_root, name),
+                ).fetchone()
+                if row is None or row[0] < fetched_at:
+                    self._connection.execute(
+                        'INSERT OR REPLACE INTO releases (api_root, name, record, complete, updated_at) VALUES (?, ?, ?, ?, ?)',
+                        (api_root, name, jsonutils.dumps(record), int(complete), fetched_at),
+                    )
+                self._connection.execute('COMMIT')
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+
+    def invalidate(self, api_root, name):
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO releases (api_root, name, record, complete, updated_at) VALUES (?, ?, NULL, 0, ?)',
+                (api_root, name, time.time()),
+            )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ReleaseCache(object):
+    """Cache of the releases of a Ship-it instance. Database errors are
+    logged and turned into cache misses: Ship-it stays the source of truth"""
+
+    def __init__(self, store, api_root, ttl):
+        self.store = store
+        self.api_root = api_root.rstrip('/')
+        self.ttl = ttl
+
+    def get(self, name, keys=None):
+        try:
+            return self.store.get(self.api_root, name, self.ttl, keys)
+        except (sqlite3.Error, ValueError) as e:
+            log.warning('Could not read {} from the release cache: {}'.format(name, e))
+            return None
+
+    def put(self, name, record, fetched_at, complete=True):
+        try:
+            self.store.put(self.api_root, name, record, fetched_at, complete)
+        except sqlite3.Error as e:
+            log.warning('Could not cache {}: {}'.format(name, e))
+
+    def invalidate(self, name):
+        try:
+            self.store.invalidate(self.api_root, name)
+        except sqlite3.Error as e:
+            log.warning('Could not invalidate {} in the release cache: {}'.format(name, e))
+
+
+# One store per database, shared by every Ship-it client of the process
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_release_store(path):
+    path = os.path.expanduser(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = ReleaseStore(path)
+        return _stores[path]
+
+
+def close_release_stores():
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
+
+
+def get_release_cache(ship_it_instance_config):
+    """Function to grab the release cache of the instance, None if it isn't
+    configured to use one"""
+    release_cache_config = (ship_it_instance_config or {}).get('release_cache')
+    if not release_cache_config:
+        return None
+
+    try:
+        store = get_release_store(release_cache_config.get('path', DEFAULT_RELEASE_CACHE_PATH))
+    except sqlite3.Error as e:
+        log.warning('Could not open the release cache: {}'.format(e))
+        return None
+
+    ttl = float(release_cache_config.get('ttl_in_seconds', DEFAULT_RELEASE_CACHE_TTL_IN_SECONDS))
+    return ReleaseCache(store, ship_it_instance_config['api_root'], ttl)
+
+
+def invalidate_cached_release(ship_it_instance_config, release_name):
+    release_cache = get_release_cache(ship_it_instance_config)
+    if release_cache is not None:
+        release_cache.invalidate(release_name)
@@ -0,0 +1,261 @@
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from shipitscript import jsonutils
+from shipitscript.fileutils import locked, write_atomically
+
+
+log = logging.getLogger(__name__)
+
+# https://tools.ietf.org/html/rfc8305#section-8
+CONNECTION_ATTEMPT_DELAY_IN_SECONDS = 0.25
+
+
+DEFAULT_DNS_CACHE_FILE = os.path.join('~', '.cache', 'shipitscript', 'dns.json')
+DNS_CACHE_FILE_VERSION = 1
+
+
+def _get_entry_name(host, port):
+    return '{} {}'.format(host, port)
+
+
+def read_entries(path):
+    """Function to read the cached resolutions of `path`, keyed by
+    `_get_entry_name()`, as (expiration timestamp, addrinfos) tuples"""
+    try:
+        cache_file = jsonutils.load(path)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        log.warning('Ignoring corrupted DNS cache {}'.format(path))
+        return {}
+    if cache_file.get('version') != DNS_CACHE_FILE_VERSION:
+        return {}
+
+    return {
+        name: (entry['expires_at'], [
+            (socket.AddressFamily(family), socket.SocketKind(type_), proto, canonname, tuple(sockaddr))
+            for family, type_, proto, canonname, sockaddr in entry['addrinfos']
+        ])
+        for name, entry in cache_file['entries'].items()
+    }
+
+
+def write_entries(path, entries):
+    write_atomically(path, jsonutils.dumps({
+        'version': DNS_CACHE_FILE_VERSION,
+        'entries': {
+            name: {'expires_at': expires_at, 'addrinfos': [list(addrinfo) for addrinfo in addrinfos]}
+            for name, (expires_at, addrinfos) in entries.items()
+        },
+    }))
+
+
+class ResolverCache(object):
+    """Thread-safe cache of `getaddrinfo()` results, each kept `ttl` seconds.
+    With a `path`, they are persisted there too, shared by the worker
+    processes of the host: each task runs in a new process, which would
+    otherwise start with an empty cache"""
+
+    def __init__(self, path=None):
+        self.path = None if path is None else os.path.expanduser(path)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port, ttl):
+        name = _get_entry_name(host, port)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(name)
+        if (entry is None or entry[0] <= now) and self.path is not None:
+            entry = read_entries(self.path).get(name)
+        if entry is not None and entry[0] > now:
+            with self._lock:
+                self._entries[name] = entry
+            return entry[1]
+
+        addrinfos = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        log.debug('Resolved {} into {}'.format(host, [addrinfo[4][0] for addrinfo in addrinfos]))
+        entry = (now + ttl, addrinfos)
+        with self._lock:
+            self._entries[name] = entry
+        if self.path is not None:
+            self._save(name, entry, now)
+
+        return addrinfos
+
+    def _save(self, name, entry, now):
+        try:
+            with locked(self.path + '.lock'):
+                entries = {
+                    other_name: other_entry for other_name, other_entry in read_entries(self.path).items()
+                    if other_entry[0] > now
+                }
+                entries[name] = entry
+                write_entries(self.path, entries)
+        except OSError as e:
+            log.warning('Could not save the DNS cache to {}: {}'.format(self.path, e))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+# One cache per file, shared by every Ship-it client of the process
+_resolver_caches = {}
+_resolver_caches_lock = threading.Lock()
+
+
+def get_resolver_cache(path=None):
+    path = None if path is None else os.path.expanduser(path)
+    with _resolver_caches_lock:
+        if path not in _resolver_caches:
+            _resolver_caches[path] = ResolverCache(path)
+        return _resolver_caches[path]
+
+
+def clear_resolver_caches():
+    with _resolver_caches_lock:
+        _resolver_caches.clear()
+
+
+def interleave_addresses(addrinfos):
+    """Function to alternate address families, preferring the first one
+    returned by the resolver, as recommended by RFC 8305"""
+    families = []
+    addrinfos_per_family = {}
+    for addrinfo in addrinfos:
+        if addrinfo[0] not in addrinfos_per_family:
+            families.append(addrinfo[0])
+            addrinfos_per_family[addrinfo[0]] = []
+        addrinfos_per_family[addrinfo[0]].append(addrinfo)
+
+    interleaved = []
+    while any(addrinfos_per_family.values()):
+        for family in families:
+            if addrinfos_per_family[family]:
+                interleaved.append(addrinfos_per_family[family].pop(0))
+
+    return interleaved
+
+
+def _connect(addrinfo, timeout, source_address, socket_options):
+    family, socktype, proto, _, sockaddr = addrinfo
+    sock = socket.socket(family, socktype, proto)
+    try:
+        for option in socket_options or ():
+            sock.setsockopt(*option)
+        if isinstance(timeout, (int, float)):
+            sock.settimeout(timeout)
+        if source_address:
+            sock.bind(source_address)
+        sock.connect(sockaddr)
+    except BaseException:
+        sock.close()
+        raise
+
+    return sock
+
+
+def race_connections(addrinfos, timeout=None, source_address=None, socket_options=None,
+                     attempt_delay=CONNECTION_ATTEMPT_DELAY_IN_SECONDS):
+    """Function implementing Happy Eyeballs: a new connection attempt starts
+    every `attempt_delay` seconds, or as soon as the previous one failed, and
+    the first established connection wins. Late winners are closed"""
+    results = queue.Queue()
+    winner_found = threading.Event()
+
+    def attempt(addrinfo):
+        try:
+            sock = _connect(addrinfo, timeout, source_address, socket_options)
+        except OSError as e:
+            results.put((None, e))
+            return
+        if winner_found.is_set():
+            sock.close()
+        results.put((sock, None))
+
+    pending_addrinfos = list(addrinfos)
+    running_attempts = 0
+    last_error = None
+    while pending_addrinfos or running_attempts:
+        if pending_addrinfos:
+            threading.Thread(target=attempt, args=(pending_addrinfos.pop(0),), daemon=True).start()
+            running_attempts += 1
+        try:
+            sock, error = results.get(timeout=attempt_delay if pending_addrinfos else None)
+        except queue.Empty:
+            continue
+
+        running_attempts -= 1
+        if sock is not None:
+            winner_found.set()
+            if running_attempts:
+                threading.Thread(target=_close_late_connections, args=(results, running_attempts), daemon=True).start()
+            return sock
+        last_error = error
+
+    raise last_error or OSError('No address to connect to')
+
+
+def _close_late_connections(results, running_attempts):
+    for _ in range(running_attempts):
+        sock, _ = results.get()
+        if sock is not None:
+            sock.close()
+
+
+def create_connection(address, timeout=None, source_address=None, socket_options=None, ttl=60, cache_path=None):
+    """Drop-in replacement of `urllib3.util.connection.create_connection`
+    that resolves through the cache of `cache_path` and races the resolved
+    addresses"""
+    host, port = address
+    if host.startswith('['):
+        host = host.strip('[]')
+
+    addrinfos = interleave_addresses(get_resolver_cache(cache_path).resolve(host, port, ttl))
+    if len(addrinfos) == 1:
+        return _connect(addrinfos[0], timeout, source_address, socket_options)
+
+    return race_connections(addrinfos, timeout, source_address, socket_options)
+
+
+class _ResolvingConnectionMixin(object):
+    dns_cache_ttl = 60
+    dns_cache_file = None
+
+    def _new_conn(self):
+        try:
+            return create_connection(
+                (self._dns_host, self.port), self.timeout,
+                source_address=self.source_address, socket_options=self.socket_options,
+                ttl=self.dns_cache_ttl, cache_path=self.dns_cache_file,
+            )
+        except socket.timeout as e:
+            raise ConnectTimeoutError(
+                self, 'Connection to {} timed out. (connect timeout={})'.format(self.host, self.timeout)
+            ) from e
+        except OSError as e:
+            raise NewConnectionError(self, 'Failed to establish a new connection: {}'.format(e)) from e
+
+
+def get_pool_classes_by_scheme(dns_cache_ttl, dns_cache_file=None):
+    """Function to build the urllib3 pool classes whose connections resolve
+    hosts through the cache of `dns_cache_file`, keeping entries
+    `dns_cache_ttl` seconds"""
+    attributes = {'dns_cache_ttl': dns_cache_ttl, 'dns_cache_file': dns_cache_file}
+    http_connection_class = type('ResolvingHTTPConnection', (_ResolvingConnectionMixin, HTTPConnection), attributes)
+    https_connection_class = type('ResolvingHTTPSConnection', (_ResolvingConnectionMixin, HTTPSConnection), attributes)
+
+    return {
+        'http': type('ResolvingHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http_connection_class}),
+        'https': type('ResolvingHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https_connection_class}),
+    }
@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
 """ ShipIt main script
 """
+import asyncio
 import logging
 import os
 
 from scriptworker import client
+from scriptworker.constants import DEFAULT_CONFIG
 
 from shipitscript import ship_actions
+from shipitscript.cancellation import cancellable
+from shipitscript.cassette import maybe_record
+from shipitscript.l10n import get_l10n_changesets
+from shipitscript.latency import save_trackers
+from shipitscript.metrics import counting_requests
+from shipitscript.profiling import maybe_profile
+from shipitscript.tracing import Tracer
+from shipitscript.transport import clear_pools, warm_up
 from shipitscript.task import (
     validate_task_schema, get_ship_it_instance_config_from_scope,
     get_task_action,
@@ -17,13 +27,31 @@ log = logging.getLogger(__name__)
 
 
 async def async_main(context):
-    validate_task_schema(context)
-
-    context.ship_it_instance_config = get_ship_it_instance_config_from_scope(context)
-    context.action = get_task_action(context)
-
-    # action has already been validated
-    ACTION_MAP[context.action](context)
+    context.tracer = Tracer.from_context(context)
+    warm_up_future = None
+    try:
+        with cancellable(context), counting_requests(context), maybe_profile(context), maybe_record(context), \
+                context.tracer.start_span('async_main'):
+            context.ship_it_instance_config = get_ship_it_instance_config_from_scope(context)
+            if context.ship_it_instance_config.get('warm_up_connection'):
+                # connect in the background while the task is being validated
+                warm_up_future = asyncio.get_event_loop().run_in_executor(None, warm_up, context.ship_it_instance_config)
+
+            validate_task_schema(context)
+            context.action = get_task_action(context)
+
+            # action has already been validated
+            with context.tracer.start_span(context.action, attributes={'shipit.api_root': context.ship_it_instance_config['api_root']}):
+                ACTION_MAP[context.action](context)
+    finally:
+        if warm_up_future is not None:
+            # bounded by the connect timeout, warm_up() never raises
+            await warm_up_future
+        # the connection pools are shared by every Ship-it client of the task
+        clear_pools()
+        save_trackers()
+        if context.config.get('trace_file'):
+            context.tracer.export(context.config['trace_file'])
     log.info('Success!')
 
 
@@ -51,7 +79,7 @@ def mark_as_started_action(context):
         buildNumber=payload['build_number'],
         branch=payload['branch'],
         mozillaRevision=payload['revision'],
-        l10nChangesets=payload['l10n_changesets'],
+        l10nChangesets=get_l10n_changesets(context),
         partials=payload['partials'],
     )
 
@@ -73,7 +101,11 @@ def get_default_config():
 
     return {
         'work_dir': os.path.join(parent_dir, 'work_dir'),
+        'artifact_dir': os.path.join(parent_dir, 'artifact_dir'),
         'verbose': False,
+        'profile': False,
+        # the one of scriptworker, which kills the task past it
+        'task_max_timeout': DEFAULT_CONFIG['task_max_timeout'],
     }
 
 
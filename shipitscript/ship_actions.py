@@ -3,6 +3,9 @@ from datetime import datetime
 
 import shipitapi
 
+from shipitscript.l10n import expand_l10n_changesets
+from shipitscript.release_cache import invalidate_cached_release
+from shipitscript.transport import configure_api
 from shipitscript.utils import (
     get_auth_primitives, check_release_has_values
 )
@@ -17,11 +20,15 @@ def mark_as_shipped(ship_it_instance_config, release_name):
     """
     auth, api_root, timeout_in_seconds = get_auth_primitives(ship_it_instance_config)
     release_api = shipitapi.Release(auth, api_root=api_root, timeout=timeout_in_seconds)
+    configure_api(release_api, ship_it_instance_config)
     shipped_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
 
     log.info('Marking the release as shipped with {} timestamp...'.format(shipped_at))
-    release_api.update(release_name, status='shipped', shippedAt=shipped_at)
-    check_release_has_values(release_api, release_name,
+    try:
+        release_api.update(release_name, status='shipped', shippedAt=shipped_at)
+    finally:
+        invalidate_cached_release(ship_it_instance_config, release_name)
+    check_release_has_values(release_api, release_name, ship_it_instance_config,
                              status='shipped', shippedAt=shipped_at)
 
 
@@ -36,12 +43,21 @@ def mark_as_started(ship_it_instance_config, release_name, data):
     new_release = shipitapi.NewRelease(auth, api_root=api_root,
                                        timeout=timeout_in_seconds,
                                        csrf_token_prefix='{}-'.format(product))
+    configure_api(new_release, ship_it_instance_config)
     log.info('Submitting the release to Ship-it v1 ...')
-    new_release.submit(**data)
+    try:
+        # compact l10n changesets are only expanded for the submission itself
+        new_release.submit(**dict(data, l10nChangesets=expand_l10n_changesets(data['l10nChangesets'])))
+    finally:
+        invalidate_cached_release(ship_it_instance_config, release_name)
 
     log.info('Marking the release as started ...')
     release_api = shipitapi.Release(auth, api_root=api_root,
                                     timeout=timeout_in_seconds)
-    release_api.update(release_name, ready=True, complete=True, status="Started")
-    check_release_has_values(release_api, release_name,
+    configure_api(release_api, ship_it_instance_config)
+    try:
+        release_api.update(release_name, ready=True, complete=True, status="Started")
+    finally:
+        invalidate_cached_release(ship_it_instance_config, release_name)
+    check_release_has_values(release_api, release_name, ship_it_instance_config,
                              ready=True, complete=True, status="Started")
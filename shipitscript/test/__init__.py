@@ -1,8 +1,12 @@
+import contextlib
 import os
 import pytest
 
 from scriptworker.context import Context
 
+from shipitscript.test.fakeshipit import FakeShipIt
+from shipitscript.transport import clear_pools
+
 
 @pytest.fixture
 def context():
@@ -29,3 +33,30 @@ def context():
     }
 
     return context
+
+
+@contextlib.contextmanager
+def running_fake_shipit(**kwargs):
+    """FakeShipIt server. The connection pools, shared by the whole process,
+    are cleared around it so that no test reuses the connections of another"""
+    clear_pools()
+    with FakeShipIt(**kwargs) as fake_shipit:
+        yield fake_shipit
+    clear_pools()
+
+
+@pytest.fixture
+def fake_shipit():
+    with running_fake_shipit() as fake_shipit:
+        yield fake_shipit
+
+
+def get_ship_it_instance_config(api_root, **kwargs):
+    ship_it_instance_config = {
+        'api_root': api_root,
+        'timeout_in_seconds': 1,
+        'username': 'some-username',
+        'password': 'some-password',
+    }
+    ship_it_instance_config.update(kwargs)
+    return ship_it_instance_config
@@ -0,0 +1,266 @@
+"""In-process stand-in for the parts of the Ship-it v1 API shipitapi talks to"""
+import datetime
+import gzip
+import http.server
+import json
+import re
+import socketserver
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from urllib.parse import parse_qs, parse_qsl, urlsplit
+
+
+RELEASE_PATH = re.compile(r'^/releases/(?P<name>[^/?]+)$')
+
+DECOMPRESSORS = {
+    'gzip': gzip.decompress,
+    'deflate': zlib.decompress,
+}
+
+
+def _to_python(value):
+    return {'True': True, 'False': False}.get(value, value)
+
+
+class FakeShipItHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    def setup(self):
+        super().setup()
+        self.fake.record_connection()
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b'', headers=None):
+        self.fake.record_response(status)
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _read_form(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        encoding = self.headers.get('Content-Encoding')
+        if encoding:
+            body = DECOMPRESSORS[encoding](body)
+        return {key: _to_python(value) for key, value in parse_qsl(body.decode('utf-8'), keep_blank_values=True)}
+
+    def _handle(self):
+        self.fake.record_request(self.command, self.path)
+        if self.fake.latency:
+            time.sleep(self.fake.latency)
+        if not self.fake.acquire_worker():
+            # the body has to be drained to keep the connection usable
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            return self._send(503, b'Service Unavailable', {'Retry-After': '1'})
+        try:
+            self._dispatch()
+        finally:
+            self.fake.release_worker()
+
+    def _dispatch(self):
+        if not self.fake.is_authorized(self.headers):
+            return self._send(401, b'Unauthorized')
+
+        release_match = RELEASE_PATH.match(self.path)
+        if self.command == 'POST' and self.path == '/login':
+            return self._login()
+        elif self.command == 'HEAD' and self.path == '/csrf_token':
+            return self._send(200, headers={'X-CSRF-Token': self.fake.csrf_token()})
+        elif self.command == 'POST' and self.path == '/submit_release.html':
+            self.fake.submit(self._read_form())
+            return self._send(200, b'<html>Release submitted</html>', {'Content-Type': 'text/html'})
+        elif self.command == 'POST' and release_match:
+            if self.fake.update(release_match.group('name'), self._read_form()):
+                return self._send(200, b'OK')
+        elif self.command == 'GET' and self.path.startswith('/releases?') and self.fake.release_listing:
+            query = parse_qs(urlsplit(self.path).query)
+            page = self.fake.list_releases(
+                query['names'][0].split(','), int(query.get('page', ['1'])[0]), int(query.get('per_page', ['100'])[0]),
+            )
+            return self._send(200, json.dumps(page).encode('utf-8'), {'Content-Type': 'application/json'})
+        elif self.command == 'GET' and release_match:
+            release = self.fake.releases.get(release_match.group('name'))
+            if release is not None:
+                return self._send(200, json.dumps(release).encode('utf-8'), {'Content-Type': 'application/json'})
+
+        self._send(404, b'Not Found')
+
+    def _login(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        token = self.fake.login()
+        headers = {'Set-Cookie': 'session={}; HttpOnly'.format(token)}
+        if not self.fake.token_logins:
+            return self._send(200, b'OK', headers)
+        headers['Content-Type'] = 'application/json'
+        return self._send(200, json.dumps({'token': token}).encode('utf-8'), headers)
+
+    do_GET = do_HEAD = do_POST = _handle
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class FakeShipIt(object):
+    """Ship-it v1 stand-in listening on localhost. Releases are kept in
+    `releases`, every request seen in `requests`, the status codes sent in
+    `responses` and the number of accepted TCP connections in `connections`.
+
+    Server-side contention is modeled after a pool of `capacity` application
+    workers, each request holding one for `service_time` seconds. Up to
+    `backlog` requests wait for a free worker, the next ones get a 503.
+    `latency` is spent before queueing, without holding a worker"""
+
+    def __init__(self, latency=0, capacity=None, service_time=0, backlog=0):
+        self.latency = latency
+        self.capacity = capacity
+        self.service_time = service_time
+        self.backlog = backlog
+        self.releases = {}
+        self.requests = []
+        self.responses = Counter()
+        self.connections = 0
+        self.peak_waiting = 0
+        self.sessions = set()
+        self.logins = 0
+        self.password_checks = 0
+        self.token_logins = True
+        self.release_listing = True
+        self._in_flight = 0
+        self._workers = threading.BoundedSemaphore(capacity) if capacity else None
+        self._lock = threading.Lock()
+        self._server = None
+
+    @property
+    def api_root(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), FakeShipItHandler)
+        self._server.fake = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def record_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def record_request(self, method, path):
+        with self._lock:
+            self.requests.append((method, path))
+
+    def record_response(self, status):
+        with self._lock:
+            self.responses[status] += 1
+
+    def acquire_worker(self):
+        """Wait for a free application worker and hold it `service_time`
+        seconds. Returns False if the request is rejected for overload"""
+        if self._workers is not None:
+            with self._lock:
+                if self._in_flight >= self.capacity + self.backlog:
+                    return False
+                self._in_flight += 1
+                self.peak_waiting = max(self.peak_waiting, self._in_flight - self.capacity)
+            self._workers.acquire()
+        if self.service_time:
+            time.sleep(self.service_time)
+        return True
+
+    def release_worker(self):
+        if self._workers is not None:
+            self._workers.release()
+            with self._lock:
+                self._in_flight -= 1
+
+    def is_authorized(self, headers):
+        authorization = headers.get('Authorization', '')
+        if authorization.startswith('Basic '):
+            with self._lock:
+                self.password_checks += 1
+            return True
+        if authorization.startswith('Bearer '):
+            return authorization[len('Bearer '):] in self.sessions
+        cookies = dict(cookie.strip().split('=', 1) for cookie in headers.get('Cookie', '').split(';') if '=' in cookie)
+        return cookies.get('session') in self.sessions
+
+    def login(self):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self.logins += 1
+            self.sessions.add(token)
+        return token
+
+    def expire_sessions(self):
+        with self._lock:
+            self.sessions.clear()
+
+    def csrf_token(self):
+        expiry = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        return '{}##some-csrf-token'.format(expiry.strftime('%Y%m%d%H%M%S'))
+
+    def submit(self, form):
+        # every field is prefixed with the product, e.g. `firefox-version`
+        product = next(value for key, value in form.items() if key.endswith('-product'))
+        fields = {key[len(product) + 1:]: value for key, value in form.items() if key.startswith(product + '-')}
+        name = '{}-{}-build{}'.format(product.capitalize(), fields['version'], fields['buildNumber'])
+        with self._lock:
+            self.releases[name] = dict(
+                name=name,
+                product=product,
+                version=fields['version'],
+                buildNumber=int(fields['buildNumber']),
+                branch=fields['branch'],
+                mozillaRevision=fields['mozillaRevision'],
+                l10nChangesets=fields['l10nChangesets'],
+                partials=fields['partials'],
+                submittedAt=datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S+00:00'),
+                status='Pending',
+                ready=False,
+                complete=False,
+                shippedAt=None,
+            )
+
+    def update(self, name, form):
+        with self._lock:
+            if name not in self.releases:
+                return False
+            self.releases[name].update((key, value) for key, value in form.items() if not key.endswith('csrf_token'))
+            return True
+
+    def list_releases(self, names, page, per_page):
+        with self._lock:
+            releases = [dict(self.releases[name]) for name in names if name in self.releases]
+        start = (page - 1) * per_page
+        return {
+            'releases': releases[start:start + per_page],
+            'next_page': page + 1 if start + per_page < len(releases) else None,
+        }
+
+    def add_release(self, name, **fields):
+        release = dict(name=name, status='Pending', ready=False, complete=False, shippedAt=None)
+        release.update(fields)
+        self.releases[name] = release
+        return release
@@ -1,3 +1,4 @@
+import json
 import os
 import tempfile
 import shipitapi
@@ -86,7 +87,7 @@ def test_main_mark_release_as_shipped(monkeypatch):
         'shippedAt': '2018-01-22 17:59:59'
     }
     attrs = {
-        'getRelease.return_value': release_info
+        'request.return_value.content': json.dumps(release_info)
     }
     release_instance_mock.configure_mock(**attrs)
     ReleaseClassMock.side_effect = lambda *args, **kwargs: release_instance_mock
@@ -118,6 +119,7 @@ def test_main_mark_release_as_shipped(monkeypatch):
     )
 
 
+@freeze_time('2018-01-22 17:59:59')
 def test_main_mark_release_as_started(monkeypatch):
     ReleaseClassMock = MagicMock()
     NewReleaseClassMock = MagicMock()
@@ -128,7 +130,7 @@ def test_main_mark_release_as_started(monkeypatch):
         'complete': True,
     }
     attrs = {
-        'getRelease.return_value': release_info
+        'request.return_value.content': json.dumps(release_info)
     }
     release_instance_mock.configure_mock(**attrs)
     new_release_instance_mock = MagicMock()
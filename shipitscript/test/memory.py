@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""tracemalloc harness measuring the memory every action of ACTION_MAP needs
+when run end to end, through `async_main`, with realistic payloads, against
+a FakeShipIt running in another process
+
+    python -m shipitscript.test.memory [--update-baselines]
+"""
+import argparse
+import asyncio
+import contextlib
+import gc
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import tracemalloc
+
+from scriptworker.context import Context
+
+from shipitscript import jsonutils, script
+from shipitscript.test.fakeshipit import FakeShipIt
+from shipitscript.transport import clear_pools
+
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+data_dir = os.path.join(os.path.dirname(this_dir), 'data')
+BASELINES_PATH = os.path.join(this_dir, 'memory_baselines.json')
+
+# Peak memory may grow by this much before tests fail
+BASELINE_TOLERANCE = 0.2
+
+SERVER_SCOPE = 'project:releng:ship-it:server:dev'
+RELEASE_NAME = 'Firefox-62.0b3-build1'
+LOCALES = 250
+PARTIALS = 40
+
+# Actions needing the release to be submitted first
+PREREQUISITE_ACTIONS = {
+    'mark-as-shipped': 'mark-as-started',
+}
+
+
+def get_python_version():
+    return '{}.{}'.format(*sys.version_info[:2])
+
+
+def _serve_fake_shipit(connection):
+    with FakeShipIt() as fake_shipit:
+        connection.send(fake_shipit.api_root)
+        connection.recv()
+
+
+@contextlib.contextmanager
+def fake_shipit_process():
+    """FakeShipIt running in a child process, so that its allocations are
+    left out. Yields its `api_root`"""
+    multiprocessing_context = multiprocessing.get_context('spawn')
+    connection, child_connection = multiprocessing_context.Pipe()
+    process = multiprocessing_context.Process(target=_serve_fake_shipit, args=(child_connection,), daemon=True)
+    process.start()
+    try:
+        yield connection.recv()
+    finally:
+        connection.send('stop')
+        process.join()
+
+
+def make_context(action, api_root, work_dir):
+    context = Context()
+    context.config = {
+        'work_dir': work_dir,
+        'artifact_dir': os.path.join(work_dir, 'artifacts'),
+        'mark_as_shipped_schema_file': os.path.join(data_dir, 'mark_as_shipped_task_schema.json'),
+        'mark_as_started_schema_file': os.path.join(data_dir, 'mark_as_started_task_schema.json'),
+        'ship_it_instances': {
+            SERVER_SCOPE: {
+                'api_root': api_root,
+                'timeout_in_seconds': 10,
+                'username': 'some-username',
+                'password': 'some-password',
+            },
+        },
+        'taskcluster_scope_prefix': 'project:releng:ship-it:',
+    }
+    payload = {'release_name': RELEASE_NAME}
+    if action == 'mark-as-started':
+        payload.update(
+            product='firefox',
+            version='62.0b3',
+            build_number=1,
+            branch='releases/mozilla-beta',
+            revision='a' * 40,
+            l10n_changesets=''.join('locale{} {:040x}\n'.format(i, i) for i in range(LOCALES)),
+            partials=','.join('61.0b{}build1'.format(i) for i in range(1, PARTIALS + 1)),
+        )
+    context.task = {
+        'taskGroupId': 'IKw4rShNS4CUJ2X0mx2zOg',
+        'dependencies': ['someTaskId'],
+        'scopes': [SERVER_SCOPE, 'project:releng:ship-it:action:{}'.format(action)],
+        'payload': payload,
+    }
+    return context
+
+
+def run_action(action, api_root, work_dir):
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(script.async_main(make_context(action, api_root, work_dir)))
+    finally:
+        loop.close()
+
+
+def _warm_up(action, api_root, work_dir):
+    """Run the action untraced once, so that lazy imports and caches don't
+    count. Connections are dropped, as in a new worker process"""
+    if action in PREREQUISITE_ACTIONS:
+        run_action(PREREQUISITE_ACTIONS[action], api_root, work_dir)
+    run_action(action, api_root, work_dir)
+    clear_pools()
+    gc.collect()
+
+
+def measure_peak(action, api_root, work_dir):
+    """Function to measure the peak memory allocated while running `action`,
+    in bytes"""
+    _warm_up(action, api_root, work_dir)
+    tracemalloc.start()
+    try:
+        run_action(action, api_root, work_dir)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        clear_pools()
+
+    return peak
+
+
+def top_allocation_sites(action, api_root, work_dir, limit=10, interval=0.002):
+    """Function to grab the biggest allocation sites close to the peak. A
+    thread snapshots the traces whenever the traced memory reaches a new
+    high, which inflates the peak: use `measure_peak()` for the peak
+    itself"""
+    _warm_up(action, api_root, work_dir)
+    highest = {'memory': 0, 'snapshot': None}
+    done = threading.Event()
+
+    def monitor():
+        while not done.wait(interval):
+            current, _ = tracemalloc.get_traced_memory()
+            if current > highest['memory']:
+                highest['memory'] = current
+                highest['snapshot'] = tracemalloc.take_snapshot()
+
+    tracemalloc.start(25)
+    thread = threading.Thread(target=monitor, daemon=True)
+    thread.start()
+    try:
+        run_action(action, api_root, work_dir)
+    finally:
+        done.set()
+        thread.join()
+        tracemalloc.stop()
+        clear_pools()
+
+    if highest['snapshot'] is None:
+        return []
+    snapshot = highest['snapshot'].filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, threading.__file__),
+    ))
+    return snapshot.statistics('traceback')[:limit]
+
+
+def load_baselines():
+    try:
+        return jsonutils.load(BASELINES_PATH)
+    except FileNotFoundError:
+        return {}
+
+
+def save_baselines(baselines):
+    jsonutils.dump(baselines, BASELINES_PATH, sort_keys=True, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--update-baselines', action='store_true',
+                        help='record the measured peaks as the baselines of the current Python version')
+    parser.add_argument('--top', type=int, default=5, help='allocation sites to show per action')
+    args = parser.parse_args()
+
+    baselines = load_baselines()
+    python_version = get_python_version()
+    peaks = {}
+    with fake_shipit_process() as api_root, tempfile.TemporaryDirectory() as work_dir:
+        for action in sorted(script.ACTION_MAP):
+            peaks[action] = measure_peak(action, api_root, work_dir)
+            baseline = baselines.get(python_version, {}).get(action)
+            print('{}: peak {:.1f} KiB (baseline {})'.format(
+                action, peaks[action] / 1024, 'none' if baseline is None else '{:.1f} KiB'.format(baseline / 1024),
+            ))
+            for statistic in top_allocation_sites(action, api_root, work_dir, limit=args.top):
+                print('  {:.1f} KiB in {} blocks'.format(statistic.size / 1024, statistic.count))
+                for line in statistic.traceback.format(limit=4, most_recent_first=True):
+                    print('    {}'.format(line))
+
+    if args.update_baselines:
+        baselines[python_version] = peaks
+        save_baselines(baselines)
+        print('Updated the Python {} baselines in {}'.format(python_version, BASELINES_PATH))
+
+
+__name__ == '__main__' and main()
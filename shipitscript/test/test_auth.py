@@ -0,0 +1,156 @@
+import os
+import pytest
+import stat
+from unittest.mock import MagicMock
+
+import requests
+import shipitapi
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+from shipitscript.auth import SessionAuth, apply_session, read_session, write_session
+from shipitscript.ship_actions import mark_as_shipped
+from shipitscript.test import get_ship_it_instance_config, running_fake_shipit
+from shipitscript.transport import configure_api
+
+
+@pytest.fixture
+def fake_shipit():
+    with running_fake_shipit() as fake_shipit:
+        fake_shipit.add_release('Firefox-59.0b3-build1', status='shipped')
+        yield fake_shipit
+
+
+def _get_release(fake_shipit, session_auth):
+    release_api = shipitapi.Release(session_auth, api_root=fake_shipit.api_root, timeout=1)
+    configure_api(release_api, {})
+    return release_api.getRelease('Firefox-59.0b3-build1')
+
+
+def _session_auth(fake_shipit, cache_dir):
+    return SessionAuth('some-username', 'some-password', fake_shipit.api_root, '/login', cache_dir=str(cache_dir), timeout=1)
+
+
+@pytest.mark.parametrize('token_logins', (True, False))
+def test_session_auth_logs_in_once(fake_shipit, tmpdir, token_logins):
+    fake_shipit.token_logins = token_logins
+    # one SessionAuth per worker process, sharing the cache directory
+    for _ in range(3):
+        session_auth = _session_auth(fake_shipit, tmpdir)
+        for _ in range(2):
+            assert _get_release(fake_shipit, session_auth)['status'] == 'shipped'
+
+    assert fake_shipit.logins == 1
+    # only the login checked the password
+    assert fake_shipit.password_checks == 1
+    assert stat.S_IMODE(os.stat(session_auth.cache_path).st_mode) == 0o600
+
+
+def test_session_auth_logs_in_again_on_401(fake_shipit, tmpdir):
+    session_auth = _session_auth(fake_shipit, tmpdir)
+    _get_release(fake_shipit, session_auth)
+    old_session = read_session(session_auth.cache_path)
+
+    fake_shipit.expire_sessions()
+    assert _get_release(fake_shipit, session_auth)['status'] == 'shipped'
+    assert fake_shipit.logins == 2
+    assert read_session(session_auth.cache_path) != old_session
+    assert fake_shipit.requests[-3:] == [
+        ('GET', '/releases/Firefox-59.0b3-build1'),
+        ('POST', '/login'),
+        ('GET', '/releases/Firefox-59.0b3-build1'),
+    ]
+
+    # another process whose session is stale picks the new one from the disk
+    stale_session_auth = _session_auth(fake_shipit, tmpdir)
+    stale_session_auth._session = old_session
+    _get_release(fake_shipit, stale_session_auth)
+    assert fake_shipit.logins == 2
+
+
+def test_session_auth_retries_once(fake_shipit, tmpdir, monkeypatch):
+    session_auth = _session_auth(fake_shipit, tmpdir)
+    monkeypatch.setattr(fake_shipit, 'is_authorized', lambda headers: 'Basic' in headers.get('Authorization', ''))
+    with pytest.raises(requests.HTTPError, match='401'):
+        release_api = shipitapi.Release(session_auth, api_root=fake_shipit.api_root, timeout=1, retry_attempts=1)
+        release_api.getRelease('Firefox-59.0b3-build1')
+    assert fake_shipit.logins == 2
+
+
+def test_session_auth_failed_login(fake_shipit, tmpdir, monkeypatch):
+    monkeypatch.setattr(fake_shipit, 'is_authorized', lambda headers: False)
+    with pytest.raises(ScriptWorkerTaskException, match='rejected with a 401'):
+        _session_auth(fake_shipit, tmpdir).get_session()
+    assert not os.path.exists(_session_auth(fake_shipit, tmpdir).cache_path)
+
+
+def test_session_auth_failed_login_is_not_retried(fake_shipit, tmpdir, monkeypatch):
+    monkeypatch.setattr(fake_shipit, 'is_authorized', lambda headers: False)
+    release_api = shipitapi.Release(_session_auth(fake_shipit, tmpdir), api_root=fake_shipit.api_root, timeout=1)
+    with pytest.raises(ScriptWorkerTaskException, match='rejected with a 401'):
+        release_api.getRelease('Firefox-59.0b3-build1')
+    assert fake_shipit.requests == [('POST', '/login')]
+
+
+@pytest.mark.parametrize('status', (500, 403))
+def test_session_auth_login_status(tmpdir, status):
+    session = MagicMock()
+    session.post.return_value = requests.Response()
+    session.post.return_value.status_code = status
+    session_auth = SessionAuth('some-username', 'some-password', 'http://ship-it.tld', '/login', cache_dir=str(tmpdir),
+                               session=session, verify='/some/ca/bundle.pem')
+    with pytest.raises(requests.HTTPError if status == 500 else ScriptWorkerTaskException):
+        session_auth.get_session()
+    session.post.assert_called_once_with(
+        'http://ship-it.tld/login', auth=('some-username', 'some-password'), timeout=60, verify='/some/ca/bundle.pem',
+    )
+
+
+def test_session_auth_no_session(tmpdir):
+    response = MagicMock(headers={'Content-Type': 'text/html'}, status_code=200)
+    response.cookies.get_dict.return_value = {}
+    session = MagicMock()
+    session.post.return_value = response
+    session_auth = SessionAuth('some-username', 'some-password', 'http://ship-it.tld', '/login', cache_dir=str(tmpdir),
+                               session=session)
+    with pytest.raises(ScriptWorkerTaskException, match='neither a token nor a cookie'):
+        session_auth.get_session()
+
+
+def test_mark_as_shipped_with_session(fake_shipit, tmpdir):
+    ship_it_instance_config = get_ship_it_instance_config(
+        fake_shipit.api_root, login_path='/login', session_cache_dir=str(tmpdir),
+    )
+    for _ in range(2):
+        mark_as_shipped(ship_it_instance_config, 'Firefox-59.0b3-build1')
+
+    assert fake_shipit.logins == 1
+    assert fake_shipit.password_checks == 1
+
+
+@pytest.mark.parametrize('session, headers, expected_headers', (
+    ({'token': 'abc', 'cookies': {}}, {}, {'Authorization': 'Bearer abc'}),
+    ({'token': None, 'cookies': {'session': 'abc', 'other': 'def'}}, {}, {'Cookie': 'other=def; session=abc'}),
+    ({'token': None, 'cookies': {'session': 'abc'}}, {'Cookie': 'existing=1'}, {'Cookie': 'existing=1; session=abc'}),
+))
+def test_apply_session(session, headers, expected_headers):
+    request = requests.Request('GET', 'http://ship-it.tld', headers=headers).prepare()
+    apply_session(request, session)
+    for key, value in expected_headers.items():
+        assert request.headers[key] == value
+
+
+def test_read_session(tmpdir):
+    path = str(tmpdir.join('sessions', 'session.json'))
+    assert read_session(path) is None
+
+    write_session(path, {'token': 'abc', 'cookies': {}})
+    assert read_session(path) == {'token': 'abc', 'cookies': {}}
+    assert stat.S_IMODE(os.stat(os.path.dirname(path)).st_mode) == 0o700
+
+    os.chmod(path, 0o644)
+    assert read_session(path) is None
+
+    os.chmod(path, 0o600)
+    with open(path, 'w') as f:
+        f.write('{corrupted')
+    assert read_session(path) is None
@@ -0,0 +1,204 @@
+import os
+import pytest
+import signal
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import arrow
+import shipitapi
+from scriptworker.constants import STATUSES
+
+from shipitscript import cancellation as cancellation_module
+from shipitscript import script
+from shipitscript.cancellation import (
+    DEADLINE_MARGIN_IN_SECONDS, REASON_DEADLINE, CallCancellation, Cancellation, DeadlineExceeded, TaskCancelled,
+    cancellable, cancellation_scope, current_cancellation, get_deadline,
+)
+from shipitscript.test import context, get_ship_it_instance_config, running_fake_shipit
+from shipitscript.transport import configure_api
+from shipitscript.utils import get_release_info
+
+
+assert context  # silence pyflakes
+
+RELEASE_NAME = 'Firefox-59.0b3-build1'
+
+
+@pytest.fixture(autouse=True)
+def task_starting_now(monkeypatch):
+    # the run time of the task is counted from the start of the process
+    monkeypatch.setattr(cancellation_module, 'get_process_start', time.monotonic)
+
+
+@pytest.mark.parametrize('task, max_timeout, expected', (
+    ({'payload': {}}, None, None),
+    ({'payload': {}}, 1200, 990 + 1200 - DEADLINE_MARGIN_IN_SECONDS),
+    ({'payload': {'maxRunTime': 600}}, None, 990 + 600 - DEADLINE_MARGIN_IN_SECONDS),
+    ({'payload': {'maxRunTime': 600}}, 300, 990 + 300 - DEADLINE_MARGIN_IN_SECONDS),
+    ({'payload': {'maxRunTime': 20}}, 1200, 990 + 20 - 2),
+    ({'payload': {}, 'deadline': '2018-01-22T18:00:59Z'}, None, 1000 + 60 - DEADLINE_MARGIN_IN_SECONDS),
+    ({'payload': {'maxRunTime': 600}, 'deadline': '2018-01-22T18:00:59Z'}, 1200, 1000 + 60 - DEADLINE_MARGIN_IN_SECONDS),
+    ({'payload': {'maxRunTime': 30}, 'deadline': '2018-01-22T18:00:59Z'}, None, 990 + 30 - 3),
+    ({'payload': {}, 'deadline': '2018-01-22T17:58:59Z'}, None, 1000 - 60),
+))
+def test_get_deadline(monkeypatch, task, max_timeout, expected):
+    monkeypatch.setattr(arrow, 'utcnow', lambda: arrow.get('2018-01-22T17:59:59Z'))
+    assert get_deadline(task, max_timeout, started_at=990, now=1000) == expected
+
+
+def test_get_process_start():
+    output = subprocess.check_output([sys.executable, '-c', textwrap.dedent("""
+        import time
+        time.sleep(0.5)
+        from shipitscript.cancellation import get_process_start
+        print(time.monotonic() - get_process_start())
+    """)], cwd=os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+    assert 0.5 <= float(output) < 5
+
+
+@pytest.mark.parametrize('remaining, timeout, expected', (
+    (None, 10, 10),
+    (None, None, None),
+    (5, 10, 5),
+    (5, 2, 2),
+    (5, None, 5),
+    (5, '10', 5),
+    (5, (2, 10), (2, 5)),
+    (5, (None, 2), (5, 2)),
+    (-1, 10, 0.001),
+))
+def test_cancellation_get_timeout(remaining, timeout, expected):
+    cancellation = Cancellation(None if remaining is None else time.monotonic() + remaining)
+    assert cancellation.get_timeout(timeout) == pytest.approx(expected, abs=0.01)
+
+
+def test_cancellation_check():
+    cancellation = Cancellation(time.monotonic() + 60)
+    cancellation.check()
+
+    cancellation.cancel('SIGTERM')
+    cancellation.cancel(REASON_DEADLINE)
+    with pytest.raises(TaskCancelled) as excinfo:
+        cancellation.check()
+    assert not isinstance(excinfo.value, DeadlineExceeded)
+    assert excinfo.value.exit_code == STATUSES['worker-shutdown']
+
+    cancellation = Cancellation(time.monotonic() - 1)
+    with pytest.raises(DeadlineExceeded) as excinfo:
+        cancellation.check()
+    assert excinfo.value.exit_code == STATUSES['intermittent-task']
+
+
+def test_call_cancellation():
+    task_cancellation = Cancellation(time.monotonic() + 60)
+    call_cancellation = CallCancellation(parent=task_cancellation)
+    assert call_cancellation.get_timeout(None) == pytest.approx(60, abs=1)
+
+    with cancellation_scope(call_cancellation):
+        assert current_cancellation() is call_cancellation
+    assert current_cancellation() is None
+
+    call_cancellation.cancel('hedged getRelease lost')
+    assert not task_cancellation.cancelled
+    with pytest.raises(TaskCancelled, match='hedged getRelease lost'):
+        call_cancellation.check()
+
+    call_cancellation = CallCancellation(parent=task_cancellation)
+    task_cancellation.cancel(REASON_DEADLINE)
+    with pytest.raises(DeadlineExceeded):
+        call_cancellation.check()
+
+
+@pytest.fixture
+def slow_shipit():
+    with running_fake_shipit() as fake_shipit:
+        fake_shipit.add_release(RELEASE_NAME, status='shipped')
+        yield fake_shipit
+        # let the pending responses go
+        fake_shipit.latency = 0
+
+
+def _get_release_api(fake_shipit, ship_it_instance_config=None):
+    ship_it_instance_config = ship_it_instance_config or {'api_root': fake_shipit.api_root}
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=30)
+    return configure_api(release_api, ship_it_instance_config)
+
+
+def test_cancellable_aborts_calls_past_the_deadline(context, slow_shipit):
+    release_api = _get_release_api(slow_shipit)
+    slow_shipit.latency = 30
+    context.task['payload']['maxRunTime'] = 1
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        with cancellable(context):
+            release_api.getRelease(RELEASE_NAME)
+    assert time.monotonic() - start < 5
+    assert cancellation_module.current_cancellation() is None
+
+
+def test_cancellable_aborts_calls_on_sigterm(context, slow_shipit):
+    release_api = _get_release_api(slow_shipit)
+    release_api.getRelease(RELEASE_NAME)
+    slow_shipit.latency = 30
+    previous_handler = signal.getsignal(signal.SIGTERM)
+
+    # the signal may be handled by any thread, not only the blocked one
+    timer = threading.Timer(0.5, os.kill, args=(os.getpid(), signal.SIGTERM))
+    start = time.monotonic()
+    with pytest.raises(TaskCancelled) as excinfo:
+        with cancellable(context):
+            timer.start()
+            release_api.getRelease(RELEASE_NAME)
+    assert time.monotonic() - start < 5
+    assert 'SIGTERM' in str(excinfo.value)
+    assert signal.getsignal(signal.SIGTERM) == previous_handler
+
+    # later tasks aren't affected
+    slow_shipit.latency = 0
+    with cancellable(context):
+        assert release_api.getRelease(RELEASE_NAME)['status'] == 'shipped'
+
+
+def test_cancellable_raises_on_exit_once_cancelled(context):
+    with pytest.raises(TaskCancelled) as excinfo:
+        with cancellable(context) as cancellation:
+            os.kill(os.getpid(), signal.SIGTERM)
+            for _ in range(100):
+                if cancellation.cancelled:
+                    break
+                time.sleep(0.05)
+    assert 'SIGTERM' in str(excinfo.value)
+
+    with cancellable(context):
+        pass
+
+
+def test_cancellable_aborts_hedged_calls(context, slow_shipit):
+    ship_it_instance_config = get_ship_it_instance_config(
+        slow_shipit.api_root, timeout_in_seconds=30, hedge_delay_in_seconds=0.1,
+    )
+    release_api = _get_release_api(slow_shipit, ship_it_instance_config)
+    slow_shipit.latency = 30
+    context.task['payload']['maxRunTime'] = 1
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        with cancellable(context):
+            get_release_info(release_api, RELEASE_NAME, ship_it_instance_config)
+    assert time.monotonic() - start < 5
+
+
+@pytest.mark.asyncio
+async def test_async_main_exits_on_deadline(context, slow_shipit):
+    context.config['ship_it_instances']['project:releng:ship-it:server:dev']['api_root'] = slow_shipit.api_root
+    context.task['scopes'].append('project:releng:ship-it:action:mark-as-shipped')
+    context.task['payload']['maxRunTime'] = 1
+    slow_shipit.latency = 30
+
+    with pytest.raises(DeadlineExceeded) as excinfo:
+        await script.async_main(context)
+    assert excinfo.value.exit_code == STATUSES['intermittent-task']
@@ -0,0 +1,149 @@
+import os
+import pytest
+import time
+from unittest.mock import MagicMock
+
+import requests
+
+from shipitscript.cassette import (
+    CASSETTE_VERSION, Recorder, ReplayServer, decode_body, load_cassette, maybe_record, recording,
+)
+from shipitscript.ship_actions import mark_as_started
+from shipitscript.test import get_ship_it_instance_config, running_fake_shipit
+from shipitscript.transport import clear_pools
+
+this_dir = os.path.dirname(os.path.realpath(__file__))
+MARK_AS_STARTED_CASSETTE = os.path.join(this_dir, 'cassettes', 'mark_as_started.json')
+
+RELEASE_NAME = 'Firefox-62.0b3-build1'
+RELEASE_DATA = dict(
+    product='firefox',
+    version='62.0b3',
+    buildNumber=1,
+    branch='releases/mozilla-beta',
+    mozillaRevision='a' * 40,
+    l10nChangesets=''.join('locale{} {:040x}\n'.format(i, i % 3) for i in range(100)),
+    partials='61.0b1build1,61.0b2build1',
+)
+
+
+@pytest.fixture(autouse=True)
+def pools():
+    clear_pools()
+    yield
+    clear_pools()
+
+
+def _ship_it_instance_config(api_root):
+    return get_ship_it_instance_config(api_root, timeout_in_seconds=5, request_compression='gzip')
+
+
+def _request_sequence(cassette):
+    return [(interaction['request']['method'], interaction['request']['path']) for interaction in cassette['interactions']]
+
+
+def test_record_and_replay(tmpdir):
+    cassette_path = str(tmpdir.join('cassette.json'))
+    with running_fake_shipit(latency=0.05) as fake_shipit:
+        with recording(cassette_path):
+            mark_as_started(_ship_it_instance_config(fake_shipit.api_root), RELEASE_NAME, RELEASE_DATA)
+        recorded_requests = list(fake_shipit.requests)
+
+    cassette = load_cassette(cassette_path)
+    assert _request_sequence(cassette) == recorded_requests
+    for interaction in cassette['interactions']:
+        assert interaction['duration'] >= 0.05
+        assert 'Authorization' not in interaction['request']['headers']
+    starts = [interaction['start'] for interaction in cassette['interactions']]
+    assert starts == sorted(starts)
+    # the compressed submit body isn't valid utf-8
+    submit = cassette['interactions'][1]['request']
+    assert submit['encoding'] == 'base64'
+    assert submit['headers']['Content-Encoding'] == 'gzip'
+
+    # the same action against the recording
+    with ReplayServer(cassette, time_scale=0) as server:
+        mark_as_started(_ship_it_instance_config(server.api_root), RELEASE_NAME, RELEASE_DATA)
+    assert server.requests == recorded_requests
+    assert server.unmatched == server.unconsumed == []
+
+
+@pytest.mark.parametrize('time_scale', (1, 0.5))
+def test_mark_as_started_replay(time_scale):
+    """Replays a recorded mark-as-started at the (scaled) recorded speed. It
+    must make the recorded requests, no more, in the same order"""
+    cassette = load_cassette(MARK_AS_STARTED_CASSETTE)
+    recorded_duration = sum(interaction['duration'] for interaction in cassette['interactions']) * time_scale
+
+    with ReplayServer(cassette, time_scale=time_scale) as server:
+        start = time.monotonic()
+        mark_as_started(_ship_it_instance_config(server.api_root), RELEASE_NAME, RELEASE_DATA)
+        elapsed = time.monotonic() - start
+
+    assert server.requests == _request_sequence(cassette)
+    assert server.unmatched == server.unconsumed == []
+    assert elapsed >= recorded_duration
+
+
+def test_replay_server_answers():
+    cassette = {'version': CASSETTE_VERSION, 'interactions': [
+        {'start': 0, 'duration': 0, 'request': {'method': 'GET', 'path': '/releases/a', 'headers': {}, 'body': None, 'encoding': None},
+         'response': {'status': 200, 'headers': {'Content-Type': 'text/plain', 'Date': 'recorded'}, 'body': 'first', 'encoding': 'utf-8'}},
+        {'start': 0, 'duration': 0, 'request': {'method': 'GET', 'path': '/releases/a', 'headers': {}, 'body': None, 'encoding': None},
+         'response': {'status': 503, 'headers': {}, 'body': 'c2Vjb25k', 'encoding': 'base64'}},
+    ]}
+    with ReplayServer(cassette, time_scale=0) as server:
+        response = requests.get(server.api_root + '/releases/a')
+        assert (response.status_code, response.text) == (200, 'first')
+        assert response.headers['Date'] != 'recorded'
+        assert server.unconsumed == [('GET', '/releases/a')]
+
+        responses = [requests.get(server.api_root + '/releases/a') for _ in range(2)]
+        assert [response.status_code for response in responses] == [503, 404]
+        assert responses[0].text == 'second'
+        assert server.unconsumed == []
+
+        assert requests.get(server.api_root + '/releases/b').status_code == 404
+        assert server.requests == [('GET', '/releases/a')] * 3 + [('GET', '/releases/b')]
+        assert server.unmatched == [('GET', '/releases/a'), ('GET', '/releases/b')]
+
+
+@pytest.mark.parametrize('entry, expected', (
+    ({'body': None, 'encoding': None}, b''),
+    ({'body': 'é', 'encoding': 'utf-8'}, 'é'.encode('utf-8')),
+    ({'body': '/w==', 'encoding': 'base64'}, b'\xff'),
+))
+def test_decode_body(entry, expected):
+    assert decode_body(entry) == expected
+
+
+def test_recorder_filters_headers():
+    request = requests.Request('POST', 'http://ship-it.tld/releases/a?b=c', data={'status': 'shipped'},
+                               headers={'Authorization': 'Basic secret', 'Cookie': 'session=secret'}).prepare()
+    response = MagicMock(status_code=200, content=b'OK', headers={'Set-Cookie': 'session=secret', 'Content-Length': '2', 'X-Custom': '1'})
+    recorder = Recorder()
+    recorder.record(request, response, start=time.monotonic())
+
+    interaction = recorder.to_cassette()['interactions'][0]
+    assert interaction['request']['path'] == '/releases/a?b=c'
+    assert interaction['request']['body'] == 'status=shipped'
+    assert 'secret' not in str(interaction)
+    assert interaction['response']['headers'] == {'X-Custom': '1'}
+
+
+def test_maybe_record(tmpdir):
+    context = MagicMock(config={})
+    with maybe_record(context):
+        pass
+
+    context.config['cassette_file'] = str(tmpdir.join('cassette.json'))
+    with maybe_record(context):
+        pass
+    assert load_cassette(context.config['cassette_file']) == {'version': CASSETTE_VERSION, 'interactions': []}
+
+
+def test_load_cassette_version(tmpdir):
+    path = tmpdir.join('cassette.json')
+    path.write('{"version": 0, "interactions": []}')
+    with pytest.raises(ValueError, match='version 0'):
+        load_cassette(str(path))
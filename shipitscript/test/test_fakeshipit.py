@@ -0,0 +1,33 @@
+import concurrent.futures
+import time
+
+import requests
+
+from shipitscript.test.fakeshipit import FakeShipIt
+
+
+def _get_releases(fake_shipit, count):
+    def get_release(_):
+        response = requests.get(fake_shipit.api_root + '/releases/Firefox-59.0b3-build1', auth=('some-username', 'some-password'))
+        return response.status_code
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=count) as executor:
+        return sorted(executor.map(get_release, range(count)))
+
+
+def test_contention_queues_requests():
+    with FakeShipIt(capacity=1, service_time=0.1, backlog=3) as fake_shipit:
+        fake_shipit.add_release('Firefox-59.0b3-build1')
+        start = time.monotonic()
+        assert _get_releases(fake_shipit, 4) == [200] * 4
+        # requests are served one at a time
+        assert time.monotonic() - start >= 0.4
+        assert fake_shipit.peak_waiting == 3
+        assert fake_shipit.responses == {200: 4}
+
+
+def test_contention_rejects_overload():
+    with FakeShipIt(capacity=2, service_time=0.2, backlog=1) as fake_shipit:
+        fake_shipit.add_release('Firefox-59.0b3-build1')
+        assert _get_releases(fake_shipit, 5) == [200, 200, 200, 503, 503]
+        assert fake_shipit.responses == {200: 3, 503: 2}
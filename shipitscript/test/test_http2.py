@@ -0,0 +1,143 @@
+import gzip
+import json
+import pytest
+
+import requests
+import shipitapi
+
+from shipitscript import http2
+from shipitscript.ship_actions import mark_as_shipped
+from shipitscript.test import fake_shipit, get_ship_it_instance_config
+from shipitscript.transport import configure_api
+from shipitscript.utils import get_release_values
+
+pytestmark = pytest.mark.skipif(not http2.HTTP2_AVAILABLE, reason='httpx and h2 are not installed')
+
+if http2.HTTP2_AVAILABLE:
+    import httpx
+
+assert fake_shipit  # silence pyflakes
+
+
+@pytest.fixture
+def mock_client(monkeypatch):
+    requests_seen = []
+
+    def handler(request):
+        requests_seen.append(request)
+        if request.url.path == '/releases/Firefox-59.0b3-build1':
+            body = gzip.compress(json.dumps({'status': 'shipped'}).encode('utf-8'))
+            return httpx.Response(200, content=body, headers={'Content-Encoding': 'gzip', 'Content-Type': 'application/json'})
+        return httpx.Response(404, content=b'Not found')
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    client.requests_seen = requests_seen
+    monkeypatch.setattr(http2, 'get_client', lambda url, verify=True: client)
+    yield client
+    client.close()
+
+
+def test_get_client():
+    try:
+        client = http2.get_client('https://some-ship-it.url/releases/Firefox-59.0b3-build1')
+        assert http2.get_client('https://some-ship-it.url/csrf_token') is client
+        assert http2.get_client('https://some-other-ship-it.url/csrf_token') is not client
+        assert http2.get_client('https://some-ship-it.url/csrf_token', verify=False) is not client
+    finally:
+        http2.close_clients()
+    assert http2._clients == {}
+
+
+def test_send(mock_client):
+    request = requests.Request('GET', 'https://some-ship-it.url/releases/Firefox-59.0b3-build1', headers={'traceparent': 'some-traceparent'}).prepare()
+    response = http2.send(request, timeout=(1, 2))
+
+    assert isinstance(response, requests.Response)
+    assert response.status_code == 200
+    assert response.json() == {'status': 'shipped'}
+    assert 'Content-Encoding' not in response.headers
+    assert response.request is request
+    assert mock_client.requests_seen[0].headers['traceparent'] == 'some-traceparent'
+
+
+def test_send_strips_hop_by_hop_headers(mock_client):
+    request = requests.Request('GET', 'https://some-ship-it.url/releases/Firefox-59.0b3-build1', headers={
+        'Connection': 'keep-alive, X-Some-Hop',
+        'Keep-Alive': 'timeout=5',
+        'Proxy-Connection': 'keep-alive',
+        'Transfer-Encoding': 'chunked',
+        'Upgrade': 'h2c',
+        'X-Some-Hop': 'some-value',
+        'traceparent': 'some-traceparent',
+    }).prepare()
+    assert http2.get_headers(request) == {'traceparent': 'some-traceparent'}
+
+    http2.send(request, timeout=1)
+    headers = mock_client.requests_seen[0].headers
+    for header in ('Keep-Alive', 'Proxy-Connection', 'Transfer-Encoding', 'Upgrade', 'X-Some-Hop'):
+        assert header not in headers
+    assert headers['traceparent'] == 'some-traceparent'
+
+
+def test_send_refuses_streamed_requests(mock_client):
+    request = requests.Request('GET', 'https://some-ship-it.url/releases/Firefox-59.0b3-build1').prepare()
+    with pytest.raises(ValueError):
+        http2.send(request, timeout=1, stream=True)
+    assert mock_client.requests_seen == []
+
+
+@pytest.mark.parametrize('httpx_exception, requests_exception', (
+    ('ConnectTimeout', requests.ConnectTimeout),
+    ('ReadTimeout', requests.ReadTimeout),
+    ('ConnectError', requests.ConnectionError),
+    ('RemoteProtocolError', requests.ConnectionError),
+))
+def test_send_errors(monkeypatch, httpx_exception, requests_exception):
+    def handler(request):
+        raise getattr(httpx, httpx_exception)('boom', request=request)
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(http2, 'get_client', lambda url, verify=True: client)
+    request = requests.Request('GET', 'https://some-ship-it.url/releases/Firefox-59.0b3-build1').prepare()
+
+    with pytest.raises(requests_exception):
+        http2.send(request, timeout=1)
+
+
+def test_send_keeps_cookies(monkeypatch):
+    client = httpx.Client(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, headers=[('Set-Cookie', 'session=abc; Path=/'), ('Set-Cookie', 'other=def')])
+    ))
+    monkeypatch.setattr(http2, 'get_client', lambda url, verify=True: client)
+    request = requests.Request('POST', 'https://some-ship-it.url/login').prepare()
+
+    assert http2.send(request, timeout=1).cookies.get_dict() == {'session': 'abc', 'other': 'def'}
+
+
+def test_cookie_login_over_http2(fake_shipit, tmpdir):
+    fake_shipit.token_logins = False
+    fake_shipit.add_release('Firefox-59.0b3-build1', status='shipped')
+    mark_as_shipped(get_ship_it_instance_config(
+        fake_shipit.api_root, login_path='/login', session_cache_dir=str(tmpdir), http2=True,
+    ), 'Firefox-59.0b3-build1')
+
+    assert fake_shipit.logins == 1
+    assert fake_shipit.password_checks == 1
+
+
+def test_shipitapi_over_http2(mock_client):
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root='https://some-ship-it.url', timeout=1)
+    configure_api(release_api, {'http2': True})
+
+    assert release_api.getRelease('Firefox-59.0b3-build1') == {'status': 'shipped'}
+    assert mock_client.requests_seen[0].headers['Authorization'].startswith('Basic ')
+
+
+def test_streamed_calls_go_over_http1(mock_client, fake_shipit):
+    fake_shipit.add_release('Firefox-59.0b3-build1', status='shipped')
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=1)
+    configure_api(release_api, {'http2': True})
+
+    assert get_release_values(release_api, 'Firefox-59.0b3-build1', ['status']) == {'status': 'shipped'}
+    assert fake_shipit.requests == [('GET', '/releases/Firefox-59.0b3-build1')]
+    assert mock_client.requests_seen == []
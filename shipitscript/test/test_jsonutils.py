@@ -0,0 +1,138 @@
+import json
+import pytest
+
+from shipitscript import jsonutils
+from shipitscript.jsonutils import KeyExtractor, extract_keys
+
+
+RELEASE_INFO = {
+    'name': 'Firefox-59.0b3-build1',
+    'l10nChangesets': {'locale{}'.format(i): 'revision "{}" \\ é'.format(i) for i in range(200)},
+    'partials': [['59.0b1build1', {'nested': ']}"'}], []],
+    'buildNumber': 12345,
+    'description': None,
+    'status': 'Started',
+    'ready': True,
+    'complete': False,
+    'shippedAt': '2018-07-03T09:19:00+00:00',
+    'comment': 'ends with a backslash \\',
+}
+RELEASE_INFO_BYTES = json.dumps(RELEASE_INFO, ensure_ascii=False, indent=1).encode('utf-8')
+
+
+def _chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('chunk_size', (1, 2, 3, 7, 64, 4096, len(RELEASE_INFO_BYTES)))
+@pytest.mark.parametrize('keys', (
+    ('status', 'ready', 'complete'),
+    ('status', 'shippedAt'),
+    ('buildNumber', 'description', 'comment'),
+    ('l10nChangesets', 'partials'),
+    (),
+))
+def test_extract_keys(chunk_size, keys):
+    assert extract_keys(_chunks(RELEASE_INFO_BYTES, chunk_size), keys) == {key: RELEASE_INFO[key] for key in keys}
+
+
+def test_extract_missing_keys():
+    assert extract_keys(_chunks(RELEASE_INFO_BYTES, 64), ('status', 'nonExisting')) == {'status': 'Started'}
+
+
+def test_extract_keys_stops_reading():
+    data = json.dumps({'status': 'shipped', 'l10nChangesets': 'x' * 100000}).encode('utf-8')
+    chunks_read = []
+
+    def chunks():
+        for chunk in _chunks(data, 16):
+            chunks_read.append(chunk)
+            yield chunk
+
+    assert extract_keys(chunks(), ('status',)) == {'status': 'shipped'}
+    assert len(chunks_read) == 2
+
+
+def test_skipped_values_are_not_buffered():
+    extractor = KeyExtractor(('status',))
+    extractor.feed('{"l10nChangesets": "' + 'x' * 100000)
+    extractor.feed('x' * 100000 + '", "l10n": {"de": ["' + 'y' * 100000)
+    assert len(extractor._buffer) == 0
+    extractor.feed('"]}, "status": "shipped"}')
+    assert extractor.found == {'status': 'shipped'}
+
+
+def test_extract_keys_numbers_split_across_chunks():
+    data = b'{"n": -1.5e3, "f": 0.25, "e": -2E-2, "skipped": [1.5e3], "i": 10, "z": 0}'
+    expected = {'n': -1500.0, 'f': 0.25, 'e': -0.02, 'i': 10, 'z': 0}
+    for split in range(1, len(data)):
+        assert extract_keys([data[:split], data[split:]], tuple(expected)) == expected, split
+
+
+@pytest.mark.parametrize('data', (
+    b'["status", "shipped"]',
+    b'{"status" "shipped"}',
+    b'{"status": "shipped" "ready": true}',
+    b'{"status": "shipped", ',
+    b'{"status": "shipp',
+    b'{"ready": 1.5.3}',
+    b'{"ready": tru}',
+))
+def test_extract_keys_errors(data):
+    with pytest.raises(ValueError):
+        extract_keys(_chunks(data, 4), ('status', 'ready'))
+
+
+@pytest.fixture(params=('stdlib', 'orjson'))
+def backend(request, monkeypatch):
+    if request.param == 'stdlib':
+        monkeypatch.setattr(jsonutils, 'orjson', None)
+    elif jsonutils.orjson is None:
+        pytest.skip('orjson is not installed')
+    return request.param
+
+
+def test_get_backend_name(backend):
+    assert jsonutils.get_backend_name() == backend
+
+
+@pytest.mark.parametrize('data', (RELEASE_INFO_BYTES, RELEASE_INFO_BYTES.decode('utf-8')))
+def test_loads(backend, data):
+    assert jsonutils.loads(data) == RELEASE_INFO
+
+
+@pytest.mark.parametrize('kwargs', ({}, {'sort_keys': True}, {'indent': 2}, {'indent': 4}))
+def test_dumps(backend, kwargs):
+    dumped = jsonutils.dumps(RELEASE_INFO, **kwargs)
+    assert isinstance(dumped, str)
+    assert json.loads(dumped) == RELEASE_INFO
+    if kwargs.get('sort_keys'):
+        assert dumped.index('"buildNumber"') < dumped.index('"name"')
+    if kwargs.get('indent'):
+        assert '\n' + ' ' * kwargs['indent'] + '"name"' in dumped
+
+
+@pytest.mark.parametrize('kwargs', ({}, {'sort_keys': True}, {'indent': 2}, {'indent': 4}))
+def test_dumps_same_data_with_every_backend(backend, kwargs):
+    dumped = jsonutils.dumps({
+        'name': 'Firefox-62.0b3-build1 – ß',
+        'nan': float('nan'),
+        'infinities': (float('inf'), float('-inf'), 1.5),
+        'nested': {'nan': float('nan')},
+    }, **kwargs)
+    assert 'ß' in dumped
+    assert json.loads(dumped) == {
+        'name': 'Firefox-62.0b3-build1 – ß',
+        'nan': None,
+        'infinities': [None, None, 1.5],
+        'nested': {'nan': None},
+    }
+    assert json.loads(jsonutils.dumps({1: 'one', 2: 'two'}, **kwargs)) == {'1': 'one', '2': 'two'}
+
+
+def test_dump_and_load(backend, tmpdir):
+    path = str(tmpdir.join('release.json'))
+    jsonutils.dump(RELEASE_INFO, path, indent=2)
+    assert jsonutils.load(path) == RELEASE_INFO
+    with open(path, 'rb') as f:
+        assert ' é'.encode('utf-8') in f.read()
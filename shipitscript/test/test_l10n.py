@@ -0,0 +1,73 @@
+import os
+import pytest
+import tempfile
+
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+from shipitscript.l10n import (
+    CompactL10nChangesets, expand_l10n_changesets, get_l10n_changesets, read_l10n_changesets,
+)
+from shipitscript.test import context
+
+
+assert context  # silence pyflakes
+
+L10N_CHANGESETS = 'de default\nro default\n'
+COMPACT_L10N_CHANGESETS = {
+    'revisions': ['a' * 40, 'b' * 40],
+    'locales': {'de': 0, 'fr': 1, 'ro': 0},
+}
+
+
+def test_get_inline_l10n_changesets(context):
+    context.task['payload']['l10n_changesets'] = L10N_CHANGESETS
+    assert get_l10n_changesets(context) == L10N_CHANGESETS
+
+
+@pytest.mark.parametrize('artifact_path, raises', (
+    ('public/build/l10n-changesets.txt', False),
+    ('public/build/non-existing.txt', True),
+))
+def test_get_upstream_artifact_l10n_changesets(context, artifact_path, raises):
+    with tempfile.TemporaryDirectory() as work_dir:
+        context.config['work_dir'] = work_dir
+        upstream_dir = os.path.join(work_dir, 'cot', 'someTaskId', 'public', 'build')
+        os.makedirs(upstream_dir)
+        with open(os.path.join(upstream_dir, 'l10n-changesets.txt'), 'w') as f:
+            f.write(L10N_CHANGESETS)
+
+        context.task['payload']['l10n_changesets'] = {
+            'taskId': 'someTaskId',
+            'path': artifact_path,
+        }
+
+        if raises:
+            with pytest.raises(ScriptWorkerTaskException):
+                get_l10n_changesets(context)
+        else:
+            assert get_l10n_changesets(context) == L10N_CHANGESETS
+
+
+def test_get_compact_l10n_changesets(context):
+    context.task['payload']['l10n_changesets'] = COMPACT_L10N_CHANGESETS
+    l10n_changesets = get_l10n_changesets(context)
+    assert l10n_changesets == CompactL10nChangesets(**COMPACT_L10N_CHANGESETS)
+    assert expand_l10n_changesets(l10n_changesets) == 'de {a}\nfr {b}\nro {a}\n'.format(a='a' * 40, b='b' * 40)
+
+
+@pytest.mark.parametrize('locales', ({'de': 0, 'ro': 2}, {'de': 0, 'ro': -1}))
+def test_get_compact_l10n_changesets_with_unknown_revisions(context, locales):
+    context.task['payload']['l10n_changesets'] = {'revisions': ['a' * 40, 'b' * 40], 'locales': locales}
+    with pytest.raises(ScriptWorkerTaskException):
+        get_l10n_changesets(context)
+
+
+def test_expand_l10n_changesets_text():
+    assert expand_l10n_changesets(L10N_CHANGESETS) == L10N_CHANGESETS
+
+
+def test_read_l10n_changesets():
+    with tempfile.NamedTemporaryFile('w') as f:
+        f.write(L10N_CHANGESETS)
+        f.flush()
+        assert read_l10n_changesets(f.name) == L10N_CHANGESETS
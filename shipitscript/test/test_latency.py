@@ -0,0 +1,180 @@
+import json
+import pytest
+import time
+
+import requests
+import shipitapi
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+from shipitscript import latency
+from shipitscript.latency import (
+    BUCKET_BOUNDARIES, MAX_SAMPLES, AdaptiveTimeouts, LatencyHistogram, LatencyTracker, get_operation,
+    get_request_operation, get_tracker, save_trackers,
+)
+from shipitscript.test import fake_shipit
+from shipitscript.transport import configure_api, get_adaptive_timeouts
+
+
+assert fake_shipit  # silence pyflakes
+
+
+@pytest.fixture(autouse=True)
+def trackers():
+    latency.clear_trackers()
+    yield
+    latency.clear_trackers()
+
+
+@pytest.mark.parametrize('method, path, expected', (
+    ('HEAD', '/csrf_token', 'csrf_token'),
+    ('POST', '/login', 'login'),
+    ('POST', '/submit_release.html', 'submit'),
+    ('GET', '/releases?names=Firefox-59.0b3-build1&page=1', 'listReleases'),
+    ('POST', '/releases/Firefox-59.0b3-build1', 'update'),
+    ('GET', '/releases/Firefox-59.0b3-build1', 'getRelease'),
+    ('GET', '/releases/Firefox-59.0b3-build1/l10n', 'other'),
+    ('DELETE', '/releases/Firefox-59.0b3-build1', 'other'),
+))
+def test_get_operation(method, path, expected):
+    assert get_operation(method, path) == expected
+
+
+@pytest.mark.parametrize('url, api_root, expected', (
+    ('https://ship-it.tld/api/releases/Firefox-59.0b3-build1', 'https://ship-it.tld/api', 'getRelease'),
+    ('https://ship-it.tld/api/releases/Firefox-59.0b3-build1', None, 'other'),
+    ('https://ship-it.tld/releases/Firefox-59.0b3-build1', None, 'getRelease'),
+    ('https://other-ship-it.tld/releases/Firefox-59.0b3-build1', 'https://ship-it.tld/api', 'getRelease'),
+))
+def test_get_request_operation(url, api_root, expected):
+    request = requests.Request('GET', url).prepare()
+    assert get_request_operation(request, api_root) == expected
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram()
+    for _ in range(98):
+        histogram.record(0.1)
+    histogram.record(1)
+    histogram.record(1000)
+
+    assert histogram.total == 100
+    assert 0.1 <= histogram.percentile(50) < 0.125
+    assert 1 <= histogram.percentile(99) < 1.25
+    assert histogram.percentile(100) is None
+
+
+def test_latency_histogram_decay():
+    histogram = LatencyHistogram()
+    for _ in range(MAX_SAMPLES * 3):
+        histogram.record(0.1)
+    histogram.decay()
+    assert MAX_SAMPLES // 2 <= histogram.total <= MAX_SAMPLES
+
+
+def test_latency_tracker_is_shared_through_the_file(tmpdir):
+    path = str(tmpdir.join('latency.json'))
+    trackers = [LatencyTracker(path), LatencyTracker(path)]
+    for tracker in trackers:
+        tracker.record('https://ship-it.tld', 'getRelease', 0.1)
+        assert tracker.get_histogram('https://ship-it.tld', 'getRelease').total == 1
+    for tracker in trackers:
+        tracker.save()
+
+    assert trackers[1].get_histogram('https://ship-it.tld', 'getRelease').total == 2
+    assert LatencyTracker(path).get_histogram('https://ship-it.tld', 'getRelease').total == 2
+    assert LatencyTracker(path).get_histogram('https://ship-it.tld', 'update').total == 0
+
+
+@pytest.mark.parametrize('content', ('{corrupted', '{"version": 0, "histograms": {}}'))
+def test_latency_tracker_ignores_unknown_files(tmpdir, content):
+    path = tmpdir.join('latency.json')
+    path.write(content)
+    assert LatencyTracker(str(path)).get_histogram('https://ship-it.tld', 'getRelease').total == 0
+
+
+def test_save_trackers(tmpdir):
+    path = str(tmpdir.join('latency.json'))
+    assert get_tracker(path) is get_tracker(path)
+    get_tracker(path).record('https://ship-it.tld', 'update', 0.5)
+    save_trackers()
+
+    with open(path) as f:
+        assert sum(json.load(f)['histograms']['https://ship-it.tld']['update']) == 1
+
+
+def _adaptive_timeouts(tmpdir, samples, **kwargs):
+    tracker = LatencyTracker(str(tmpdir.join('latency.json')))
+    for sample in samples:
+        tracker.record('https://ship-it.tld', 'getRelease', sample)
+    return AdaptiveTimeouts(tracker, 'https://ship-it.tld/', **kwargs)
+
+
+def _upper_bound(seconds):
+    return next(boundary for boundary in BUCKET_BOUNDARIES if boundary >= seconds)
+
+
+@pytest.mark.parametrize('samples, kwargs, static_timeout, expected', (
+    # not enough samples
+    ([1] * 19, {'min_timeout': 0}, 60, 60),
+    # p99, doubled
+    ([1] * 100, {'min_timeout': 0}, 60, (60, 2 * _upper_bound(1))),
+    ([1] * 99 + [5], {'min_timeout': 0}, 60, (60, 2 * _upper_bound(1))),
+    ([1] * 100, {'min_timeout': 0, 'multiplier': 3, 'percentile': 50}, 60, (60, 3 * _upper_bound(1))),
+    # floor
+    ([0.01] * 100, {}, 60, (60, 5)),
+    # ceiling, the static read timeout by default
+    ([20] * 100, {}, 30, (30, 30)),
+    ([20] * 100, {'max_timeout': 10}, 30, (30, 10)),
+    ([20] * 100, {}, (5, 60), (5, 2 * _upper_bound(20))),
+    ([20] * 100, {}, (5, 30), (5, 30)),
+    ([20] * 100, {'max_timeout': 10}, (5, 30), (5, 10)),
+    ([20] * 100, {}, None, (None, 2 * _upper_bound(20))),
+    ([1000] * 100, {}, 30, (30, 30)),
+))
+def test_adaptive_timeouts(tmpdir, samples, kwargs, static_timeout, expected):
+    adaptive_timeouts = _adaptive_timeouts(tmpdir, samples, **kwargs)
+    assert adaptive_timeouts.get_timeout('getRelease', static_timeout) == pytest.approx(expected)
+
+
+def test_get_adaptive_timeouts(tmpdir):
+    assert get_adaptive_timeouts({}) is None
+    adaptive_timeouts = get_adaptive_timeouts({
+        'api_root': 'https://ship-it.tld',
+        'adaptive_timeouts': {
+            'histogram_file': str(tmpdir.join('latency.json')),
+            'percentile': '95',
+            'min_timeout_in_seconds': 1,
+            'max_timeout_in_seconds': 30,
+            'min_samples': '50',
+        },
+    })
+    assert adaptive_timeouts.tracker is get_tracker(str(tmpdir.join('latency.json')))
+    assert (adaptive_timeouts.percentile, adaptive_timeouts.min_timeout, adaptive_timeouts.max_timeout) == (95, 1, 30)
+    assert (adaptive_timeouts.multiplier, adaptive_timeouts.min_samples) == (2, 50)
+
+    with pytest.raises(ScriptWorkerTaskException, match='percentile'):
+        get_adaptive_timeouts({'api_root': 'https://ship-it.tld', 'adaptive_timeouts': {
+            'histogram_file': str(tmpdir.join('latency.json')), 'percentile': 150,
+        }})
+
+
+def test_hung_calls_are_abandoned(fake_shipit, tmpdir):
+    fake_shipit.add_release('Firefox-59.0b3-build1', status='shipped')
+    ship_it_instance_config = {'api_root': fake_shipit.api_root, 'adaptive_timeouts': {
+        'histogram_file': str(tmpdir.join('latency.json')), 'min_samples': 5, 'min_timeout_in_seconds': 0.2,
+    }}
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=10)
+    configure_api(release_api, ship_it_instance_config)
+    for _ in range(5):
+        release_api.getRelease('Firefox-59.0b3-build1')
+
+    fake_shipit.latency = 1
+    start = time.monotonic()
+    with pytest.raises(requests.ReadTimeout):
+        release_api.getRelease('Firefox-59.0b3-build1')
+    assert time.monotonic() - start < 0.5
+
+    histogram = get_tracker(str(tmpdir.join('latency.json'))).get_histogram(fake_shipit.api_root, 'getRelease')
+    # the timeout got recorded as a sample
+    assert histogram.total == 6
+    assert histogram.percentile(100) >= 0.2
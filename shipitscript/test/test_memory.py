@@ -0,0 +1,32 @@
+import pytest
+
+from shipitscript.script import ACTION_MAP
+from shipitscript.test.memory import (
+    BASELINE_TOLERANCE, fake_shipit_process, get_python_version, load_baselines, measure_peak,
+    top_allocation_sites,
+)
+
+
+@pytest.fixture(scope='module')
+def api_root():
+    with fake_shipit_process() as api_root:
+        yield api_root
+
+
+@pytest.mark.parametrize('action', sorted(ACTION_MAP))
+def test_peak_memory(api_root, tmpdir, action):
+    baseline = load_baselines().get(get_python_version(), {}).get(action)
+    if baseline is None:
+        pytest.skip('No {} memory baseline for Python {}. Record it with `python -m shipitscript.test.memory --update-baselines`'.format(
+            action, get_python_version(),
+        ))
+
+    peak = measure_peak(action, api_root, str(tmpdir))
+    assert peak <= baseline * (1 + BASELINE_TOLERANCE), \
+        '{} peaked at {} bytes, more than {:.0%} above its {} bytes baseline'.format(action, peak, BASELINE_TOLERANCE, baseline)
+
+
+def test_top_allocation_sites(api_root, tmpdir):
+    statistics = top_allocation_sites('mark-as-started', api_root, str(tmpdir), limit=3)
+    assert 0 < len(statistics) <= 3
+    assert statistics[0].size >= statistics[-1].size
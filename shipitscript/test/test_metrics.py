@@ -0,0 +1,120 @@
+import logging
+import os
+import pytest
+import tempfile
+
+import requests
+import shipitapi
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+from shipitscript import jsonutils
+from shipitscript.metrics import (
+    REQUEST_METRICS_ARTIFACT, RequestMetrics, counting_requests, current_request_metrics, get_request_body_size,
+    get_response_body_size,
+)
+from shipitscript.test import context, fake_shipit, get_ship_it_instance_config
+from shipitscript.transport import configure_api
+from shipitscript.utils import get_auth_primitives
+
+
+assert context and fake_shipit  # silence pyflakes
+
+RELEASE_NAME = 'Firefox-59.0b3-build1'
+
+
+def test_request_metrics():
+    metrics = RequestMetrics()
+    metrics.record('csrf_token', 0, 0)
+    metrics.record('update', 40, 2)
+    metrics.record('update', 40, 2)
+    metrics.record('getRelease', 0, 300)
+
+    assert metrics.to_json() == {
+        'requests': 4,
+        'request_bytes': 80,
+        'response_bytes': 304,
+        'operations': {
+            'csrf_token': {'requests': 1, 'request_bytes': 0, 'response_bytes': 0},
+            'getRelease': {'requests': 1, 'request_bytes': 0, 'response_bytes': 300},
+            'update': {'requests': 2, 'request_bytes': 80, 'response_bytes': 4},
+        },
+    }
+    assert metrics.summary() == (
+        'Made 4 Ship-it requests, sent 80 and received 304 body bytes (csrf_token: 1, getRelease: 1, update: 2)'
+    )
+
+
+@pytest.mark.parametrize('body, expected', (
+    (None, 0),
+    ('status=shipped', 14),
+    ('é', 2),
+    (b'\x1f\x8b', 2),
+    (iter([b'streamed']), 0),
+))
+def test_get_request_body_size(body, expected):
+    request = requests.Request('POST', 'http://some-ship-it.url/releases/{}'.format(RELEASE_NAME)).prepare()
+    request.body = body
+    assert get_request_body_size(request) == expected
+
+
+@pytest.mark.parametrize('method, headers, content, stream, expected', (
+    ('GET', {'Content-Length': '12'}, b'{"name": ""}', False, 12),
+    ('GET', {'Content-Length': '5', 'Content-Encoding': 'gzip'}, b'decompressed', False, 5),
+    ('GET', {}, b'{"name": ""}', False, 12),
+    ('GET', {}, b'{"name": ""}', True, 0),
+    ('HEAD', {'Content-Length': '12'}, b'', False, 0),
+))
+def test_get_response_body_size(method, headers, content, stream, expected):
+    response = requests.Response()
+    response.request = requests.Request(method, 'http://some-ship-it.url/csrf_token').prepare()
+    response.headers.update(headers)
+    response._content = content
+    assert get_response_body_size(response, stream=stream) == expected
+
+
+def test_counting_requests(context, fake_shipit, caplog):
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        fake_shipit.add_release(RELEASE_NAME, status='Started')
+        context.config['artifact_dir'] = artifact_dir
+        release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=1)
+        configure_api(release_api, {'api_root': fake_shipit.api_root})
+
+        # requests made outside of tasks aren't counted
+        release_api.getRelease(RELEASE_NAME)
+
+        with caplog.at_level(logging.INFO), counting_requests(context) as metrics:
+            assert current_request_metrics() is metrics
+            release_api.update(RELEASE_NAME, status='shipped')
+            release_api.getRelease(RELEASE_NAME)
+        assert current_request_metrics() is None
+
+        artifact = jsonutils.load(os.path.join(artifact_dir, REQUEST_METRICS_ARTIFACT))
+
+    assert artifact == metrics.to_json()
+    assert artifact['requests'] == 3
+    assert sorted(artifact['operations']) == ['csrf_token', 'getRelease', 'update']
+    assert artifact['operations']['getRelease']['response_bytes'] > 0
+    assert metrics.summary() in caplog.text
+
+
+@pytest.mark.parametrize('reachable', (True, False))
+def test_counting_failed_logins(context, fake_shipit, tmpdir, reachable):
+    fake_shipit.is_authorized = lambda headers: False
+    if not reachable:
+        fake_shipit.stop()
+    auth, _, _ = get_auth_primitives(get_ship_it_instance_config(
+        fake_shipit.api_root, login_path='/login', session_cache_dir=str(tmpdir),
+    ))
+    with counting_requests(context) as metrics:
+        with pytest.raises(ScriptWorkerTaskException if reachable else requests.ConnectionError):
+            auth.get_session()
+
+    operations = metrics.to_json()['operations']
+    assert sorted(operations) == ['login']
+    assert operations['login']['requests'] == 1
+
+
+def test_counting_requests_without_artifact_dir(context):
+    with counting_requests(context) as metrics:
+        metrics.record('login', 0, 10)
+    assert metrics.to_json()['requests'] == 1
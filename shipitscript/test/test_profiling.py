@@ -0,0 +1,120 @@
+import os
+import pstats
+import pytest
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+
+from shipitscript import profiling
+from shipitscript.profiling import (
+    PROFILE_ENVIRONMENT_VARIABLE, StackSampler, collapse_stack, maybe_profile, start_process_profiler,
+)
+from shipitscript.test import context
+
+
+assert context  # silence pyflakes
+
+project_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _busy_loop(duration):
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        pass
+
+
+def test_collapse_stack():
+    frame = sys._getframe()
+    stack = collapse_stack(frame)
+    assert stack.endswith(';test_collapse_stack (test_profiling.py:{})'.format(frame.f_code.co_firstlineno))
+
+
+def test_stack_sampler():
+    sampler = StackSampler(interval=0.001)
+    sampler.start()
+    _busy_loop(0.05)
+    sampler.stop()
+
+    assert sampler.stacks
+    assert any('_busy_loop (test_profiling.py' in stack for stack in sampler.stacks)
+
+    with tempfile.NamedTemporaryFile('r') as f:
+        sampler.write(f.name)
+        lines = f.read().splitlines()
+    assert len(lines) == len(sampler.stacks)
+    assert all(int(line.rsplit(' ', 1)[1]) > 0 for line in lines)
+
+
+@pytest.mark.parametrize('profile, expected_file_name', (
+    (True, 'profile.pstats'),
+    ('cprofile', 'profile.pstats'),
+    ('sampling', 'profile.collapsed'),
+    (False, None),
+))
+def test_maybe_profile(context, profile, expected_file_name):
+    with tempfile.TemporaryDirectory() as artifact_dir:
+        context.config['artifact_dir'] = artifact_dir
+        context.config['profile'] = profile
+
+        with maybe_profile(context):
+            _busy_loop(0.05)
+
+        logs_dir = os.path.join(artifact_dir, 'public', 'logs')
+        if expected_file_name is None:
+            assert os.listdir(artifact_dir) == []
+            return
+        # never both profilers at once
+        assert os.listdir(logs_dir) == [expected_file_name]
+        if expected_file_name == 'profile.pstats':
+            stats = pstats.Stats(os.path.join(logs_dir, expected_file_name))
+            assert any(function_name == '_busy_loop' for _, _, function_name in stats.stats)
+            assert not any(function_name == '_run' for _, _, function_name in stats.stats)
+        else:
+            with open(os.path.join(logs_dir, expected_file_name)) as f:
+                assert '_busy_loop (test_profiling.py' in f.read()
+
+
+def test_maybe_profile_unknown_profiler(context):
+    context.config['profile'] = 'perf'
+    with pytest.raises(ValueError, match='Unsupported profile'):
+        with maybe_profile(context):
+            pass
+
+
+@pytest.mark.parametrize('profile, expected_file_name', (('cprofile', 'profile.pstats'), ('sampling', 'profile.collapsed')))
+def test_process_profiler(context, monkeypatch, tmpdir, profile, expected_file_name):
+    monkeypatch.setenv(PROFILE_ENVIRONMENT_VARIABLE, profile)
+    start_process_profiler()
+    _busy_loop(0.05)
+
+    context.config['artifact_dir'] = str(tmpdir)
+    context.config['profile'] = False
+    with maybe_profile(context):
+        pass
+    assert os.listdir(str(tmpdir.join('public', 'logs'))) == [expected_file_name]
+
+    # it only profiles once
+    with maybe_profile(context):
+        pass
+    assert profiling._process_profiler is None
+
+
+def test_process_profiler_covers_imports(tmpdir):
+    # a new process, so that shipitscript gets imported with the variable set
+    subprocess.check_call([sys.executable, '-c', textwrap.dedent("""
+        import types
+        from shipitscript.profiling import maybe_profile
+        import shipitscript.fileutils
+
+        context = types.SimpleNamespace(config={{'artifact_dir': {!r}}})
+        with maybe_profile(context):
+            pass
+    """).format(str(tmpdir))], env=dict(os.environ, **{PROFILE_ENVIRONMENT_VARIABLE: 'cprofile'}), cwd=project_dir)
+
+    stats = pstats.Stats(str(tmpdir.join('public', 'logs', 'profile.pstats')))
+    assert any(
+        file_name.endswith(os.path.join('shipitscript', 'fileutils.py')) and function_name == '<module>'
+        for file_name, _, function_name in stats.stats
+    )
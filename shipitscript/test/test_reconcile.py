@@ -0,0 +1,171 @@
+import json
+import pytest
+import shipitapi
+import threading
+from unittest.mock import MagicMock
+
+from shipitscript.reconcile import main, per_thread_api, reconcile_instance, update_releases
+from shipitscript.test import get_ship_it_instance_config, running_fake_shipit
+
+
+SCOPE = 'project:releng:ship-it:server:dev'
+
+
+@pytest.fixture
+def fake_shipit():
+    with running_fake_shipit() as fake_shipit:
+        fake_shipit.add_release('Firefox-61.0-build3', status='shipped', shippedAt='2018-06-26T14:00:00+00:00')
+        fake_shipit.add_release('Firefox-62.0b3-build1', status='Started', ready=True, complete=True)
+        fake_shipit.add_release('Devedition-62.0b3-build1', status='Pending', ready=False, complete=False)
+        yield fake_shipit
+
+
+EXPECTATIONS = {
+    # same time, formatted the way actions send it
+    'Firefox-61.0-build3': {'status': 'shipped', 'shippedAt': '2018-06-26 14:00:00'},
+    'Firefox-62.0b3-build1': {'status': 'Started', 'ready': True, 'complete': True},
+    'Devedition-62.0b3-build1': {'status': 'Started', 'ready': True, 'complete': True},
+    'Fennec-62.0b3-build1': {'status': 'shipped'},
+}
+
+
+def test_reconcile_instance(fake_shipit):
+    results = reconcile_instance(get_ship_it_instance_config(fake_shipit.api_root), EXPECTATIONS, page_size=2)
+
+    assert results == {
+        'Firefox-61.0-build3': {'status': 'ok', 'mismatches': {}},
+        'Firefox-62.0b3-build1': {'status': 'ok', 'mismatches': {}},
+        'Devedition-62.0b3-build1': {'status': 'mismatch', 'mismatches': {
+            'status': {'expected': 'Started', 'actual': 'Pending'},
+            'ready': {'expected': True, 'actual': False},
+            'complete': {'expected': True, 'actual': False},
+        }},
+        'Fennec-62.0b3-build1': {'status': 'missing', 'mismatches': {}},
+    }
+    # 3 existing releases, 2 per page
+    assert [path.split('?')[0] for _, path in fake_shipit.requests] == ['/releases', '/releases']
+    assert fake_shipit.releases['Devedition-62.0b3-build1']['status'] == 'Pending'
+
+
+def test_reconcile_instance_fix(fake_shipit):
+    results = reconcile_instance(get_ship_it_instance_config(fake_shipit.api_root), EXPECTATIONS, fix=True)
+
+    assert results['Devedition-62.0b3-build1'] == {'status': 'fixed', 'mismatches': {}}
+    assert results['Fennec-62.0b3-build1']['status'] == 'missing'
+    assert fake_shipit.releases['Devedition-62.0b3-build1']['status'] == 'Started'
+    assert [(method, path.split('?')[0]) for method, path in fake_shipit.requests] == [
+        ('GET', '/releases'),
+        ('HEAD', '/csrf_token'),
+        ('POST', '/releases/Devedition-62.0b3-build1'),
+        ('GET', '/releases'),
+    ]
+
+
+def test_reconcile_instance_without_list_call(fake_shipit):
+    fake_shipit.release_listing = False
+    expectations = {
+        name: EXPECTATIONS[name] for name in ('Firefox-61.0-build3', 'Devedition-62.0b3-build1', 'Fennec-62.0b3-build1')
+    }
+    results = reconcile_instance(get_ship_it_instance_config(fake_shipit.api_root), expectations)
+
+    assert results['Firefox-61.0-build3']['status'] == 'ok'
+    assert results['Devedition-62.0b3-build1']['status'] == 'mismatch'
+    assert results['Fennec-62.0b3-build1']['status'] == 'missing'
+    assert fake_shipit.requests[0][1].startswith('/releases?')
+    # the 404 isn't retried
+    assert sorted(fake_shipit.requests[1:]) == [
+        ('GET', '/releases/Devedition-62.0b3-build1'),
+        ('GET', '/releases/Fennec-62.0b3-build1'),
+        ('GET', '/releases/Firefox-61.0-build3'),
+    ]
+
+
+def test_reconcile_instance_with_unexpected_list_payload(fake_shipit):
+    # e.g. an instance answering with the release names only
+    fake_shipit.list_releases = lambda names, page, per_page: names
+    expectations = {name: EXPECTATIONS[name] for name in ('Firefox-61.0-build3', 'Devedition-62.0b3-build1')}
+    results = reconcile_instance(get_ship_it_instance_config(fake_shipit.api_root), expectations)
+
+    assert results['Firefox-61.0-build3']['status'] == 'ok'
+    assert results['Devedition-62.0b3-build1']['status'] == 'mismatch'
+    assert sorted(fake_shipit.requests[1:]) == [
+        ('GET', '/releases/Devedition-62.0b3-build1'),
+        ('GET', '/releases/Firefox-61.0-build3'),
+    ]
+
+
+def test_per_thread_api():
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root='http://localhost:5000', timeout=1)
+    get_api = per_thread_api(release_api, {'api_root': 'http://localhost:5000'})
+    apis = []
+    thread = threading.Thread(target=lambda: apis.extend((get_api(), get_api())))
+    thread.start()
+    thread.join()
+
+    assert get_api() is get_api()
+    assert apis[0] is apis[1]
+    assert len({id(release_api), id(get_api()), id(apis[0])}) == 3
+    assert get_api().session is not apis[0].session
+
+
+def test_update_releases():
+    release_api = MagicMock()
+    release_api.update.side_effect = lambda name, **values: name.startswith('Fennec') and 1 / 0
+
+    failed_release_names = update_releases(lambda: release_api, {
+        'Firefox-62.0b3-build1': {'status': 'Started'},
+        'Fennec-62.0b3-build1': {'status': 'Started'},
+    })
+
+    assert failed_release_names == ['Fennec-62.0b3-build1']
+    release_api.update.assert_any_call('Firefox-62.0b3-build1', status='Started')
+
+
+@pytest.mark.parametrize('fix, expected_exit_code', ((False, 1), (True, 0)))
+def test_main(fake_shipit, tmpdir, fix, expected_exit_code):
+    config_path = str(tmpdir.join('config.json'))
+    expectations_path = str(tmpdir.join('expectations.json'))
+    report_path = str(tmpdir.join('report.json'))
+    with open(config_path, 'w') as f:
+        json.dump({'ship_it_instances': {SCOPE: get_ship_it_instance_config(fake_shipit.api_root)}}, f)
+    with open(expectations_path, 'w') as f:
+        json.dump({SCOPE: {name: EXPECTATIONS[name] for name in ('Firefox-61.0-build3', 'Devedition-62.0b3-build1')}}, f)
+
+    argv = [config_path, expectations_path, '--report', report_path]
+    with pytest.raises(SystemExit) as exc_info:
+        main(argv + ['--fix'] if fix else argv)
+
+    assert exc_info.value.code == expected_exit_code
+    with open(report_path) as f:
+        report = json.load(f)
+    assert report[SCOPE]['Devedition-62.0b3-build1']['status'] == ('fixed' if fix else 'mismatch')
+
+
+def test_main_saves_latencies(fake_shipit, tmpdir):
+    config_path = str(tmpdir.join('config.json'))
+    expectations_path = str(tmpdir.join('expectations.json'))
+    histogram_path = str(tmpdir.join('latency.json'))
+    ship_it_instance_config = get_ship_it_instance_config(fake_shipit.api_root, adaptive_timeouts={'histogram_file': histogram_path})
+    with open(config_path, 'w') as f:
+        json.dump({'ship_it_instances': {SCOPE: ship_it_instance_config}}, f)
+    with open(expectations_path, 'w') as f:
+        json.dump({SCOPE: {'Firefox-61.0-build3': EXPECTATIONS['Firefox-61.0-build3']}}, f)
+
+    with pytest.raises(SystemExit):
+        main([config_path, expectations_path])
+
+    with open(histogram_path) as f:
+        assert sum(json.load(f)['histograms'][fake_shipit.api_root]['listReleases']) == 1
+
+
+def test_main_unknown_scope(tmpdir):
+    config_path = str(tmpdir.join('config.json'))
+    expectations_path = str(tmpdir.join('expectations.json'))
+    with open(config_path, 'w') as f:
+        json.dump({'ship_it_instances': {}}, f)
+    with open(expectations_path, 'w') as f:
+        json.dump({SCOPE: {}}, f)
+
+    with pytest.raises(SystemExit) as exc_info:
+        main([config_path, expectations_path])
+    assert exc_info.value.code == 2
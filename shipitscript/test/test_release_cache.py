@@ -0,0 +1,150 @@
+import pytest
+import sqlite3
+import time
+from unittest.mock import MagicMock
+
+import shipitapi
+
+from shipitscript import release_cache
+from shipitscript.release_cache import (
+    DEFAULT_RELEASE_CACHE_TTL_IN_SECONDS, ReleaseCache, ReleaseStore, get_release_cache, invalidate_cached_release,
+)
+from shipitscript.ship_actions import mark_as_shipped
+from shipitscript.test import get_ship_it_instance_config, running_fake_shipit
+from shipitscript.transport import configure_api
+from shipitscript.utils import get_release_info
+
+API_ROOT = 'http://some-ship-it.url'
+RELEASE_NAME = 'Firefox-59.0b3-build1'
+RELEASE_INFO = {'name': RELEASE_NAME, 'status': 'shipped', 'shippedAt': '2018-07-03T09:19:00+00:00', 'l10nChangesets': {}}
+
+
+@pytest.fixture(autouse=True)
+def stores():
+    release_cache.close_release_stores()
+    yield
+    release_cache.close_release_stores()
+
+
+@pytest.fixture
+def store(tmpdir):
+    store = ReleaseStore(str(tmpdir.join('cache', 'releases.sqlite')))
+    yield store
+    store.close()
+
+
+def test_release_store(store):
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=30) is None
+
+    store.put(API_ROOT, RELEASE_NAME, RELEASE_INFO, fetched_at=time.time())
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=30) == RELEASE_INFO
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=30, keys=['status']) == RELEASE_INFO
+    assert store.get('http://other-ship-it.url', RELEASE_NAME, ttl=30) is None
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=0) is None
+
+
+def test_release_store_partial_records(store):
+    store.put(API_ROOT, RELEASE_NAME, {'status': 'shipped'}, fetched_at=time.time(), complete=False)
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=30, keys=['status']) == {'status': 'shipped'}
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=30, keys=['status', 'shippedAt']) is None
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=30) is None
+
+
+def test_release_store_invalidation(store):
+    fetched_at = time.time()
+    store.put(API_ROOT, RELEASE_NAME, RELEASE_INFO, fetched_at=fetched_at)
+    store.invalidate(API_ROOT, RELEASE_NAME)
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=30) is None
+
+    # a record fetched before the invalidation is stale
+    store.put(API_ROOT, RELEASE_NAME, RELEASE_INFO, fetched_at=fetched_at)
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=30) is None
+
+    store.put(API_ROOT, RELEASE_NAME, RELEASE_INFO, fetched_at=time.time())
+    assert store.get(API_ROOT, RELEASE_NAME, ttl=30) == RELEASE_INFO
+
+
+def test_release_store_is_shared(store):
+    # another process opening the same database
+    other_store = ReleaseStore(store.path)
+    try:
+        store.put(API_ROOT, RELEASE_NAME, RELEASE_INFO, fetched_at=time.time())
+        assert other_store.get(API_ROOT, RELEASE_NAME, ttl=30) == RELEASE_INFO
+        other_store.invalidate(API_ROOT, RELEASE_NAME)
+        assert store.get(API_ROOT, RELEASE_NAME, ttl=30) is None
+    finally:
+        other_store.close()
+
+    connection = sqlite3.connect(store.path)
+    assert connection.execute('PRAGMA journal_mode').fetchone() == ('wal',)
+    connection.close()
+
+
+def test_release_cache_errors_are_misses():
+    store = MagicMock()
+    store.get.side_effect = sqlite3.OperationalError('database is locked')
+    store.put.side_effect = sqlite3.OperationalError('database is locked')
+    store.invalidate.side_effect = sqlite3.OperationalError('database is locked')
+    cache = ReleaseCache(store, API_ROOT + '/', ttl=30)
+
+    assert cache.api_root == API_ROOT
+    assert cache.get(RELEASE_NAME) is None
+    cache.put(RELEASE_NAME, RELEASE_INFO, fetched_at=time.time())
+    cache.invalidate(RELEASE_NAME)
+
+
+def test_get_release_cache(tmpdir):
+    assert get_release_cache({'api_root': API_ROOT}) is None
+    assert get_release_cache(None) is None
+
+    path = str(tmpdir.join('releases.sqlite'))
+    cache = get_release_cache({'api_root': API_ROOT, 'release_cache': {'path': path}})
+    assert (cache.api_root, cache.ttl) == (API_ROOT, DEFAULT_RELEASE_CACHE_TTL_IN_SECONDS)
+    other_cache = get_release_cache({'api_root': API_ROOT, 'release_cache': {'path': path, 'ttl_in_seconds': '5'}})
+    assert other_cache.store is cache.store
+    assert other_cache.ttl == 5
+
+
+@pytest.fixture
+def fake_shipit():
+    with running_fake_shipit() as fake_shipit:
+        fake_shipit.add_release(RELEASE_NAME, status='shipped', shippedAt='2018-07-03T09:19:00+00:00')
+        yield fake_shipit
+
+
+def _ship_it_instance_config(fake_shipit, tmpdir, **kwargs):
+    return get_ship_it_instance_config(
+        fake_shipit.api_root, release_cache={'path': str(tmpdir.join('releases.sqlite'))}, **kwargs
+    )
+
+
+@pytest.mark.parametrize('incremental_release_parsing', (False, True))
+def test_get_release_info_reads_the_cache_first(fake_shipit, tmpdir, incremental_release_parsing):
+    ship_it_instance_config = _ship_it_instance_config(fake_shipit, tmpdir, incremental_release_parsing=incremental_release_parsing)
+    release_api = configure_api(shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root), ship_it_instance_config)
+
+    for _ in range(3):
+        release_info = get_release_info(release_api, RELEASE_NAME, ship_it_instance_config, keys=['status'])
+        assert release_info['status'] == 'shipped'
+    assert len(fake_shipit.requests) == 1
+
+    # only the checked keys got cached if the record was parsed incrementally
+    get_release_info(release_api, RELEASE_NAME, ship_it_instance_config)
+    assert len(fake_shipit.requests) == (2 if incremental_release_parsing else 1)
+
+    invalidate_cached_release(ship_it_instance_config, RELEASE_NAME)
+    get_release_info(release_api, RELEASE_NAME, ship_it_instance_config, keys=['status'])
+    assert len(fake_shipit.requests) == (3 if incremental_release_parsing else 2)
+
+
+def test_mark_as_shipped_invalidates_the_cache(fake_shipit, tmpdir):
+    ship_it_instance_config = _ship_it_instance_config(fake_shipit, tmpdir)
+    fake_shipit.releases[RELEASE_NAME].update(status='Started', shippedAt=None)
+    cache = get_release_cache(ship_it_instance_config)
+    cache.put(RELEASE_NAME, dict(fake_shipit.releases[RELEASE_NAME]), fetched_at=time.time())
+
+    # verification doesn't check the stale cached record
+    mark_as_shipped(ship_it_instance_config, RELEASE_NAME)
+
+    assert fake_shipit.requests[-1] == ('GET', '/releases/{}'.format(RELEASE_NAME))
+    assert cache.get(RELEASE_NAME)['status'] == 'shipped'
@@ -0,0 +1,51 @@
+import os
+import pytest
+import tempfile
+
+from shipitscript import jsonutils, script
+from shipitscript.metrics import REQUEST_METRICS_ARTIFACT
+from shipitscript.test import fake_shipit
+from shipitscript.test.memory import PREREQUISITE_ACTIONS, run_action
+
+
+assert fake_shipit  # silence pyflakes
+
+
+# Most Ship-it requests per operation, and request plus response body bytes,
+# every action may need with the default instance config and the payloads of
+# shipitscript.test.memory. Raise them knowingly: every extra round trip is
+# paid by every release
+REQUEST_BUDGETS = {
+    'mark-as-shipped': {
+        'requests': {'csrf_token': 1, 'update': 1, 'getRelease': 1},
+        'bytes': 16 * 1024,
+    },
+    'mark-as-started': {
+        # the CSRF token is fetched again for the update
+        'requests': {'csrf_token': 2, 'submit': 1, 'update': 1, 'getRelease': 1},
+        'bytes': 32 * 1024,
+    },
+}
+
+
+def test_every_action_has_a_budget():
+    assert sorted(REQUEST_BUDGETS) == sorted(script.ACTION_MAP)
+
+
+@pytest.mark.parametrize('action', sorted(REQUEST_BUDGETS))
+def test_action_stays_within_request_budget(fake_shipit, action):
+    with tempfile.TemporaryDirectory() as work_dir:
+        if action in PREREQUISITE_ACTIONS:
+            run_action(PREREQUISITE_ACTIONS[action], fake_shipit.api_root, work_dir)
+        requests_before = len(fake_shipit.requests)
+        run_action(action, fake_shipit.api_root, work_dir)
+        metrics = jsonutils.load(os.path.join(work_dir, 'artifacts', REQUEST_METRICS_ARTIFACT))
+
+    # every request Ship-it got is accounted for
+    assert metrics['requests'] == len(fake_shipit.requests) - requests_before
+
+    budget = REQUEST_BUDGETS[action]
+    for operation, values in metrics['operations'].items():
+        assert values['requests'] <= budget['requests'].get(operation, 0), metrics['operations']
+    assert metrics['requests'] <= sum(budget['requests'].values()), metrics['operations']
+    assert metrics['request_bytes'] + metrics['response_bytes'] <= budget['bytes'], metrics['operations']
@@ -0,0 +1,202 @@
+import pytest
+import socket
+import time
+from unittest.mock import MagicMock
+
+import requests
+import shipitapi
+
+from shipitscript import resolver
+from shipitscript.resolver import (
+    ResolverCache, clear_resolver_caches, create_connection, get_pool_classes_by_scheme, interleave_addresses,
+    race_connections, read_entries,
+)
+from shipitscript.test import running_fake_shipit
+from shipitscript.transport import clear_pools, configure_api
+
+
+def _addrinfo(family, address):
+    return (family, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', (address, 443))
+
+
+IPV4_1 = _addrinfo(socket.AF_INET, '192.0.2.1')
+IPV4_2 = _addrinfo(socket.AF_INET, '192.0.2.2')
+IPV6_1 = _addrinfo(socket.AF_INET6, '2001:db8::1')
+IPV6_2 = _addrinfo(socket.AF_INET6, '2001:db8::2')
+
+
+def test_resolver_cache(monkeypatch):
+    getaddrinfo_mock = MagicMock(return_value=[IPV4_1])
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo_mock)
+    now = [1000]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+
+    cache = ResolverCache()
+    assert cache.resolve('ship-it.tld', 443, ttl=60) == [IPV4_1]
+    assert cache.resolve('ship-it.tld', 443, ttl=60) == [IPV4_1]
+    assert getaddrinfo_mock.call_count == 1
+
+    cache.resolve('other-ship-it.tld', 443, ttl=60)
+    assert getaddrinfo_mock.call_count == 2
+
+    now[0] += 61
+    cache.resolve('ship-it.tld', 443, ttl=60)
+    assert getaddrinfo_mock.call_count == 3
+
+    cache.clear()
+    cache.resolve('ship-it.tld', 443, ttl=60)
+    assert getaddrinfo_mock.call_count == 4
+
+
+def test_resolver_cache_file(monkeypatch, tmpdir):
+    getaddrinfo_mock = MagicMock(return_value=[IPV6_1, IPV4_1])
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo_mock)
+    now = [1000]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    path = str(tmpdir.join('dns.json'))
+
+    assert ResolverCache(path).resolve('ship-it.tld', 443, ttl=60) == [IPV6_1, IPV4_1]
+    # a new task, in another process
+    assert ResolverCache(path).resolve('ship-it.tld', 443, ttl=60) == [IPV6_1, IPV4_1]
+    assert getaddrinfo_mock.call_count == 1
+
+    now[0] += 61
+    cache = ResolverCache(path)
+    cache.resolve('other-ship-it.tld', 443, ttl=60)
+    assert getaddrinfo_mock.call_count == 2
+    # expired entries get dropped
+    assert list(read_entries(path)) == ['other-ship-it.tld 443']
+
+    # the other process refreshed the entry
+    now[0] += 61
+    ResolverCache(path).resolve('other-ship-it.tld', 443, ttl=60)
+    cache.resolve('other-ship-it.tld', 443, ttl=60)
+    assert getaddrinfo_mock.call_count == 3
+
+
+@pytest.mark.parametrize('content', ('not json', '{"version": 0, "entries": {}}'))
+def test_resolver_cache_invalid_file(monkeypatch, tmpdir, content):
+    monkeypatch.setattr(socket, 'getaddrinfo', MagicMock(return_value=[IPV4_1]))
+    path = tmpdir.join('dns.json')
+    path.write(content)
+
+    assert ResolverCache(str(path)).resolve('ship-it.tld', 443, ttl=60) == [IPV4_1]
+    assert list(read_entries(str(path))) == ['ship-it.tld 443']
+
+
+@pytest.mark.parametrize('addrinfos, expected', (
+    ([], []),
+    ([IPV4_1, IPV4_2], [IPV4_1, IPV4_2]),
+    ([IPV6_1, IPV6_2, IPV4_1, IPV4_2], [IPV6_1, IPV4_1, IPV6_2, IPV4_2]),
+    ([IPV4_1, IPV4_2, IPV6_1], [IPV4_1, IPV6_1, IPV4_2]),
+))
+def test_interleave_addresses(addrinfos, expected):
+    assert interleave_addresses(addrinfos) == expected
+
+
+class FakeSocket(object):
+    def __init__(self, addrinfo):
+        self.addrinfo = addrinfo
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def _fake_connect(behaviors, opened_sockets):
+    def connect(addrinfo, timeout, source_address, socket_options):
+        delay, succeeds = behaviors[addrinfo]
+        time.sleep(delay)
+        if not succeeds:
+            raise ConnectionRefusedError('refused {}'.format(addrinfo[4][0]))
+        sock = FakeSocket(addrinfo)
+        opened_sockets.append(sock)
+        return sock
+
+    return connect
+
+
+@pytest.mark.parametrize('behaviors, expected_winner, max_duration', (
+    # IPv6 is blackholed: IPv4 wins after the attempt delay
+    ({IPV6_1: (0.3, True), IPV4_1: (0, True)}, IPV4_1, 0.2),
+    # IPv6 is refused: IPv4 is attempted right away
+    ({IPV6_1: (0, False), IPV4_1: (0, True)}, IPV4_1, 0.1),
+    # IPv6 is fast
+    ({IPV6_1: (0, True), IPV4_1: (0, True)}, IPV6_1, 0.1),
+))
+def test_race_connections(monkeypatch, behaviors, expected_winner, max_duration):
+    opened_sockets = []
+    monkeypatch.setattr(resolver, '_connect', _fake_connect(behaviors, opened_sockets))
+
+    start = time.monotonic()
+    sock = race_connections(list(behaviors), attempt_delay=0.05)
+    assert time.monotonic() - start < max_duration
+    assert sock.addrinfo == expected_winner
+    assert not sock.closed
+
+    time.sleep(0.4)
+    assert all(s.closed for s in opened_sockets if s is not sock)
+
+
+def test_race_connections_all_fail(monkeypatch):
+    behaviors = {IPV6_1: (0, False), IPV4_1: (0.05, False)}
+    monkeypatch.setattr(resolver, '_connect', _fake_connect(behaviors, []))
+    with pytest.raises(ConnectionRefusedError, match='192.0.2.1'):
+        race_connections(list(behaviors), attempt_delay=0.01)
+
+
+@pytest.fixture
+def local_server():
+    with running_fake_shipit() as fake_shipit:
+        fake_shipit.add_release('Firefox-59.0b3-build1', status='shipped')
+        yield fake_shipit
+
+
+def test_create_connection(monkeypatch, local_server):
+    clear_resolver_caches()
+    port = int(local_server.api_root.rsplit(':', 1)[1])
+    # nothing listens on ::1, so the IPv6 attempt gets refused
+    addrinfos = [_addrinfo(socket.AF_INET6, '::1'), _addrinfo(socket.AF_INET, '127.0.0.1')]
+    addrinfos = [addrinfo[:4] + ((addrinfo[4][0], port),) for addrinfo in addrinfos]
+    monkeypatch.setattr(socket, 'getaddrinfo', MagicMock(return_value=addrinfos))
+
+    sock = create_connection(('localhost', port), timeout=1)
+    try:
+        assert sock.getpeername() == ('127.0.0.1', port)
+    finally:
+        sock.close()
+
+
+def test_shipitapi_through_resolver_cache(monkeypatch, local_server, tmpdir):
+    getaddrinfo_mock = MagicMock(wraps=socket.getaddrinfo)
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo_mock)
+    api_root = local_server.api_root
+
+    for _ in range(2):
+        # a new process per task: new connections and empty in-memory caches
+        clear_pools()
+        clear_resolver_caches()
+        release_api = shipitapi.Release(('some-username', 'some-password'), api_root=api_root, timeout=1)
+        configure_api(release_api, {'dns_cache_ttl_in_seconds': 60, 'dns_cache_file': str(tmpdir.join('dns.json'))})
+        assert release_api.getRelease('Firefox-59.0b3-build1')['status'] == 'shipped'
+
+    assert local_server.connections == 2
+    assert getaddrinfo_mock.call_count == 1
+
+
+def test_get_pool_classes_by_scheme():
+    pool_classes_by_scheme = get_pool_classes_by_scheme(30, '/some/dns.json')
+    for scheme in ('http', 'https'):
+        connection_class = pool_classes_by_scheme[scheme].ConnectionCls
+        assert connection_class.dns_cache_ttl == 30
+        assert connection_class.dns_cache_file == '/some/dns.json'
+        assert connection_class._new_conn is resolver._ResolvingConnectionMixin._new_conn
+
+
+def test_resolving_connection_errors(monkeypatch):
+    monkeypatch.setattr(resolver, 'create_connection', MagicMock(side_effect=socket.gaierror('unknown host')))
+    session = requests.session()
+    configure_api(MagicMock(session=session), {'dns_cache_ttl_in_seconds': 30})
+
+    with pytest.raises(requests.ConnectionError, match='unknown host'):
+        session.get('http://ship-it.tld/releases/Firefox-59.0b3-build1', timeout=1)
@@ -1,4 +1,8 @@
+import json
 import os
+import tempfile
+import threading
+import time
 import pytest
 from unittest.mock import MagicMock
 
@@ -148,7 +152,10 @@ def test_get_default_config():
     parent_dir = os.path.dirname(os.getcwd())
     assert script.get_default_config() == {
         'work_dir': os.path.join(parent_dir, 'work_dir'),
+        'artifact_dir': os.path.join(parent_dir, 'artifact_dir'),
         'verbose': False,
+        'profile': False,
+        'task_max_timeout': 20 * 60,
     }
 
 
@@ -158,3 +165,45 @@ def test_main(monkeypatch):
     script.main()
     sync_main_mock.asset_called_once_with(script.async_main,
                                           default_config=script.get_default_config())
+
+
+@pytest.mark.asyncio
+async def test_async_main_exports_trace(context, monkeypatch):
+    context.task['taskGroupId'] = 'IKw4rShNS4CUJ2X0mx2zOg'
+    context.task['scopes'] = [
+        'project:releng:ship-it:action:mark-as-shipped',
+        'project:releng:ship-it:server:dev'
+    ]
+    monkeypatch.setattr(ship_actions, 'mark_as_shipped', MagicMock())
+
+    with tempfile.NamedTemporaryFile('r') as f:
+        context.config['trace_file'] = f.name
+        await script.async_main(context)
+        otlp = json.load(f)
+
+    spans = otlp['resourceSpans'][0]['scopeSpans'][0]['spans']
+    assert [span['name'] for span in spans] == ['mark-as-shipped', 'async_main']
+    assert {span['traceId'] for span in spans} == {'20ac38ad284d4b80942765f49b1db33a'}
+    assert spans[0]['parentSpanId'] == spans[1]['spanId']
+
+
+@pytest.mark.parametrize('warm_up_connection', (True, False))
+@pytest.mark.asyncio
+async def test_async_main_warms_up_connection(context, monkeypatch, warm_up_connection):
+    context.task['scopes'] = [
+        'project:releng:ship-it:action:mark-as-shipped',
+        'project:releng:ship-it:server:dev'
+    ]
+    context.config['ship_it_instances']['project:releng:ship-it:server:dev']['warm_up_connection'] = warm_up_connection
+    warmed_up = threading.Event()
+
+    def warm_up(ship_it_instance_config):
+        time.sleep(0.2)
+        warmed_up.set()
+
+    monkeypatch.setattr(script, 'warm_up', warm_up)
+    monkeypatch.setattr(ship_actions, 'mark_as_shipped', MagicMock())
+
+    await script.async_main(context)
+    # the warm up is over by the time async_main returns
+    assert warmed_up.is_set() == warm_up_connection
@@ -1,8 +1,10 @@
+import json
 import pytest
 from unittest.mock import MagicMock
 
 from freezegun import freeze_time
 import shipitapi
+from shipitscript.l10n import CompactL10nChangesets
 from shipitscript.ship_actions import mark_as_shipped, mark_as_started
 
 
@@ -20,7 +22,7 @@ def test_mark_as_shipped(monkeypatch, timeout, expected_timeout):
         'shippedAt': '2018-01-19 12:59:59'
     }
     attrs = {
-        'getRelease.return_value': release_info
+        'request.return_value.content': json.dumps(release_info)
     }
     release_instance_mock.configure_mock(**attrs)
     ReleaseClassMock.side_effect = lambda *args, **kwargs: release_instance_mock
@@ -62,7 +64,7 @@ def test_mark_as_started(monkeypatch, timeout, expected_timeout):
         'complete': True,
     }
     attrs = {
-        'getRelease.return_value': release_info
+        'request.return_value.content': json.dumps(release_info)
     }
     release_instance_mock.configure_mock(**attrs)
     new_release_instance_mock = MagicMock()
@@ -107,3 +109,33 @@ def test_mark_as_started(monkeypatch, timeout, expected_timeout):
         csrf_token_prefix='firefox-'
     )
     new_release_instance_mock.submit.assert_called_with(**data)
+
+
+def test_mark_as_started_expands_compact_l10n_changesets(monkeypatch):
+    release_instance_mock = MagicMock()
+    release_instance_mock.request.return_value.content = json.dumps({'status': 'Started', 'ready': True, 'complete': True})
+    new_release_instance_mock = MagicMock()
+    monkeypatch.setattr(shipitapi, 'Release', lambda *args, **kwargs: release_instance_mock)
+    monkeypatch.setattr(shipitapi, 'NewRelease', lambda *args, **kwargs: new_release_instance_mock)
+
+    ship_it_instance_config = {
+        'username': 'some-username',
+        'password': 'some-password',
+        'api_root': 'http://some.ship-it.tld/api/root',
+    }
+    l10n_changesets = CompactL10nChangesets(revisions=['default', 'tip'], locales={'de': 1, 'ro': 0})
+    data = dict(
+        product='firefox',
+        version='99.0b1',
+        buildNumber=1,
+        branch='projects/maple',
+        mozillaRevision='default',
+        l10nChangesets=l10n_changesets,
+        partials='98.0b1,98.0b14,98.0b15',
+    )
+
+    mark_as_started(ship_it_instance_config, 'Firefox-59.0b1-build1', data)
+
+    new_release_instance_mock.submit.assert_called_with(**dict(data, l10nChangesets='de tip\nro default\n'))
+    # the caller's data stays compact
+    assert data['l10nChangesets'] is l10n_changesets
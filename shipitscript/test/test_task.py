@@ -69,6 +69,28 @@ def test_fail_get_ship_it_instance_config_from_scope(context, scope):
 
 # validate_task {{{1
 @pytest.mark.parametrize('task,raises', (
+    ({
+        'dependencies': ['someTaskId'],
+        'payload': {
+            'release_name': 'Firefox-59.0b3-build1',
+            'maxRunTime': 600,
+        },
+        'scopes': [
+            'project:releng:ship-it:server:dev',
+            'project:releng:ship-it:action:mark-as-shipped',
+        ],
+    }, False),
+    ({
+        'dependencies': ['someTaskId'],
+        'payload': {
+            'release_name': 'Firefox-59.0b3-build1',
+            'maxRunTime': 0,
+        },
+        'scopes': [
+            'project:releng:ship-it:server:dev',
+            'project:releng:ship-it:action:mark-as-shipped',
+        ],
+    }, True),
     ({
         'dependencies': ['someTaskId'],
         'payload': {
@@ -117,6 +139,105 @@ def test_fail_get_ship_it_instance_config_from_scope(context, scope):
             'project:releng:ship-it:action:mark-as-started',
         ],
     }, True),
+    ({
+        'dependencies': ['someTaskId'],
+        'payload': {
+            'release_name': 'Firefox-59.0b3-build1',
+            'product': 'Firefox',
+            'version': '61.0b8',
+            'build_number': 1,
+            'branch': 'maple',
+            'revision': 'aadufhgdgf54g89dfngjerhtirughdfg',
+            'l10n_changesets': {
+                'taskId': 'someTaskId',
+                'path': 'public/build/l10n-changesets.txt',
+            },
+            'partials': '59.0b1build1,59.0b2build1',
+        },
+        'scopes': [
+            'project:releng:ship-it:server:dev',
+            'project:releng:ship-it:action:mark-as-started',
+        ],
+    }, False),
+    ({
+        'dependencies': ['someTaskId'],
+        'payload': {
+            'release_name': 'Firefox-59.0b3-build1',
+            'product': 'Firefox',
+            'version': '61.0b8',
+            'build_number': 1,
+            'branch': 'maple',
+            'revision': 'aadufhgdgf54g89dfngjerhtirughdfg',
+            'l10n_changesets': {
+                'revisions': ['aadufhgdgf54g89dfngjerhtirughdfg'],
+                'locales': {'de': 0, 'ro': 0},
+            },
+            'partials': '59.0b1build1,59.0b2build1',
+        },
+        'scopes': [
+            'project:releng:ship-it:server:dev',
+            'project:releng:ship-it:action:mark-as-started',
+        ],
+    }, False),
+    ({
+        'dependencies': ['someTaskId'],
+        'payload': {
+            'release_name': 'Firefox-59.0b3-build1',
+            'product': 'Firefox',
+            'version': '61.0b8',
+            'build_number': 1,
+            'branch': 'maple',
+            'revision': 'aadufhgdgf54g89dfngjerhtirughdfg',
+            'l10n_changesets': {
+                'revisions': ['aadufhgdgf54g89dfngjerhtirughdfg'],
+                'locales': {'de': 'aadufhgdgf54g89dfngjerhtirughdfg'},
+            },
+            'partials': '59.0b1build1,59.0b2build1',
+        },
+        'scopes': [
+            'project:releng:ship-it:server:dev',
+            'project:releng:ship-it:action:mark-as-started',
+        ],
+    }, True),
+    ({
+        'dependencies': ['someTaskId'],
+        'payload': {
+            'release_name': 'Firefox-59.0b3-build1',
+            'product': 'Firefox',
+            'version': '61.0b8',
+            'build_number': 1,
+            'branch': 'maple',
+            'revision': 'aadufhgdgf54g89dfngjerhtirughdfg',
+            'l10n_changesets': {
+                'revisions': [],
+                'locales': {},
+            },
+            'partials': '59.0b1build1,59.0b2build1',
+        },
+        'scopes': [
+            'project:releng:ship-it:server:dev',
+            'project:releng:ship-it:action:mark-as-started',
+        ],
+    }, True),
+    ({
+        'dependencies': ['someTaskId'],
+        'payload': {
+            'release_name': 'Firefox-59.0b3-build1',
+            'product': 'Firefox',
+            'version': '61.0b8',
+            'build_number': 1,
+            'branch': 'maple',
+            'revision': 'aadufhgdgf54g89dfngjerhtirughdfg',
+            'l10n_changesets': {
+                'taskId': 'someTaskId',
+            },
+            'partials': '59.0b1build1,59.0b2build1',
+        },
+        'scopes': [
+            'project:releng:ship-it:server:dev',
+            'project:releng:ship-it:action:mark-as-started',
+        ],
+    }, True),
 ))
 def test_validate_task(context, task, raises):
     context.task = task
@@ -0,0 +1,109 @@
+import concurrent.futures
+import json
+import pytest
+import tempfile
+
+from shipitscript.tracing import (
+    SPAN_KIND_CLIENT, STATUS_CODE_ERROR, STATUS_CODE_OK, Tracer, bind_current_span,
+    current_span, trace_id_from_task_group_id,
+)
+from shipitscript.test import context
+
+
+assert context  # silence pyflakes
+
+
+def test_trace_id_from_task_group_id():
+    assert trace_id_from_task_group_id('IKw4rShNS4CUJ2X0mx2zOg') == '20ac38ad284d4b80942765f49b1db33a'
+
+
+@pytest.mark.parametrize('task_group_id', ('', 'some-task-group-id', 'not base64!', 'AAAAAAAAAAAAAAAAAAAAAA'))
+def test_trace_id_from_invalid_task_group_id(task_group_id):
+    trace_id = trace_id_from_task_group_id(task_group_id)
+    assert len(trace_id) == 32
+    assert int(trace_id, 16) != 0
+
+
+def test_tracer_from_context(context, monkeypatch):
+    monkeypatch.delenv('TASK_ID', raising=False)
+    context.task['taskGroupId'] = 'IKw4rShNS4CUJ2X0mx2zOg'
+    tracer = Tracer.from_context(context)
+    assert tracer.trace_id == '20ac38ad284d4b80942765f49b1db33a'
+    assert tracer.resource_attributes == {
+        'service.name': 'shipitscript',
+        'taskcluster.task_group_id': 'IKw4rShNS4CUJ2X0mx2zOg',
+    }
+
+
+@pytest.mark.parametrize('environment_task_id, context_task_id, expected', (
+    ('some-task-id', None, 'some-task-id'),
+    ('some-task-id', 'some-other-task-id', 'some-task-id'),
+    (None, 'some-other-task-id', 'some-other-task-id'),
+    ('None', None, None),
+))
+def test_tracer_from_context_task_id(context, monkeypatch, environment_task_id, context_task_id, expected):
+    if environment_task_id is None:
+        monkeypatch.delenv('TASK_ID', raising=False)
+    else:
+        monkeypatch.setenv('TASK_ID', environment_task_id)
+    # only set once the worker claimed the task
+    monkeypatch.setattr(type(context), 'task_id', context_task_id)
+    tracer = Tracer.from_context(context)
+    assert tracer.resource_attributes.get('taskcluster.task_id') == expected
+
+
+def test_start_span():
+    tracer = Tracer('20ac38ad284d4b80942765f49b1db33a')
+    assert current_span() is None
+
+    with tracer.start_span('async_main') as root_span:
+        assert current_span() is root_span
+        with tracer.start_span('GET /releases/Firefox-59.0b3-build1', kind=SPAN_KIND_CLIENT) as child_span:
+            assert current_span() is child_span
+            assert child_span.traceparent == '00-20ac38ad284d4b80942765f49b1db33a-{}-01'.format(child_span.span_id)
+        assert current_span() is root_span
+
+        with pytest.raises(ValueError):
+            with tracer.start_span('failing') as failing_span:
+                raise ValueError('boom')
+
+    assert current_span() is None
+    assert tracer.finished_spans == [child_span, failing_span, root_span]
+    assert root_span.parent_span_id is None
+    assert child_span.parent_span_id == failing_span.parent_span_id == root_span.span_id
+    assert root_span.status_code == child_span.status_code == STATUS_CODE_OK
+    assert failing_span.status_code == STATUS_CODE_ERROR
+    assert failing_span.attributes == {'exception.type': 'ValueError'}
+    assert root_span.start_time_unix_nano <= child_span.start_time_unix_nano <= child_span.end_time_unix_nano <= root_span.end_time_unix_nano
+
+
+def test_export():
+    tracer = Tracer('20ac38ad284d4b80942765f49b1db33a', {'service.name': 'shipitscript'})
+    with tracer.start_span('async_main', attributes={'some.bool': True, 'some.int': 1, 'some.float': 0.5}):
+        pass
+
+    with tempfile.NamedTemporaryFile('r') as f:
+        tracer.export(f.name)
+        otlp = json.load(f)
+
+    resource_spans = otlp['resourceSpans'][0]
+    assert resource_spans['resource']['attributes'] == [{'key': 'service.name', 'value': {'stringValue': 'shipitscript'}}]
+    otlp_span = resource_spans['scopeSpans'][0]['spans'][0]
+    assert otlp_span['traceId'] == '20ac38ad284d4b80942765f49b1db33a'
+    assert otlp_span['name'] == 'async_main'
+    assert 'parentSpanId' not in otlp_span
+    assert otlp_span['attributes'] == [
+        {'key': 'some.bool', 'value': {'boolValue': True}},
+        {'key': 'some.float', 'value': {'doubleValue': 0.5}},
+        {'key': 'some.int', 'value': {'intValue': '1'}},
+    ]
+
+
+def test_bind_current_span():
+    tracer = Tracer('20ac38ad284d4b80942765f49b1db33a')
+    with tracer.start_span('async_main') as span:
+        wrapped = bind_current_span(current_span)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        assert executor.submit(wrapped).result() is span
+        assert executor.submit(current_span).result() is None
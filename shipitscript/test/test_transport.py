@@ -0,0 +1,223 @@
+import gzip
+import pytest
+import zlib
+from unittest.mock import MagicMock
+
+import requests
+import shipitapi
+from requests.adapters import HTTPAdapter
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+from shipitscript import transport
+from shipitscript.resolver import DEFAULT_DNS_CACHE_FILE
+from shipitscript.test import fake_shipit, running_fake_shipit
+from shipitscript.tracing import STATUS_CODE_ERROR, STATUS_CODE_OK, Tracer
+from shipitscript.transport import (
+    ShipItAdapter, clear_pools, compress_request_body, configure_api, get_adapter_kwargs,
+    warm_up, COMPRESSION_MIN_BODY_SIZE,
+)
+
+
+assert fake_shipit  # silence pyflakes
+
+
+def _prepare_request(data, method='POST'):
+    return requests.Request(method, 'http://some-ship-it.url/submit_release.html', data=data).prepare()
+
+
+@pytest.mark.parametrize('encoding, decompress', (
+    ('gzip', gzip.decompress),
+    ('deflate', zlib.decompress),
+))
+def test_compress_request_body(encoding, decompress):
+    request = _prepare_request({'firefox-l10nChangesets': 'ro default\n' * 200})
+    original_body = request.body.encode('utf-8')
+
+    compress_request_body(request, encoding)
+
+    assert request.headers['Content-Encoding'] == encoding
+    assert request.headers['Content-Length'] == str(len(request.body))
+    assert len(request.body) < len(original_body)
+    assert decompress(request.body) == original_body
+
+
+@pytest.mark.parametrize('method, data', (
+    ('POST', {'status': 'shipped'}),
+    ('GET', None),
+))
+def test_compress_request_body_leaves_small_bodies(method, data):
+    request = _prepare_request(data, method=method)
+    original_body = request.body
+
+    compress_request_body(request, 'gzip')
+
+    assert 'Content-Encoding' not in request.headers
+    assert request.body == original_body
+    assert original_body is None or len(original_body) < COMPRESSION_MIN_BODY_SIZE
+
+
+def test_compress_request_body_leaves_encoded_bodies():
+    # e.g. a request sent again after a 401
+    request = _prepare_request({'firefox-l10nChangesets': 'ro default\n' * 200})
+    compress_request_body(request, 'gzip')
+    compressed_body = request.body
+
+    compress_request_body(request, 'gzip')
+
+    assert request.body == compressed_body
+
+
+@pytest.mark.parametrize('request_compression', (None, 'gzip'))
+def test_adapter_send(monkeypatch, request_compression):
+    sent_requests = []
+    monkeypatch.setattr(HTTPAdapter, 'send', lambda self, request, **kwargs: sent_requests.append(request))
+
+    request = _prepare_request({'l10nChangesets': 'ro default\n' * 200})
+    ShipItAdapter(request_compression=request_compression).send(request, timeout=1)
+
+    assert sent_requests == [request]
+    assert request.headers.get('Content-Encoding') == request_compression
+
+
+@pytest.mark.parametrize('ship_it_instance_config, expected, raises', (
+    ({}, {
+        'request_compression': None, 'http2': False, 'dns_cache_ttl': None, 'dns_cache_file': None, 'adaptive_timeouts': None, 'api_root': None,
+    }, False),
+    ({'request_compression': 'gzip', 'api_root': 'http://some-ship-it.url'}, {
+        'request_compression': 'gzip', 'http2': False, 'dns_cache_ttl': None, 'dns_cache_file': None, 'adaptive_timeouts': None,
+        'api_root': 'http://some-ship-it.url',
+    }, False),
+    ({'request_compression': 'deflate'}, {
+        'request_compression': 'deflate', 'http2': False, 'dns_cache_ttl': None, 'dns_cache_file': None, 'adaptive_timeouts': None, 'api_root': None,
+    }, False),
+    ({'dns_cache_ttl_in_seconds': '30'}, {
+        'request_compression': None, 'http2': False, 'dns_cache_ttl': 30, 'dns_cache_file': DEFAULT_DNS_CACHE_FILE,
+        'adaptive_timeouts': None, 'api_root': None,
+    }, False),
+    ({'dns_cache_ttl_in_seconds': 30, 'dns_cache_file': '/some/dns.json'}, {
+        'request_compression': None, 'http2': False, 'dns_cache_ttl': 30, 'dns_cache_file': '/some/dns.json',
+        'adaptive_timeouts': None, 'api_root': None,
+    }, False),
+    ({'request_compression': 'brotli'}, None, True),
+))
+def test_get_adapter_kwargs(ship_it_instance_config, expected, raises):
+    if raises:
+        with pytest.raises(ScriptWorkerTaskException):
+            get_adapter_kwargs(ship_it_instance_config)
+    else:
+        assert get_adapter_kwargs(ship_it_instance_config) == expected
+
+
+def test_configure_api():
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root='http://some-ship-it.url')
+    assert configure_api(release_api, {'request_compression': 'gzip'}) is release_api
+
+    for url in ('http://some-ship-it.url/releases', 'https://some-ship-it.url/releases'):
+        adapter = release_api.session.get_adapter(url)
+        assert isinstance(adapter, ShipItAdapter)
+        assert adapter.request_compression == 'gzip'
+    assert release_api.session.headers['Accept-Encoding'] == 'gzip, deflate'
+
+
+@pytest.mark.parametrize('status_code', (200, 404, 500, 503))
+def test_adapter_send_traced(monkeypatch, status_code):
+    response = requests.Response()
+    response.status_code = status_code
+    monkeypatch.setattr(HTTPAdapter, 'send', lambda self, request, **kwargs: response)
+
+    tracer = Tracer('20ac38ad284d4b80942765f49b1db33a')
+    request = _prepare_request(None, method='GET')
+    with tracer.start_span('mark-as-shipped') as action_span:
+        assert ShipItAdapter().send(request) is response
+
+    http_span, _ = tracer.finished_spans
+    assert http_span.name == 'GET /submit_release.html'
+    assert http_span.parent_span_id == action_span.span_id
+    assert http_span.attributes['http.status_code'] == status_code
+    assert http_span.status_code == (STATUS_CODE_ERROR if status_code >= 500 else STATUS_CODE_OK)
+    assert request.headers['traceparent'] == http_span.traceparent
+
+
+def test_adapter_send_untraced(monkeypatch):
+    monkeypatch.setattr(HTTPAdapter, 'send', lambda self, request, **kwargs: None)
+    request = _prepare_request(None, method='GET')
+    ShipItAdapter().send(request)
+    assert 'traceparent' not in request.headers
+
+
+def test_sessions_share_pools(fake_shipit):
+    fake_shipit.add_release('Firefox-59.0b3-build1', status='shipped')
+    for _ in range(3):
+        release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=1)
+        configure_api(release_api, {})
+        assert release_api.getRelease('Firefox-59.0b3-build1')['status'] == 'shipped'
+        release_api.session.close()
+
+    assert fake_shipit.connections == 1
+
+
+@pytest.mark.parametrize('ship_it_instance_config, expected', (
+    ({}, True),
+    ({'dns_cache_ttl_in_seconds': 60}, True),
+    ({'http2': True}, False),
+))
+def test_warm_up(fake_shipit, tmpdir, ship_it_instance_config, expected):
+    ship_it_instance_config['api_root'] = fake_shipit.api_root
+    ship_it_instance_config['dns_cache_file'] = str(tmpdir.join('dns.json'))
+    assert warm_up(ship_it_instance_config) == expected
+
+    if expected:
+        # the warmed up connection is reused by the first actual request
+        fake_shipit.add_release('Firefox-59.0b3-build1', status='shipped')
+        release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=1)
+        configure_api(release_api, ship_it_instance_config)
+        release_api.getRelease('Firefox-59.0b3-build1')
+        assert fake_shipit.connections == 1
+        assert fake_shipit.requests == [('GET', '/releases/Firefox-59.0b3-build1')]
+
+
+def test_adapters_reuse_pool_managers(monkeypatch):
+    clear_pools()
+    created_poolmanagers = []
+    original_init_poolmanager = HTTPAdapter.init_poolmanager
+
+    def init_poolmanager(adapter, *args, **kwargs):
+        original_init_poolmanager(adapter, *args, **kwargs)
+        created_poolmanagers.append(adapter.poolmanager)
+
+    monkeypatch.setattr(HTTPAdapter, 'init_poolmanager', init_poolmanager)
+    adapters = [ShipItAdapter() for _ in range(3)]
+    assert len(created_poolmanagers) == 1
+    assert {id(adapter.poolmanager) for adapter in adapters} == {id(created_poolmanagers[0])}
+    clear_pools()
+
+
+@pytest.mark.parametrize('ship_it_instance_config, expected_timeout', (
+    ({}, 60),
+    ({'timeout_in_seconds': '5'}, 5),
+))
+def test_warm_up_connect_timeout(monkeypatch, ship_it_instance_config, expected_timeout):
+    class FakeConnection(object):
+        timeout = None
+
+        def connect(self):
+            self.connect_timeout = self.timeout
+
+        def close(self):
+            pass
+
+    connection = FakeConnection()
+    pool = MagicMock()
+    pool._get_conn.return_value = connection
+    monkeypatch.setattr(transport, 'get_connection_pool', lambda adapter, url, verify: pool)
+
+    ship_it_instance_config['api_root'] = 'http://some-ship-it.url'
+    assert warm_up(ship_it_instance_config) is True
+    assert connection.connect_timeout == expected_timeout
+    pool._put_conn.assert_called_once_with(connection)
+
+
+def test_warm_up_failure():
+    with running_fake_shipit() as fake_shipit:
+        api_root = fake_shipit.api_root
+    assert warm_up({'api_root': api_root}) is False
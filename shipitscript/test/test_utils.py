@@ -1,12 +1,32 @@
+import json
+import os
 import pytest
+import subprocess
+import sys
+import textwrap
+import threading
+import time
 from unittest.mock import MagicMock
 
+import requests
+import shipitapi
 from scriptworker.exceptions import ScriptWorkerTaskException
+
+from shipitscript import jsonutils, utils
+from shipitscript.auth import SessionAuth
+from shipitscript.cancellation import current_cancellation
+from shipitscript.latency import clear_trackers, get_tracker
+from shipitscript.test import fake_shipit, running_fake_shipit
+from shipitscript.transport import ShipItAdapter, configure_api
 from shipitscript.utils import (
-    get_auth_primitives, check_release_has_values, same_timing
+    get_auth_primitives, check_release_has_values, same_timing, clone_api,
+    get_release, get_release_info, get_release_values, get_hedge_delay, hedged_get_release, get_mismatches, list_releases,
 )
 
 
+assert fake_shipit  # silence pyflakes
+
+
 @pytest.mark.parametrize('ship_it_instance_config,expected', (
     ({
         'api_root': 'http://some-ship-it.url',
@@ -24,6 +44,23 @@ def test_get_auth_primitives(ship_it_instance_config, expected):
     assert get_auth_primitives(ship_it_instance_config) == expected
 
 
+def test_get_auth_primitives_with_session(tmpdir):
+    auth, api_root, timeout_in_seconds = get_auth_primitives({
+        'api_root': 'http://some-ship-it.url/',
+        'timeout_in_seconds': 1,
+        'username': 'some-username',
+        'password': 'some-password',
+        'login_path': '/login',
+        'session_cache_dir': str(tmpdir),
+    })
+    assert isinstance(auth, SessionAuth)
+    assert auth.login_url == 'http://some-ship-it.url/login'
+    assert auth.cache_path.startswith(str(tmpdir))
+    assert auth.timeout == timeout_in_seconds == 1
+    assert isinstance(auth.session.get_adapter(auth.login_url), ShipItAdapter)
+    assert auth.verify == shipitapi.Release(auth, api_root=api_root).verify
+
+
 @pytest.mark.parametrize('release_info,  values, raises', (
     ({
         'name': 'Fennec-X.0bX-build42',
@@ -226,7 +263,7 @@ def test_generic_validation(monkeypatch, release_info,  values, raises):
     release_name = "Fennec-X.0bX-build42"
     ReleaseClassMock = MagicMock()
     attrs = {
-        'getRelease.return_value': release_info
+        'request.return_value.content': json.dumps(release_info)
     }
     ReleaseClassMock.configure_mock(**attrs)
 
@@ -245,3 +282,254 @@ def test_generic_validation(monkeypatch, release_info,  values, raises):
 ))
 def test_same_timing(time1, time2, expected):
     assert same_timing(time1, time2) == expected
+
+
+class FakeReleaseAPI(object):
+    def __init__(self, delay=0, error=None, release_info=None):
+        self.delay = delay
+        self.error = error
+        self.release_info = release_info
+        self.cancellation = None
+
+    def request(self, url_template_vars):
+        self.cancellation = current_cancellation()
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return MagicMock(content=json.dumps(self.release_info))
+
+
+@pytest.mark.parametrize('primary_kwargs, hedge_kwargs, expected, hedged, raises', (
+    (dict(release_info={'from': 'primary'}), dict(release_info={'from': 'hedge'}), {'from': 'primary'}, False, False),
+    (dict(delay=1, release_info={'from': 'primary'}), dict(release_info={'from': 'hedge'}), {'from': 'hedge'}, True, False),
+    (dict(delay=0.1, release_info={'from': 'primary'}), dict(delay=1, release_info={'from': 'hedge'}), {'from': 'primary'}, True, False),
+    (dict(delay=0.1, error=ValueError()), dict(delay=0.2, release_info={'from': 'hedge'}), {'from': 'hedge'}, True, False),
+    (dict(delay=0.1, error=ValueError()), dict(delay=0.1, error=ValueError()), None, True, True),
+    (dict(error=ValueError()), dict(release_info={'from': 'hedge'}), None, False, True),
+))
+def test_hedged_get_release(primary_kwargs, hedge_kwargs, expected, hedged, raises):
+    primary_api = FakeReleaseAPI(**primary_kwargs)
+    hedge_api = FakeReleaseAPI(**hedge_kwargs)
+    hedge_api_factory = MagicMock(return_value=hedge_api)
+
+    if raises:
+        with pytest.raises(ValueError):
+            hedged_get_release(primary_api, hedge_api_factory, 'Fennec-X.0bX-build42', 0.05)
+    else:
+        assert hedged_get_release(primary_api, hedge_api_factory, 'Fennec-X.0bX-build42', 0.05) == expected
+
+    assert hedge_api_factory.called == hedged
+    if hedged and not raises:
+        loser_api = hedge_api if expected == {'from': 'primary'} else primary_api
+        winner_api = primary_api if loser_api is hedge_api else hedge_api
+        assert loser_api.cancellation.cancelled
+        assert not winner_api.cancellation.cancelled
+
+
+@pytest.mark.parametrize('ship_it_instance_config, hedged', (
+    (None, False),
+    ({}, False),
+    ({'hedge_delay_in_seconds': '0.05'}, True),
+))
+def test_get_release_info(monkeypatch, ship_it_instance_config, hedged):
+    release_api = MagicMock()
+    release_api.request.return_value.content = json.dumps({'status': 'shipped'})
+    hedged_get_release_mock = MagicMock(return_value={'status': 'shipped'})
+    monkeypatch.setattr(utils, 'hedged_get_release', hedged_get_release_mock)
+
+    assert get_release_info(release_api, 'Fennec-X.0bX-build42', ship_it_instance_config) == {'status': 'shipped'}
+    assert hedged_get_release_mock.called == hedged
+    assert release_api.request.called != hedged
+    if hedged:
+        assert hedged_get_release_mock.call_args[0][2:] == ('Fennec-X.0bX-build42', 0.05)
+
+
+@pytest.mark.parametrize('ship_it_instance_config, samples, expected', (
+    ({}, 0, None),
+    ({'hedge_delay_in_seconds': '0.5'}, 100, 0.5),
+    # no histogram to take the percentile of
+    ({'hedge_delay_in_seconds': 0.5, 'hedge_percentile': 95}, 100, 0.5),
+    ({'hedge_delay_in_seconds': 0.5, 'hedge_percentile': 95, 'adaptive_timeouts': {}}, 100, 0.5),
+    # too few samples
+    ({'hedge_delay_in_seconds': 0.5, 'hedge_percentile': 95, 'adaptive_timeouts': {'histogram_file': None}}, 19, 0.5),
+    ({'hedge_percentile': 95, 'adaptive_timeouts': {'histogram_file': None}}, 19, None),
+    ({'hedge_delay_in_seconds': 0.5, 'hedge_percentile': 95, 'adaptive_timeouts': {'histogram_file': None, 'min_samples': 10}}, 19, 0.1),
+    ({'hedge_delay_in_seconds': 0.5, 'hedge_percentile': 95, 'adaptive_timeouts': {'histogram_file': None}}, 100, 0.1),
+    ({'hedge_percentile': '50', 'adaptive_timeouts': {'histogram_file': None}}, 100, 0.1),
+))
+def test_get_hedge_delay(tmpdir, ship_it_instance_config, samples, expected):
+    histogram_file = str(tmpdir.join('histograms.json'))
+    ship_it_instance_config = dict(ship_it_instance_config, api_root='http://some-ship-it.url/')
+    if 'adaptive_timeouts' in ship_it_instance_config and 'histogram_file' in ship_it_instance_config['adaptive_timeouts']:
+        ship_it_instance_config['adaptive_timeouts']['histogram_file'] = histogram_file
+    tracker = get_tracker(histogram_file)
+    for _ in range(samples):
+        tracker.record('http://some-ship-it.url', 'getRelease', 0.1)
+    # a slower operation doesn't count
+    tracker.record('http://some-ship-it.url', 'update', 30)
+
+    try:
+        delay = get_hedge_delay(ship_it_instance_config)
+    finally:
+        clear_trackers()
+    assert delay == (expected if expected is None else pytest.approx(expected, rel=0.25))
+
+
+@pytest.mark.parametrize('hedge_percentile', (0, 101))
+def test_get_hedge_delay_invalid_percentile(tmpdir, hedge_percentile):
+    with pytest.raises(ScriptWorkerTaskException, match='hedge_percentile'):
+        get_hedge_delay({
+            'api_root': 'http://some-ship-it.url',
+            'hedge_percentile': hedge_percentile,
+            'adaptive_timeouts': {'histogram_file': str(tmpdir.join('histograms.json'))},
+        })
+
+
+def test_clone_api():
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root='http://some-ship-it.url', timeout=1)
+    cloned_api = clone_api(release_api, {'request_compression': 'gzip'})
+
+    assert isinstance(cloned_api, shipitapi.Release)
+    assert cloned_api.session is not release_api.session
+    assert (cloned_api.auth, cloned_api.api_root, cloned_api.timeout) == (release_api.auth, release_api.api_root, release_api.timeout)
+    assert isinstance(cloned_api.session.get_adapter('http://some-ship-it.url'), ShipItAdapter)
+
+
+def test_get_release(fake_shipit, monkeypatch):
+    loads_mock = MagicMock(wraps=jsonutils.loads)
+    monkeypatch.setattr(jsonutils, 'loads', loads_mock)
+    fake_shipit.add_release('Fennec-X.0bX-build42', status='Started', ready=True)
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=1)
+    configure_api(release_api, {})
+
+    release_info = get_release(release_api, 'Fennec-X.0bX-build42')
+    assert release_info == release_api.getRelease('Fennec-X.0bX-build42')
+    assert release_info['status'] == 'Started'
+    assert loads_mock.call_count == 1
+
+
+def test_get_release_values(fake_shipit):
+    fake_shipit.add_release('Fennec-X.0bX-build42', status='Started', ready=True, l10nChangesets='ro default\n' * 10000)
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=1)
+    configure_api(release_api, {})
+
+    assert get_release_values(release_api, 'Fennec-X.0bX-build42', ('status', 'ready', 'complete')) == {
+        'status': 'Started',
+        'ready': True,
+        'complete': False,
+    }
+
+    release_api.retries = 1
+    with pytest.raises(requests.HTTPError):
+        get_release_values(release_api, 'Fennec-Y.0bY-build42', ('status',))
+
+
+@pytest.mark.parametrize('ship_it_instance_config, keys, incremental', (
+    ({}, ('status',), False),
+    ({'incremental_release_parsing': True}, None, False),
+    ({'incremental_release_parsing': True}, ('status',), True),
+))
+def test_get_release_info_incremental(monkeypatch, ship_it_instance_config, keys, incremental):
+    release_api = MagicMock()
+    release_api.request.return_value.content = json.dumps({'status': 'shipped'})
+    get_release_values_mock = MagicMock(return_value={'status': 'shipped'})
+    monkeypatch.setattr(utils, 'get_release_values', get_release_values_mock)
+
+    assert get_release_info(release_api, 'Fennec-X.0bX-build42', ship_it_instance_config, keys=keys) == {'status': 'shipped'}
+    assert get_release_values_mock.called == incremental
+    assert release_api.request.called != incremental
+
+
+def test_hedged_get_release_with_fetch():
+    primary_api = FakeReleaseAPI(delay=1)
+    hedge_api = FakeReleaseAPI()
+    fetch = MagicMock(side_effect=lambda api, name: get_release(api, name) or {'fetched_from': api})
+
+    assert hedged_get_release(primary_api, lambda: hedge_api, 'Fennec-X.0bX-build42', 0.05, fetch=fetch) == {'fetched_from': hedge_api}
+    assert fetch.call_count == 2
+
+
+def _hedged_call_threads():
+    return [thread for thread in threading.enumerate() if thread.name == 'shipitscript-hedged-call']
+
+
+def test_hedged_get_release_cancels_a_hung_primary():
+    with running_fake_shipit(latency=30) as hung_shipit, running_fake_shipit() as fake_shipit:
+        for shipit in (hung_shipit, fake_shipit):
+            shipit.add_release('Fennec-X.0bX-build42', status='shipped')
+        primary_api = configure_api(shipitapi.Release(('some-username', 'some-password'), api_root=hung_shipit.api_root, timeout=60), {})
+        hedge_api = configure_api(shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=60), {})
+
+        start = time.monotonic()
+        assert hedged_get_release(primary_api, lambda: hedge_api, 'Fennec-X.0bX-build42', 0.1)['status'] == 'shipped'
+        # the primary is neither waited for nor retried
+        while _hedged_call_threads() and time.monotonic() - start < 5:
+            time.sleep(0.05)
+        assert not _hedged_call_threads()
+        assert time.monotonic() - start < 5
+        assert hung_shipit.requests == [('GET', '/releases/Fennec-X.0bX-build42')]
+        hung_shipit.latency = 0
+
+
+def test_hedged_get_release_does_not_hold_the_process():
+    code = textwrap.dedent("""
+        import shipitapi
+        from shipitscript.test.fakeshipit import FakeShipIt
+        from shipitscript.transport import configure_api
+        from shipitscript.utils import hedged_get_release
+
+        hung_shipit, fake_shipit = FakeShipIt(latency=300).start(), FakeShipIt().start()
+        fake_shipit.add_release('Fennec-X.0bX-build42', status='shipped')
+        primary_api = configure_api(shipitapi.Release(('user', 'password'), api_root=hung_shipit.api_root, timeout=300), {})
+        hedge_api = configure_api(shipitapi.Release(('user', 'password'), api_root=fake_shipit.api_root, timeout=300), {})
+        print(hedged_get_release(primary_api, lambda: hedge_api, 'Fennec-X.0bX-build42', 0.1)['status'])
+    """)
+    project_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+    start = time.monotonic()
+    output = subprocess.check_output([sys.executable, '-c', code], cwd=project_dir, timeout=60)
+    assert output.strip().endswith(b'shipped')
+    assert time.monotonic() - start < 10
+
+
+def test_get_mismatches():
+    release_info = {'status': 'shipped', 'shippedAt': '2018-07-03T09:19:00+00:00', 'ready': False}
+    assert get_mismatches(release_info, {
+        'status': 'shipped',
+        'shippedAt': '2018-07-03 09:19:00',
+        'ready': False,
+        'complete': True,
+    }) == {
+        # falsy values never correspond, as in check_release_has_values()
+        'ready': {'expected': False, 'actual': False},
+        'complete': {'expected': True, 'actual': None},
+    }
+
+
+def test_list_releases(fake_shipit):
+    for i in range(5):
+        fake_shipit.add_release('Firefox-6{}.0-build1'.format(i), status='shipped')
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=1)
+    names = ['Firefox-6{}.0-build1'.format(i) for i in range(6)]
+
+    releases = list_releases(release_api, names, page_size=2)
+    assert sorted(releases) == names[:5]
+    assert len(fake_shipit.requests) == 3
+
+    fake_shipit.release_listing = False
+    assert list_releases(release_api, names) is None
+
+
+@pytest.mark.parametrize('page', (
+    ['Firefox-60.0-build1'],
+    {'releases': ['Firefox-60.0-build1'], 'next_page': None},
+    {'releases': [{'status': 'shipped'}], 'next_page': None},
+    {'releases': [{'name': 'Firefox-60.0-build1'}]},
+    {'releases': [], 'next_page': 1},
+    {'releases': [], 'next_page': '2'},
+))
+def test_list_releases_unexpected_payload(fake_shipit, page):
+    fake_shipit.list_releases = lambda names, page_number, per_page: page
+    release_api = shipitapi.Release(('some-username', 'some-password'), api_root=fake_shipit.api_root, timeout=1)
+
+    assert list_releases(release_api, ['Firefox-60.0-build1']) is None
+    assert len(fake_shipit.requests) == 1
@@ -0,0 +1,178 @@
+import base64
+import binascii
+import contextlib
+import logging
+import os
+import threading
+import time
+
+from shipitscript import jsonutils
+
+
+log = logging.getLogger(__name__)
+
+# https://github.com/open-telemetry/opentelemetry-proto/blob/main/opentelemetry/proto/trace/v1/trace.proto
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_CODE_OK = 1
+STATUS_CODE_ERROR = 2
+
+_state = threading.local()
+
+
+def current_span():
+    """Function to grab the span the running thread is part of, if any"""
+    return getattr(_state, 'span', None)
+
+
+def _set_current_span(span):
+    previous_span = current_span()
+    _state.span = span
+    return previous_span
+
+
+def bind_current_span(func):
+    """Function to wrap a callable so that it runs within the current span
+    even when called from another thread"""
+    span = current_span()
+
+    def wrapper(*args, **kwargs):
+        previous_span = _set_current_span(span)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            _set_current_span(previous_span)
+
+    return wrapper
+
+
+def _time_unix_nano():
+    return int(time.time() * 1e9)
+
+
+def trace_id_from_task_group_id(task_group_id):
+    """Function to derive a W3C trace id from a taskGroupId. Slugids are
+    url-safe base64 encoded uuids, i.e. exactly the 16 bytes a trace id is
+    made of, so every task of a graph shares the same trace. The all-zero
+    trace id is invalid, it gets a random one like undecodable ids do"""
+    try:
+        raw = base64.urlsafe_b64decode(task_group_id + '==')
+    except (TypeError, binascii.Error):
+        raw = b''
+    if len(raw) != 16 or not any(raw):
+        raw = os.urandom(16)
+
+    return raw.hex()
+
+
+class Span(object):
+    def __init__(self, tracer, name, parent_span_id=None, kind=SPAN_KIND_INTERNAL, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_span_id = parent_span_id
+        self.kind = kind
+        self.attributes = dict(attributes or {})
+        self.status_code = STATUS_CODE_OK
+        self.start_time_unix_nano = _time_unix_nano()
+        self.end_time_unix_nano = None
+
+    @property
+    def traceparent(self):
+        """W3C `traceparent` header value pointing at this span"""
+        return '00-{}-{}-01'.format(self.tracer.trace_id, self.span_id)
+
+    def end(self):
+        self.end_time_unix_nano = _time_unix_nano()
+        self.tracer.finished_spans.append(self)
+
+    def to_otlp(self):
+        otlp_span = {
+            'traceId': self.tracer.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_time_unix_nano),
+            'endTimeUnixNano': str(self.end_time_unix_nano),
+            'attributes': _to_otlp_attributes(self.attributes),
+            'status': {'code': self.status_code},
+        }
+        if self.parent_span_id:
+            otlp_span['parentSpanId'] = self.parent_span_id
+
+        return otlp_span
+
+
+class Tracer(object):
+    """Minimal tracer that keeps finished spans in memory until they are
+    exported as OTLP-JSON"""
+
+    def __init__(self, trace_id, resource_attributes=None):
+        self.trace_id = trace_id
+        self.resource_attributes = dict(resource_attributes or {})
+        self.finished_spans = []
+
+    @classmethod
+    def from_context(cls, context):
+        task_group_id = context.task.get('taskGroupId', '')
+        resource_attributes = {
+            'service.name': 'shipitscript',
+            'taskcluster.task_group_id': task_group_id,
+        }
+        # context.task_id is only known to the worker, which exports it to
+        # the task process. It writes "None" when it's unset
+        task_id = os.environ.get('TASK_ID') or getattr(context, 'task_id', None)
+        if task_id and task_id != 'None':
+            resource_attributes['taskcluster.task_id'] = task_id
+
+        return cls(trace_id_from_task_group_id(task_group_id), resource_attributes)
+
+    @contextlib.contextmanager
+    def start_span(self, name, kind=SPAN_KIND_INTERNAL, attributes=None):
+        """Context manager running its body within a new span, child of the
+        current one if it belongs to the same tracer"""
+        parent = current_span()
+        parent_span_id = parent.span_id if parent is not None and parent.tracer is self else None
+        span = Span(self, name, parent_span_id=parent_span_id, kind=kind, attributes=attributes)
+        previous_span = _set_current_span(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.status_code = STATUS_CODE_ERROR
+            span.attributes['exception.type'] = type(e).__name__
+            raise
+        finally:
+            _set_current_span(previous_span)
+            span.end()
+
+    def to_otlp(self):
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': _to_otlp_attributes(self.resource_attributes)},
+                'scopeSpans': [{
+                    'scope': {'name': 'shipitscript'},
+                    'spans': [span.to_otlp() for span in self.finished_spans],
+                }],
+            }],
+        }
+
+    def export(self, path):
+        """Function to write the finished spans into a local OTLP-JSON file"""
+        jsonutils.dump(self.to_otlp(), path)
+        log.info('Exported {} spans of trace {} to {}'.format(len(self.finished_spans), self.trace_id, path))
+
+
+def _to_otlp_attributes(attributes):
+    otlp_attributes = []
+    for key, value in sorted(attributes.items()):
+        if isinstance(value, bool):
+            otlp_value = {'boolValue': value}
+        elif isinstance(value, int):
+            otlp_value = {'intValue': str(value)}
+        elif isinstance(value, float):
+            otlp_value = {'doubleValue': value}
+        else:
+            otlp_value = {'stringValue': str(value)}
+        otlp_attributes.append({'key': key, 'value': otlp_value})
+
+    return otlp_attributes
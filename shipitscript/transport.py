@@ -0,0 +1,289 @@
+import certifi
+import gzip
+import logging
+import threading
+import time
+import zlib
+
+import requests
+from requests.adapters import DEFAULT_POOLBLOCK, HTTPAdapter
+from scriptworker.exceptions import ScriptWorkerTaskException
+
+from shipitscript import cassette, http2
+from shipitscript.cancellation import current_cancellation, get_cancellable_pool_classes
+from shipitscript.latency import AdaptiveTimeouts, get_request_operation, get_tracker
+from shipitscript.metrics import current_request_metrics, get_request_body_size, get_response_body_size
+from shipitscript.resolver import DEFAULT_DNS_CACHE_FILE, get_pool_classes_by_scheme
+from shipitscript.tracing import SPAN_KIND_CLIENT, STATUS_CODE_ERROR, current_span
+
+
+log = logging.getLogger(__name__)
+
+# Bodies smaller than this aren't worth the CPU time nor the extra header
+COMPRESSION_MIN_BODY_SIZE = 1024
+
+# COMPRESSORS {{{1
+COMPRESSORS = {
+    'gzip': gzip.compress,
+    'deflate': zlib.compress,
+}
+
+# Pool managers are shared by the sessions of every shipitapi object, so
+# that connections, including warmed up ones, are reused across clients
+_poolmanagers = {}
+_poolmanagers_lock = threading.Lock()
+
+
+class ShipItAdapter(HTTPAdapter):
+    """Transport adapter mounted on the `requests` session of every shipitapi
+    object. It is the single place where shipitscript hooks into the HTTP
+    calls made to Ship-it"""
+
+    def __init__(self, request_compression=None, http2=False, dns_cache_ttl=None, dns_cache_file=None,
+                 adaptive_timeouts=None, api_root=None, **kwargs):
+        # HTTPAdapter.__init__() calls init_poolmanager()
+        self.dns_cache_ttl = dns_cache_ttl
+        self.dns_cache_file = dns_cache_file
+        super().__init__(**kwargs)
+        self.request_compression = request_compression
+        self.http2 = http2
+        self.adaptive_timeouts = adaptive_timeouts
+        self.api_root = api_root.rstrip('/') if api_root else None
+
+    def init_poolmanager(self, connections, maxsize, block=DEFAULT_POOLBLOCK, **pool_kwargs):
+        key = (connections, maxsize, block, self.dns_cache_ttl, self.dns_cache_file, tuple(sorted(pool_kwargs.items())))
+        with _poolmanagers_lock:
+            if key in _poolmanagers:
+                # what HTTPAdapter.init_poolmanager() would set, minus a new PoolManager
+                self._pool_connections, self._pool_maxsize, self._pool_block = connections, maxsize, block
+            else:
+                super().init_poolmanager(connections, maxsize, block, **pool_kwargs)
+                if self.dns_cache_ttl is not None:
+                    self.poolmanager.pool_classes_by_scheme = get_pool_classes_by_scheme(
+                        self.dns_cache_ttl, self.dns_cache_file,
+                    )
+                self.poolmanager.pool_classes_by_scheme = get_cancellable_pool_classes(
+                    self.poolmanager.pool_classes_by_scheme
+                )
+                _poolmanagers[key] = self.poolmanager
+            self.poolmanager = _poolmanagers[key]
+
+    def close(self):
+        # the pool manager is shared with other sessions, clear_pools() closes it
+        for proxy in self.proxy_manager.values():
+            proxy.clear()
+
+    def send(self, request, **kwargs):
+        if self.request_compression:
+            compress_request_body(request, self.request_compression)
+
+        parent_span = current_span()
+        if parent_span is None:
+            return self._send(request, **kwargs)
+
+        attributes = {'http.method': request.method, 'http.url': request.url}
+        with parent_span.tracer.start_span('{} {}'.format(request.method, request.path_url),
+                                           kind=SPAN_KIND_CLIENT, attributes=attributes) as span:
+            request.headers['traceparent'] = span.traceparent
+            response = self._send(request, **kwargs)
+            span.attributes['http.status_code'] = response.status_code
+            if response.status_code >= 500:
+                span.status_code = STATUS_CODE_ERROR
+            return response
+
+    def get_operation(self, request):
+        return get_request_operation(request, self.api_root)
+
+    def _send(self, request, **kwargs):
+        recorder = cassette.current_recorder()
+        cancellation = current_cancellation()
+        metrics = current_request_metrics()
+        operation = self.get_operation(request)
+        if self.adaptive_timeouts is not None:
+            kwargs['timeout'] = self.adaptive_timeouts.get_timeout(operation, kwargs.get('timeout'))
+        timeout = kwargs.get('timeout')
+        if cancellation is not None:
+            cancellation.check()
+            kwargs['timeout'] = cancellation.get_timeout(timeout)
+
+        start = time.monotonic()
+        try:
+            # bodies are read in full over HTTP/2, streamed calls, which may
+            # stop reading early, go over HTTP/1.1
+            if self.http2 and not kwargs.get('stream'):
+                response = http2.send(request, timeout=kwargs.get('timeout'), verify=kwargs.get('verify', True))
+                response.connection = self
+            else:
+                response = super().send(request, **kwargs)
+            # the response headers are in, the body may not be
+            latency = time.monotonic() - start
+            if cancellation is not None and not kwargs.get('stream'):
+                # read the body here, so that aborting it isn't retried as a connection error
+                response.content
+        except OSError as e:
+            if metrics is not None:
+                metrics.record(operation, get_request_body_size(request), 0)
+            if cancellation is not None and cancellation.expired():
+                raise cancellation.get_exception() from e
+            if isinstance(e, requests.ReadTimeout) and self.adaptive_timeouts is not None:
+                # read timeouts count as slow samples, so that they get longer if Ship-it slows down
+                self.adaptive_timeouts.record(operation, timeout[1] if isinstance(timeout, tuple) else timeout)
+            raise
+
+        if self.adaptive_timeouts is not None and response.status_code < 500:
+            self.adaptive_timeouts.record(operation, latency)
+        if metrics is not None:
+            metrics.record(operation, get_request_body_size(request),
+                           get_response_body_size(response, stream=kwargs.get('stream', False)))
+        if recorder is not None:
+            recorder.record(request, response, start)
+        return response
+
+
+def compress_request_body(request, encoding):
+    """Function to compress in place the body of a prepared request. Streamed
+    bodies, small ones and already encoded ones are left untouched"""
+    if 'Content-Encoding' in request.headers:
+        return
+
+    body = request.body
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    if not isinstance(body, bytes) or len(body) < COMPRESSION_MIN_BODY_SIZE:
+        return
+
+    compressed_body = COMPRESSORS[encoding](body)
+    log.debug('Compressed request body with {} from {} to {} bytes'.format(encoding, len(body), len(compressed_body)))
+    request.body = compressed_body
+    request.headers['Content-Encoding'] = encoding
+    request.headers['Content-Length'] = str(len(compressed_body))
+
+
+def get_adapter_kwargs(ship_it_instance_config):
+    """Function to translate the instance config into ShipItAdapter kwargs"""
+    request_compression = ship_it_instance_config.get('request_compression')
+    if request_compression is not None and request_compression not in COMPRESSORS:
+        raise ScriptWorkerTaskException(
+            'Unsupported request_compression "{}". Valid ones: {}'.format(request_compression, sorted(COMPRESSORS))
+        )
+
+    http2_requested = bool(ship_it_instance_config.get('http2', False))
+    if http2_requested and not http2.HTTP2_AVAILABLE:
+        log.warning('HTTP/2 was requested but httpx or h2 is not installed. Falling back to HTTP/1.1')
+
+    dns_cache_ttl = ship_it_instance_config.get('dns_cache_ttl_in_seconds')
+
+    return dict(
+        request_compression=request_compression,
+        http2=http2_requested and http2.HTTP2_AVAILABLE,
+        dns_cache_ttl=None if dns_cache_ttl is None else float(dns_cache_ttl),
+        dns_cache_file=None if dns_cache_ttl is None else ship_it_instance_config.get('dns_cache_file', DEFAULT_DNS_CACHE_FILE),
+        adaptive_timeouts=get_adaptive_timeouts(ship_it_instance_config),
+        api_root=ship_it_instance_config.get('api_root'),
+    )
+
+
+def get_adaptive_timeouts(ship_it_instance_config):
+    """Function to translate the `adaptive_timeouts` instance config into an
+    AdaptiveTimeouts object, None if they're off"""
+    adaptive_timeouts_config = ship_it_instance_config.get('adaptive_timeouts')
+    if not adaptive_timeouts_config:
+        return None
+
+    kwargs = {}
+    for key, config_key, type_ in (
+        ('percentile', 'percentile', float),
+        ('multiplier', 'multiplier', float),
+        ('min_timeout', 'min_timeout_in_seconds', float),
+        ('max_timeout', 'max_timeout_in_seconds', float),
+        ('min_samples', 'min_samples', int),
+    ):
+        if config_key in adaptive_timeouts_config:
+            kwargs[key] = type_(adaptive_timeouts_config[config_key])
+
+    if not 0 < kwargs.get('percentile', 50) <= 100:
+        raise ScriptWorkerTaskException('adaptive_timeouts percentile must be within ]0, 100]')
+
+    return AdaptiveTimeouts(
+        get_tracker(adaptive_timeouts_config['histogram_file']), ship_it_instance_config['api_root'], **kwargs
+    )
+
+
+def configure_session(session, ship_it_instance_config):
+    """Function to mount the ShipItAdapter on a `requests` session. Responses
+    are already transparently decompressed by `requests` as long as the
+    server honors the default `Accept-Encoding: gzip, deflate`"""
+    adapter = ShipItAdapter(**get_adapter_kwargs(ship_it_instance_config))
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers['Accept-Encoding'] = 'gzip, deflate'
+
+    return session
+
+
+def configure_api(api, ship_it_instance_config):
+    """Function to mount the ShipItAdapter on the session of a shipitapi
+    object"""
+    configure_session(api.session, ship_it_instance_config)
+    return api
+
+
+def clear_pools():
+    """Function to close every pooled connection, HTTP/2 ones included, and
+    forget the shared pool managers"""
+    with _poolmanagers_lock:
+        for poolmanager in _poolmanagers.values():
+            poolmanager.clear()
+        _poolmanagers.clear()
+    http2.close_clients()
+
+
+def get_connection_pool(adapter, url, verify):
+    """Function to grab the urllib3 pool `adapter` would send a request to
+    `url` through"""
+    if hasattr(adapter, 'get_connection_with_tls_context'):
+        return adapter.get_connection_with_tls_context(requests.Request('HEAD', url).prepare(), verify)
+
+    # requests < 2.32
+    pool = adapter.get_connection(url)
+    adapter.cert_verify(pool, url, verify, None)
+    return pool
+
+
+def warm_up(ship_it_instance_config, verify=certifi.where()):
+    """Function to open a connection to the instance's `api_root` and to
+    leave it in the shared pool, so that the first Ship-it call doesn't pay
+    for DNS resolution, TCP and TLS handshakes. `verify` must match the
+    `ca_certs` given to shipitapi objects. Connecting gives up after
+    `timeout_in_seconds`, or at the deadline of the task. Errors are only
+    logged, the actual calls will surface them if need be"""
+    api_root = ship_it_instance_config['api_root']
+    adapter = ShipItAdapter(**get_adapter_kwargs(ship_it_instance_config))
+    if adapter.http2:
+        log.debug('Connections of the HTTP/2 transport are not warmed up')
+        return False
+
+    timeout = float(ship_it_instance_config.get('timeout_in_seconds', 60))
+    cancellation = current_cancellation()
+    if cancellation is not None:
+        timeout = cancellation.get_timeout(timeout)
+
+    start = time.monotonic()
+    try:
+        pool = get_connection_pool(adapter, api_root, verify)
+        connection = pool._get_conn()
+        # pools have no timeout of their own, urllib3 would wait for the OS one
+        connection.timeout = timeout
+        try:
+            connection.connect()
+        except BaseException:
+            connection.close()
+            raise
+        finally:
+            pool._put_conn(connection)
+    except Exception as e:
+        log.warning('Could not warm up a connection to {}: {}'.format(api_root, e))
+        return False
+
+    log.info('Warmed up a connection to {} in {:.3f}s'.format(api_root, time.monotonic() - start))
+    return True
@@ -1,43 +1,313 @@
 import arrow
+import concurrent.futures
+import functools
 import logging
+import threading
+import time
 
+import requests
+from redo import retry
 from scriptworker.exceptions import ScriptWorkerTaskException
 
+from shipitscript import jsonutils
+from shipitscript.auth import DEFAULT_SESSION_CACHE_DIR, SessionAuth
+from shipitscript.cancellation import CallCancellation, cancellation_scope, current_cancellation
+from shipitscript.jsonutils import extract_keys
+from shipitscript.latency import DEFAULT_MIN_SAMPLES, get_tracker
+from shipitscript.release_cache import get_release_cache
+from shipitscript.tracing import bind_current_span
+from shipitscript.transport import configure_api, configure_session
+
 
 log = logging.getLogger(__name__)
 
+RELEASE_CHUNK_SIZE = 4096
+RELEASE_LIST_PAGE_SIZE = 100
+
 
 def get_auth_primitives(ship_it_instance_config):
-    """Function to grab the primitives needed for shipitapi objects auth"""
-    auth = (ship_it_instance_config['username'], ship_it_instance_config['password'])
+    """Function to grab the primitives needed for shipitapi objects auth.
+    Instances with a `login_path` get a session reused across requests and
+    processes instead of basic auth on every request. Logins go through the
+    ShipItAdapter too"""
     api_root = ship_it_instance_config['api_root']
     timeout_in_seconds = int(ship_it_instance_config.get('timeout_in_seconds', 60))
+    if ship_it_instance_config.get('login_path'):
+        auth = SessionAuth(
+            ship_it_instance_config['username'], ship_it_instance_config['password'], api_root,
+            ship_it_instance_config['login_path'],
+            cache_dir=ship_it_instance_config.get('session_cache_dir', DEFAULT_SESSION_CACHE_DIR),
+            timeout=timeout_in_seconds,
+            session=configure_session(requests.Session(), ship_it_instance_config),
+        )
+    else:
+        auth = (ship_it_instance_config['username'], ship_it_instance_config['password'])
 
     return (auth, api_root, timeout_in_seconds)
 
 
-def check_release_has_values(release_api, release_name, **kwargs):
+def clone_api(api, ship_it_instance_config):
+    """Function to create a shipitapi object similar to `api` but with its
+    own session, hence its own connections"""
+    cloned_api = api.__class__(api.auth, api_root=api.api_root, timeout=api.timeout)
+    return configure_api(cloned_api, ship_it_instance_config)
+
+
+def get_release(release_api, release_name):
+    """Function to grab a release like `shipitapi.Release.getRelease()`
+    does, but decoded by the jsonutils backend"""
+    response = release_api.request(url_template_vars={'name': release_name})
+    return jsonutils.loads(response.content)
+
+
+def get_existing_release(release_api, release_name):
+    """Function to grab a release like `get_release()` does, or None right
+    away if Ship-it doesn't know it. shipitapi would retry the 404 like any
+    other HTTPError"""
+    url = release_api.api_root + release_api.url_template % {'name': release_name}
+
+    def _get_existing_release():
+        response = release_api.session.get(
+            url, auth=release_api.auth, verify=release_api.verify, timeout=release_api.timeout,
+        )
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return jsonutils.loads(response.content)
+
+    return retry(_get_existing_release, sleeptime=5, max_sleeptime=15,
+                 retry_exceptions=(requests.HTTPError, requests.ConnectionError),
+                 attempts=release_api.retries)
+
+
+def get_release_values(release_api, release_name, keys):
+    """Function to grab only `keys` of a release. The response is streamed
+    and parsed incrementally, and reading stops once every key is found, so
+    that big fields like `l10nChangesets` are neither downloaded in full nor
+    decoded. Retries mimic the ones of `shipitapi.Release.getRelease()`"""
+    url = release_api.api_root + release_api.url_template % {'name': release_name}
+
+    def _get_release_values():
+        response = release_api.session.get(
+            url, auth=release_api.auth, verify=release_api.verify,
+            timeout=release_api.timeout, stream=True,
+        )
+        try:
+            response.raise_for_status()
+            return extract_keys(response.iter_content(chunk_size=RELEASE_CHUNK_SIZE), keys)
+        finally:
+            response.close()
+
+    return retry(_get_release_values, sleeptime=5, max_sleeptime=15,
+                 retry_exceptions=(requests.HTTPError, requests.ConnectionError),
+                 attempts=release_api.retries)
+
+
+def is_release_list_page(page, page_number):
+    """Function to tell whether `page` looks like page `page_number` of the
+    `/releases` list call: `{'releases': [records with a 'name'],
+    'next_page': a later page number or None}`"""
+    if not isinstance(page, dict) or not isinstance(page.get('releases'), list) or 'next_page' not in page:
+        return False
+    if not all(isinstance(release, dict) and isinstance(release.get('name'), str) for release in page['releases']):
+        return False
+    next_page = page['next_page']
+    return next_page is None or (type(next_page) is int and next_page > page_number)
+
+
+def list_releases(release_api, release_names, page_size=RELEASE_LIST_PAGE_SIZE):
+    """Function to grab many releases at once through the paginated
+    `/releases` list call, filtered by name. Returns the release records per
+    name, releases unknown to Ship-it are absent. Returns None if the
+    instance doesn't provide the list call, or answers it with something
+    else than release records"""
+    url = release_api.api_root + '/releases'
+    params = {'names': ','.join(release_names), 'per_page': page_size, 'page': 1}
+
+    def _list_releases_page():
+        response = release_api.session.get(
+            url, params=params, auth=release_api.auth, verify=release_api.verify, timeout=release_api.timeout,
+        )
+        if response.status_code in (404, 405):
+            return None
+        response.raise_for_status()
+        try:
+            page = jsonutils.loads(response.content)
+        except ValueError:
+            page = None
+        if not is_release_list_page(page, params['page']):
+            log.warning('{} answered the release list call with an unexpected payload'.format(url))
+            return None
+        return page
+
+    wanted_release_names = set(release_names)
+    releases = {}
+    while True:
+        page = retry(_list_releases_page, sleeptime=5, max_sleeptime=15,
+                     retry_exceptions=(requests.HTTPError, requests.ConnectionError),
+                     attempts=release_api.retries)
+        if page is None:
+            return None
+        releases.update((release['name'], release) for release in page['releases'] if release['name'] in wanted_release_names)
+        if page['next_page'] is None:
+            return releases
+        params['page'] = page['next_page']
+
+
+def get_release_info(release_api, release_name, ship_it_instance_config=None, keys=None):
+    """Function to grab the release information from the host-wide release
+    cache or else from Ship-it, only `keys` of it if the instance is
+    configured to parse it incrementally, hedging the read if the instance
+    is configured to"""
+    ship_it_instance_config = ship_it_instance_config or {}
+    release_cache = get_release_cache(ship_it_instance_config)
+    if release_cache is not None:
+        release_info = release_cache.get(release_name, keys)
+        if release_info is not None:
+            log.info('Got {} from the release cache'.format(release_name))
+            return release_info
+
+    fetched_at = time.time()
+    incremental = keys is not None and bool(ship_it_instance_config.get('incremental_release_parsing'))
+    if incremental:
+        fetch = functools.partial(get_release_values, keys=keys)
+    else:
+        fetch = get_release
+
+    hedge_delay_in_seconds = get_hedge_delay(ship_it_instance_config)
+    if hedge_delay_in_seconds is None:
+        release_info = fetch(release_api, release_name)
+    else:
+        release_info = hedged_get_release(
+            release_api, functools.partial(clone_api, release_api, ship_it_instance_config),
+            release_name, hedge_delay_in_seconds, fetch=fetch,
+        )
+
+    if release_cache is not None:
+        release_cache.put(release_name, release_info, fetched_at, complete=not incremental)
+    return release_info
+
+
+def get_hedge_delay(ship_it_instance_config):
+    """Function to grab the delay after which getRelease gets hedged: the
+    `hedge_percentile` of the getRelease latencies in the `adaptive_timeouts`
+    histogram file, or the fixed `hedge_delay_in_seconds` while there are
+    fewer than `min_samples` of them. None if hedging is off"""
+    hedge_delay_in_seconds = ship_it_instance_config.get('hedge_delay_in_seconds')
+    hedge_delay_in_seconds = None if hedge_delay_in_seconds is None else float(hedge_delay_in_seconds)
+    hedge_percentile = ship_it_instance_config.get('hedge_percentile')
+    adaptive_timeouts_config = ship_it_instance_config.get('adaptive_timeouts')
+    if hedge_percentile is None or not adaptive_timeouts_config:
+        return hedge_delay_in_seconds
+
+    hedge_percentile = float(hedge_percentile)
+    if not 0 < hedge_percentile <= 100:
+        raise ScriptWorkerTaskException('hedge_percentile must be within ]0, 100]')
+
+    histogram = get_tracker(adaptive_timeouts_config['histogram_file']).get_histogram(
+        ship_it_instance_config['api_root'].rstrip('/'), 'getRelease'
+    )
+    if histogram.total < int(adaptive_timeouts_config.get('min_samples', DEFAULT_MIN_SAMPLES)):
+        return hedge_delay_in_seconds
+    latency = histogram.percentile(hedge_percentile)
+    return hedge_delay_in_seconds if latency is None else latency
+
+
+def _start_call(fetch, api, release_name, cancellation):
+    """Function to run `fetch` on a daemon thread, within `cancellation`, so
+    that a hung call can neither hold the caller nor the process exit"""
+    future = concurrent.futures.Future()
+    call = bind_current_span(fetch)
+
+    def run():
+        with cancellation_scope(cancellation):
+            try:
+                future.set_result(call(api, release_name))
+            except BaseException as e:
+                future.set_exception(e)
+
+    threading.Thread(target=run, name='shipitscript-hedged-call', daemon=True).start()
+    return future
+
+
+def hedged_get_release(release_api, hedge_api_factory, release_name, hedge_delay_in_seconds, fetch=get_release):
+    """Function to call `fetch` and, if it hasn't answered after
+    `hedge_delay_in_seconds`, to fire the same call from a second client.
+    The first successful answer wins and the other call is cancelled: its
+    sockets are shut down and it isn't retried. This is only safe because
+    reads are idempotent"""
+    task_cancellation = current_cancellation()
+    cancellations = {}
+
+    def start_call(api):
+        cancellation = CallCancellation(parent=task_cancellation)
+        cancellations[_start_call(fetch, api, release_name, cancellation)] = cancellation
+
+    start_call(release_api)
+    winner = None
+    try:
+        done, _ = concurrent.futures.wait(cancellations, timeout=hedge_delay_in_seconds)
+        if not done:
+            log.info('getRelease did not answer within {}s, hedging it'.format(hedge_delay_in_seconds))
+            start_call(hedge_api_factory())
+
+        pending = set(cancellations)
+        while winner is None:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            successful = [future for future in done if future.exception() is None]
+            if successful:
+                winner = successful[0]
+            elif not pending:
+                # every call failed, surface one of the errors
+                winner = done.pop()
+            else:
+                log.warning('One of the hedged getRelease calls failed, waiting for the other one')
+
+        return winner.result()
+    finally:
+        for future, cancellation in cancellations.items():
+            if future is not winner:
+                cancellation.cancel('hedged getRelease lost')
+
+
+def check_release_has_values(release_api, release_name, ship_it_instance_config=None, **kwargs):
     """Function to make an API call to Ship-it v1 to grab release information
     and validate that fields that had just been updated are correctly reflected
     in the API returns"""
     # comprehensive dict with release details {'status': 'Started',
     # 'shippedAt': '...', 'branch': '...'}
-    release_info = release_api.getRelease(release_name)
+    release_info = get_release_info(release_api, release_name, ship_it_instance_config, keys=kwargs.keys())
     log.info("Full release details: {}".format(release_info))
 
     for key, value in kwargs.items():
-        # special case for comparing times
-        if key == 'shippedAt':
-            if not release_info.get(key) or not same_timing(release_info[key], value):
-                err_msg = "`{}`->`{}` don't exist or correspond.".format(key, value)
-                raise ScriptWorkerTaskException(err_msg)
-        elif not release_info.get(key) or release_info[key] != value:
+        if not has_value(release_info, key, value):
             err_msg = "`{}`->`{}` don't exist or correspond.".format(key, value)
             raise ScriptWorkerTaskException(err_msg)
 
     log.info("All release fields have been correctly updated in Ship-it!")
 
 
+def has_value(release_info, key, value):
+    """Function to tell whether `key` of `release_info` exists and corresponds
+    to `value`"""
+    if not release_info.get(key):
+        return False
+    # special case for comparing times
+    if key == 'shippedAt':
+        return same_timing(release_info[key], value)
+    return release_info[key] == value
+
+
+def get_mismatches(release_info, values):
+    """Function to grab the `values` that `release_info` doesn't reflect,
+    along with the actual ones"""
+    return {
+        key: {'expected': value, 'actual': release_info.get(key)}
+        for key, value in values.items()
+        if not has_value(release_info, key, value)
+    }
+
+
 def same_timing(time1, time2):
     """Function to decompress time from strings into datetime objects and
     compare them"""